@@ -1,26 +1,39 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify
 from flask_cors import CORS
-from bson import ObjectId
-from datetime import datetime, timedelta
-import jwt
 import os
-from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
-import bcrypt
-from extensions import mongo
+from extensions import mongo, mongo_client_options
+from mongo_monitoring import CommandLatencyListener
+from metrics import metrics
+from request_metrics import request_metrics
+from ratelimit import rate_limiter
+from authentication import auth_cache, token_required, admin_token_usable, ADMIN_TOKEN_MIN_LENGTH
+from commands import register_commands
+from passwords import password_hasher
+from json_provider import MongoJSONProvider
+from suggest import suggest_index
+from schema import ensure_schema
+from counters import counter_buffer
+from members import member_reconciler
+from images import image_store
+from events import event_bus
 
 # Import blueprints
 from routes.auth import auth_bp
 from routes.posts import posts_bp
 from routes.users import users_bp
 from routes.locations import locations_bp
+from routes.search import search_bp
+from routes.uploads import uploads_bp
+from routes.stream import stream_bp
+from routes.admin import admin_bp
 
 # Load environment variables
 load_dotenv()
 
 def create_app():
     app = Flask(__name__)
+    app.json = MongoJSONProvider(app)
     
     # Configure CORS
     CORS(app, resources={
@@ -37,61 +50,146 @@ def create_app():
     app.config['JWT_SECRET'] = os.getenv('JWT_SECRET', 'your-secret-key-here')
     app.config['UPLOAD_FOLDER'] = 'uploads'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
+    app.config['IMAGE_SIZES'] = {'thumb': 160, 'small': 640, 'large': 1600}  # longest edge in px
+    app.config['IMAGE_QUALITY'] = int(os.getenv('IMAGE_QUALITY', 82))
+    app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', 1))  # resize processes per worker
+    app.config['IMAGE_MAX_FILES'] = int(os.getenv('IMAGE_MAX_FILES', 10))  # per upload request
+    app.config['AUTH_CACHE_SIZE'] = int(os.getenv('AUTH_CACHE_SIZE', 10000))
+    app.config['AUTH_CACHE_TTL'] = int(os.getenv('AUTH_CACHE_TTL', 60))  # seconds
+    # Authors above this many followers are merged into timelines on read
+    app.config['TIMELINE_FANOUT_LIMIT'] = int(os.getenv('TIMELINE_FANOUT_LIMIT', 5000))
+    app.config['TIMELINE_BACKFILL'] = int(os.getenv('TIMELINE_BACKFILL', 50))
+    app.config['COMMENT_PREVIEW_COUNT'] = int(os.getenv('COMMENT_PREVIEW_COUNT', 3))
+    app.config['DIRECTORY_CACHE_TTL'] = int(os.getenv('DIRECTORY_CACHE_TTL', 300))  # seconds
+    app.config['LOCATION_FEED_CACHE_TTL'] = float(os.getenv('LOCATION_FEED_CACHE_TTL', 5))  # seconds
+    # Home timeline pages, shared by repeated reads; 0 still coalesces concurrent ones
+    app.config['TIMELINE_CACHE_TTL'] = float(os.getenv('TIMELINE_CACHE_TTL', 2))  # seconds
+    app.config['SUGGEST_INDEX_TTL'] = int(os.getenv('SUGGEST_INDEX_TTL', 300))  # seconds
+    app.config['NEARBY_POST_MAX_AGE'] = int(os.getenv('NEARBY_POST_MAX_AGE', 7 * 24 * 3600))  # seconds
+    
+    # Like, comment and member counters are buffered and written in batches
+    app.config['COUNTER_FLUSH_INTERVAL'] = float(os.getenv('COUNTER_FLUSH_INTERVAL', 1.0))  # seconds, 0 writes through
+    app.config['COUNTER_FLUSH_SIZE'] = int(os.getenv('COUNTER_FLUSH_SIZE', 1000))  # pending documents
+    app.config['MEMBER_RECONCILE_INTERVAL'] = int(os.getenv('MEMBER_RECONCILE_INTERVAL', 0))  # seconds, 0 disables
+
+    # Server-sent events; use 'mongo' when running more than one worker
+    app.config['EVENT_BUS_BACKEND'] = os.getenv('EVENT_BUS_BACKEND', 'local')
+    app.config['EVENT_QUEUE_SIZE'] = int(os.getenv('EVENT_QUEUE_SIZE', 100))  # events a stream may fall behind
+    app.config['STREAM_KEEPALIVE'] = int(os.getenv('STREAM_KEEPALIVE', 15))  # seconds
+    app.config['STREAM_TICKET_TTL'] = int(os.getenv('STREAM_TICKET_TTL', 30))  # seconds
+
+    # Admin API (bulk exports); disabled unless a token is set
+    app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN', '')
+    app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 1000))  # documents per query
+    if app.config['ADMIN_TOKEN'] and not admin_token_usable(app.config['ADMIN_TOKEN']):
+        app.logger.warning(
+            'ADMIN_TOKEN is shorter than %d characters or starts with #; the admin API stays disabled',
+            ADMIN_TOKEN_MIN_LENGTH
+        )
+
+    # Token buckets per endpoint or blueprint; 'N/period' allows bursts of N.
+    # Use 'mongo' or 'redis' storage to share the limits between workers.
+    app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', 0))  # proxy hops setting X-Forwarded-For
+    app.config['RATE_LIMIT_STORAGE'] = os.getenv('RATE_LIMIT_STORAGE', 'memory')  # memory, mongo or redis
+    app.config['RATE_LIMIT_REDIS_URL'] = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['RATE_LIMITS'] = {
+        'auth.register': {'ip': os.getenv('RATE_LIMIT_REGISTER', '5/minute')},
+        'auth.login': {'ip': os.getenv('RATE_LIMIT_LOGIN', '10/minute')},
+        'posts.create_post': {'user': os.getenv('RATE_LIMIT_POST', '30/minute')},
+        'posts.like_post': {'user': os.getenv('RATE_LIMIT_LIKE', '120/minute')},
+        'posts.create_comment': {'user': os.getenv('RATE_LIMIT_COMMENT', '60/minute')},
+        'users.follow_user': {'user': os.getenv('RATE_LIMIT_FOLLOW', '60/minute')},
+        'uploads.upload_images': {'user': os.getenv('RATE_LIMIT_UPLOAD', '30/minute')}
+    }
+
+    # bcrypt runs on its own bounded pool ('thread' or 'process')
+    app.config['BCRYPT_ROUNDS'] = int(os.getenv('BCRYPT_ROUNDS', 12))
+    app.config['BCRYPT_EXECUTOR'] = os.getenv('BCRYPT_EXECUTOR', 'thread')
+    app.config['BCRYPT_WORKERS'] = int(os.getenv('BCRYPT_WORKERS', os.cpu_count() or 1))
+    app.config['BCRYPT_MAX_PENDING'] = int(os.getenv('BCRYPT_MAX_PENDING', app.config['BCRYPT_WORKERS'] * 4))
+    app.config['BCRYPT_TIMEOUT'] = float(os.getenv('BCRYPT_TIMEOUT', 10))  # seconds
+
+    # Mongo client; the pool is sized by gunicorn.conf.py to match the
+    # worker's concurrency. Unset options keep PyMongo's defaults.
+    app.config['MONGO_MAX_POOL_SIZE'] = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+    app.config['MONGO_MIN_POOL_SIZE'] = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    app.config['MONGO_MAX_IDLE_TIME_MS'] = os.getenv('MONGO_MAX_IDLE_TIME_MS')
+    app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'] = os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+    app.config['MONGO_CONNECT_TIMEOUT_MS'] = os.getenv('MONGO_CONNECT_TIMEOUT_MS')
+    app.config['MONGO_SOCKET_TIMEOUT_MS'] = os.getenv('MONGO_SOCKET_TIMEOUT_MS')
+    app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'] = os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS')
+    app.config['MONGO_READ_PREFERENCE'] = os.getenv('MONGO_READ_PREFERENCE')  # e.g. secondaryPreferred
+    app.config['MONGO_COMPRESSORS'] = os.getenv('MONGO_COMPRESSORS')  # e.g. zstd,zlib
+    app.config['MONGO_SLOW_QUERY_MS'] = float(os.getenv('MONGO_SLOW_QUERY_MS', 100))
+
+    # Check the index schema version at startup; `flask apply-indexes` does
+    # the same on demand
+    app.config['SCHEMA_AUTO_APPLY'] = os.getenv('SCHEMA_AUTO_APPLY', 'true').lower() == 'true'
 
     # Initialize extensions
-    mongo.init_app(app)
+    mongo.init_app(
+        app,
+        event_listeners=[CommandLatencyListener(app.config['MONGO_SLOW_QUERY_MS'])],
+        **mongo_client_options(app.config)
+    )
+    auth_cache.init_app(app)
+    password_hasher.init_app(app)
+    suggest_index.init_app(app)
+    request_metrics.init_app(app)
+    rate_limiter.init_app(app)
+    counter_buffer.init_app(app)
+    member_reconciler.init_app(app)
+    image_store.init_app(app)
+    event_bus.init_app(app)
 
-    # JWT decorator
-    def token_required(f):
-        @wraps(f)
-        def decorated(*args, **kwargs):
-            token = None
-            
-            # Check if token is in the headers
-            if 'x-access-token' in request.headers:
-                token = request.headers['x-access-token']
-                
-            if not token:
-                return jsonify({'message': 'Token is missing!'}), 401
-                
-            try:
-                data = jwt.decode(token, app.config['JWT_SECRET'], algorithms=["HS256"])
-                current_user = mongo.db.users.find_one({'_id': ObjectId(data['user_id'])})
-                if not current_user:
-                    return jsonify({'message': 'User not found!'}), 401
-            except Exception as e:
-                return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
-                
-            return f(current_user, *args, **kwargs)
-        return decorated
-    
     # Make token_required available to blueprints
     app.token_required = token_required
     
-    # Import blueprints
-    from routes.auth import auth_bp
-    from routes.posts import posts_bp
-    from routes.users import users_bp
-    
     # Register blueprints with proper URL prefixes
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(posts_bp, url_prefix='/api/posts')
     app.register_blueprint(users_bp, url_prefix='/api/users')
+    app.register_blueprint(search_bp, url_prefix='/api/search')
+    app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
+    app.register_blueprint(stream_bp, url_prefix='/api/stream')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
     # Locations blueprint already has /api prefix in its routes
     app.register_blueprint(locations_bp)
     
-    # Create indexes
-    with app.app_context():
-        # Create a unique index on city names (case-insensitive)
-        mongo.db.cities.create_index('name_lower', unique=True)
-        # Create an index on neighborhoods.id for faster lookups
-        mongo.db.cities.create_index('neighborhoods.id')
+    # Create indexes if the stored schema version is behind
+    if app.config['SCHEMA_AUTO_APPLY']:
+        with app.app_context():
+            ensure_schema(mongo.db)
+    
+    register_commands(app)
     
     # Health check route
     @app.route('/api/health', methods=['GET'])
     def health_check():
         return jsonify({'status': 'healthy'}), 200
     
+    # Prometheus scrape endpoint; metrics are per worker process
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+    
+    metrics.collect(
+        'auth_cache_lookups_total',
+        'Auth cache lookups by result',
+        lambda: [
+            ({'cache': cache, 'result': result}, stats[result])
+            for cache, stats in auth_cache.stats().items()
+            for result in ('hits', 'misses')
+        ],
+        kind='counter'
+    )
+    metrics.collect(
+        'auth_cache_entries',
+        'Entries currently held by the auth cache',
+        lambda: [({'cache': cache}, stats['size']) for cache, stats in auth_cache.stats().items()]
+    )
+    
     # Create uploads directory if it doesn't exist
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -0,0 +1,132 @@
+from functools import wraps
+import hmac
+import time
+from flask import request, jsonify, current_app, g
+from bson import ObjectId
+import jwt
+from extensions import mongo
+from cache import TTLCache
+
+# Shorter admin tokens are treated as unset
+ADMIN_TOKEN_MIN_LENGTH = 16
+
+# Fields never loaded into the cached user document; the follower arrays
+# are only present on accounts not yet moved to the follows collection
+USER_PROJECTION = {'password': 0, 'followers': 0, 'following': 0}
+
+
+class AuthCache:
+    """Caches decoded JWTs and projected user documents.
+
+    Each worker process keeps its own cache, so writes made by another worker
+    only become visible here once the entry's TTL runs out. Routes that change
+    a user document call `invalidate_user` so the local copy is dropped
+    immediately.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.tokens = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.users = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def init_app(self, app):
+        maxsize = app.config.get('AUTH_CACHE_SIZE', 10000)
+        ttl = app.config.get('AUTH_CACHE_TTL', 60)
+        self.tokens = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.users = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def decode_token(self, token):
+        """Return the user id carried by `token`, verifying it on a cache miss"""
+        user_id = self.tokens.get(token)
+        if user_id is not None:
+            return user_id
+
+        data = jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=["HS256"])
+        user_id = data['user_id']
+
+        # Never keep a token around past its own expiry
+        ttl = self.tokens.ttl
+        if 'exp' in data:
+            ttl = min(ttl, data['exp'] - time.time())
+        if ttl > 0:
+            self.tokens.set(token, user_id, ttl=ttl)
+        return user_id
+
+    def get_user(self, user_id):
+        """Return the projected user document for `user_id`, or None"""
+        key = str(user_id)
+        user = self.users.get(key)
+        if user is None:
+            user = mongo.db.users.find_one({'_id': ObjectId(key)}, USER_PROJECTION)
+            if user is None:
+                return None
+            self.users.set(key, user)
+        # Hand out a copy so callers can't mutate the cached document
+        return dict(user)
+
+    def invalidate_user(self, *user_ids):
+        for user_id in user_ids:
+            self.users.pop(str(user_id))
+
+    def clear(self):
+        self.tokens.clear()
+        self.users.clear()
+
+    def stats(self):
+        return {
+            'tokens': self.tokens.stats(),
+            'users': self.users.stats()
+        }
+
+
+auth_cache = AuthCache()
+
+
+def invalidate_user(*user_ids):
+    """Drop cached copies of the given users after their document changed"""
+    auth_cache.invalidate_user(*user_ids)
+
+
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = None
+
+        # Check if token is in the headers
+        if 'x-access-token' in request.headers:
+            token = request.headers['x-access-token']
+
+        if not token:
+            return jsonify({'message': 'Token is missing!'}), 401
+
+        try:
+            user_id = auth_cache.decode_token(token)
+            current_user = auth_cache.get_user(user_id)
+            if not current_user:
+                return jsonify({'message': 'User not found!'}), 401
+            g.current_user = current_user
+        except Exception as e:
+            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
+
+        return f(current_user, *args, **kwargs)
+    return decorated
+
+
+def admin_token_usable(token):
+    """Reject unset, short or comment-looking admin tokens (e.g. a misparsed .env line)"""
+    return bool(token) and len(token) >= ADMIN_TOKEN_MIN_LENGTH and not token.startswith('#')
+
+
+def admin_required(f):
+    """Allow only requests whose X-Admin-Token matches ADMIN_TOKEN; off when unset or unusable"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        expected = current_app.config.get('ADMIN_TOKEN')
+        if not admin_token_usable(expected):
+            return jsonify({'message': 'Admin API is disabled'}), 404
+
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8')):
+            return jsonify({'message': 'Admin token is invalid!'}), 401
+
+        return f(*args, **kwargs)
+    return decorated
@@ -0,0 +1,402 @@
+"""Benchmark the API hot paths through the Flask test client.
+
+Seeds a synthetic dataset (cities, neighborhoods, users, a random follow
+graph and posts), then times login, the home feed, likes, follows and the
+location endpoints in-process. Prints one JSON document with ops/sec,
+p50/p99 latency and Mongo calls per request for every scenario, so runs on
+different commits can be diffed.
+
+Without --mongo-uri it runs on mongomock (pip install -r requirements-dev.txt),
+which is only good for comparing Mongo call counts and Python-side overhead;
+use a local mongod for timings:
+
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --mongo-uri mongodb://localhost:27017/eyes_bench \\
+        --users 5000 --posts 100000 --requests 1000 > before.json
+
+The target database is dropped and reseeded, so its name must contain "bench".
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bson import ObjectId
+import jwt
+
+PASSWORD = 'bench-password'
+
+# Collection methods counted as one round trip each under mongomock
+MONGOMOCK_CALLS = (
+    'find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many',
+    'delete_one', 'delete_many', 'find_one_and_update', 'aggregate', 'bulk_write',
+    'count_documents', 'distinct'
+)
+
+
+def use_mongomock():
+    """Swap Flask-PyMongo's client for mongomock before the app is imported"""
+    import flask_pymongo
+    import mongomock
+    from mongomock import collection
+    from mongo_monitoring import request_commands
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+    from mongomock_compat import patch_mongomock
+    patch_mongomock()
+
+    # mongomock sends no command events, so count top-level collection calls
+    # (find_one calling find internally is still one call)
+    local = threading.local()
+
+    def counted(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            counter = request_commands.get()
+            outermost = not getattr(local, 'active', False)
+            if counter is not None and outermost:
+                counter[0] += 1
+            local.active = True
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if outermost:
+                    local.active = False
+        return wrapper
+
+    for name in MONGOMOCK_CALLS:
+        setattr(collection.Collection, name, counted(getattr(collection.Collection, name)))
+    flask_pymongo.MongoClient = mongomock.MongoClient
+
+
+def load_app(args):
+    os.environ['MONGO_URI'] = args.mongo_uri or 'mongodb://localhost:27017/eyes_bench'
+    os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    os.environ['SCHEMA_AUTO_APPLY'] = 'false'
+    # Every simulated client shares one IP; measure the handlers, not the limiter
+    os.environ['RATE_LIMIT_ENABLED'] = 'false'
+    if not args.mongo_uri:
+        use_mongomock()
+    import app as app_module
+    return app_module.app
+
+
+def random_point(rng, lat, lng, spread):
+    return {
+        'type': 'Point',
+        'coordinates': [lng + rng.uniform(-spread, spread), lat + rng.uniform(-spread, spread)]
+    }
+
+
+def seed(app, args, rng):
+    """Drop the benchmark database and fill it; returns ids the scenarios pick from"""
+    from extensions import mongo
+    from feed import _timeline_entry
+    from passwords import password_hasher
+    from schema import apply_indexes
+
+    db = mongo.db
+    if 'bench' not in db.name:
+        raise SystemExit(f'Refusing to drop "{db.name}": use a database whose name contains "bench"')
+    db.client.drop_database(db.name)
+
+    now = datetime.utcnow()
+    cities, neighborhoods = [], []
+    for c in range(args.cities):
+        lat, lng = rng.uniform(25, 48), rng.uniform(-123, -71)
+        city = {'_id': ObjectId(), 'name': f'City {c}', 'name_lower': f'city {c}', 'createdAt': now}
+        cities.append(city)
+        for n in range(args.neighborhoods):
+            neighborhoods.append({
+                '_id': ObjectId(),
+                'city_id': city['_id'],
+                'name': f'Neighborhood {c}-{n}',
+                'name_lower': f'neighborhood {c}-{n}',
+                'location': random_point(rng, lat, lng, 0.1),
+                'member_count': 0,
+                'createdAt': now
+            })
+    db.cities.insert_many(cities)
+
+    user_ids = [ObjectId() for _ in range(args.users)]
+    edges = set()
+    for follower in user_ids:
+        for followee in rng.sample(user_ids, min(args.following, len(user_ids))):
+            if followee != follower:
+                edges.add((follower, followee))
+    followers_count = {user_id: 0 for user_id in user_ids}
+    following_count = {user_id: 0 for user_id in user_ids}
+    for follower, followee in edges:
+        following_count[follower] += 1
+        followers_count[followee] += 1
+
+    # Hash once; every user shares the password
+    hashed = password_hasher.hash_password(PASSWORD)
+    users, homes = [], {}
+    for i, user_id in enumerate(user_ids):
+        home = rng.choice(neighborhoods)
+        home['member_count'] += 1
+        homes[user_id] = home
+        users.append({
+            '_id': user_id,
+            'username': f'user{i}',
+            'email': f'user{i}@bench.test',
+            'fullName': f'User {i}',
+            'password': hashed,
+            'location': {
+                'city_id': str(home['city_id']),
+                'neighborhood_id': str(home['_id']),
+                'neighborhood_name': home['name']
+            },
+            'followersCount': followers_count[user_id],
+            'followingCount': following_count[user_id],
+            'createdAt': now,
+            'updatedAt': now
+        })
+    db.neighborhoods.insert_many(neighborhoods)
+    for i in range(0, len(users), 1000):
+        db.users.insert_many(users[i:i + 1000])
+    edge_docs = [{'follower': a, 'followee': b, 'createdAt': now} for a, b in edges]
+    for i in range(0, len(edge_docs), 10000):
+        db.follows.insert_many(edge_docs[i:i + 10000])
+
+    posts = []
+    for i in range(args.posts):
+        author = rng.choice(user_ids)
+        home = homes[author]
+        created = now - timedelta(seconds=rng.uniform(0, 7 * 24 * 3600))
+        lng, lat = home['location']['coordinates']
+        posts.append({
+            '_id': ObjectId(),
+            'content': f'Post {i}',
+            'images': [],
+            'author': author,
+            'visibility': rng.choice(['neighborhood', 'city']),
+            'city_id': home['city_id'],
+            'neighborhood_id': home['_id'],
+            'location': random_point(rng, lat, lng, 0.01),
+            'like_count': 0,
+            'comment_count': 0,
+            'recent_comments': [],
+            'createdAt': created,
+            'updatedAt': created
+        })
+    for i in range(0, len(posts), 10000):
+        db.posts.insert_many(posts[i:i + 10000])
+
+    # Same entries rebuild_timeline writes (own posts plus the newest
+    # TIMELINE_BACKFILL of each followee's), built in memory in one pass
+    backfill = app.config['TIMELINE_BACKFILL']
+    by_author = {}
+    for post in sorted(posts, key=lambda p: p['createdAt'], reverse=True):
+        by_author.setdefault(post['author'], [])
+        if len(by_author[post['author']]) < backfill:
+            by_author[post['author']].append(post)
+    following = {user_id: [user_id] for user_id in user_ids}
+    for follower, followee in edges:
+        following[follower].append(followee)
+    entries = [
+        _timeline_entry(user_id, post)
+        for user_id in user_ids
+        for author in following[user_id]
+        for post in by_author.get(author, [])
+    ]
+    for i in range(0, len(entries), 10000):
+        db.timeline.insert_many(entries[i:i + 10000])
+
+    # Indexes go on after the bulk load, which is quicker on mongod and keeps
+    # mongomock's per-insert unique checks out of the seeding time
+    apply_indexes(db)
+
+    return {
+        'users': user_ids,
+        'posts': [post['_id'] for post in posts],
+        'cities': [city['_id'] for city in cities],
+        'neighborhoods': neighborhoods
+    }
+
+
+def scenarios(data, tokens, mongomock):
+    """Map scenario name -> function(rng) returning (method, path, headers, json body)"""
+
+    def as_user(rng):
+        user_id = rng.choice(data['users'])
+        return user_id, {'x-access-token': tokens[user_id]}
+
+    def login(rng):
+        i = rng.randrange(len(data['users']))
+        return 'POST', '/api/auth/login', {}, {'email': f'user{i}@bench.test', 'password': PASSWORD}
+
+    def get_posts(rng):
+        _, headers = as_user(rng)
+        return 'GET', '/api/posts?limit=20', headers, None
+
+    def like_post(rng):
+        _, headers = as_user(rng)
+        return 'POST', f'/api/posts/{rng.choice(data["posts"])}/like', headers, None
+
+    def follow_user(rng):
+        user_id, headers = as_user(rng)
+        followee = rng.choice(data['users'])
+        while followee == user_id:
+            followee = rng.choice(data['users'])
+        return 'POST', f'/api/users/{followee}/follow', headers, None
+
+    def cities(rng):
+        return 'GET', '/api/locations/cities', {}, None
+
+    def neighborhoods(rng):
+        return 'GET', f'/api/locations/cities/{rng.choice(data["cities"])}/neighborhoods', {}, None
+
+    def neighborhood_posts(rng):
+        _, headers = as_user(rng)
+        n = rng.choice(data['neighborhoods'])
+        return 'GET', f'/api/locations/neighborhoods/{n["_id"]}/posts', headers, None
+
+    def city_posts(rng):
+        _, headers = as_user(rng)
+        return 'GET', f'/api/locations/cities/{rng.choice(data["cities"])}/posts', headers, None
+
+    def nearby(rng):
+        _, headers = as_user(rng)
+        lng, lat = rng.choice(data['neighborhoods'])['location']['coordinates']
+        return 'GET', f'/api/locations/nearby?lat={lat}&lng={lng}&radius=2000', headers, None
+
+    result = {
+        'login': login,
+        'get_posts': get_posts,
+        'like_post': like_post,
+        'follow_user': follow_user,
+        'cities': cities,
+        'neighborhoods': neighborhoods,
+        'neighborhood_posts': neighborhood_posts,
+        'city_posts': city_posts
+    }
+    # mongomock has no $geoNear
+    if not mongomock:
+        result['nearby'] = nearby
+    return result
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return round(sorted_values[index] * 1000, 3)
+
+
+def mongo_command_totals():
+    """Return (commands, requests) recorded by the request metrics so far"""
+    from metrics import metrics
+    commands = requests = 0
+    for series in metrics.series('http_request_mongo_commands').values():
+        _, total, count = series.snapshot()
+        commands += total
+        requests += count
+    return commands, requests
+
+
+def run_scenario(client, make_request, rng, requests, warmup):
+    for _ in range(warmup):
+        method, path, headers, body = make_request(rng)
+        client.open(path, method=method, headers=headers, json=body)
+
+    commands_before, requests_before = mongo_command_totals()
+    latencies, errors = [], {}
+    start = time.perf_counter()
+    for _ in range(requests):
+        method, path, headers, body = make_request(rng)
+        t = time.perf_counter()
+        response = client.open(path, method=method, headers=headers, json=body)
+        latencies.append(time.perf_counter() - t)
+        if response.status_code >= 400:
+            errors[response.status_code] = errors.get(response.status_code, 0) + 1
+    elapsed = time.perf_counter() - start
+    commands_after, requests_after = mongo_command_totals()
+
+    latencies.sort()
+    served = requests_after - requests_before
+    return {
+        'requests': requests,
+        'ops_per_s': round(requests / elapsed, 1),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'mongo_calls_per_request': round((commands_after - commands_before) / served, 2) if served else None,
+        'errors': errors
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongo-uri', help='mongod database to use instead of mongomock')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--following', type=int, default=10, help='follows per user')
+    parser.add_argument('--cities', type=int, default=5)
+    parser.add_argument('--neighborhoods', type=int, default=8, help='neighborhoods per city')
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help='keeps login from only measuring bcrypt')
+    parser.add_argument('--only', help='comma-separated scenarios to run')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = load_app(args)
+    app.config['TESTING'] = True
+
+    start = time.perf_counter()
+    data = seed(app, args, rng)
+    seed_s = time.perf_counter() - start
+
+    expires = datetime.utcnow() + timedelta(days=1)
+    tokens = {
+        user_id: jwt.encode({'user_id': str(user_id), 'exp': expires}, app.config['JWT_SECRET'], algorithm='HS256')
+        for user_id in data['users']
+    }
+    selected = scenarios(data, tokens, mongomock=not args.mongo_uri)
+    if args.only:
+        selected = {name: selected[name] for name in args.only.split(',')}
+
+    client = app.test_client()
+    results = {
+        name: run_scenario(client, make_request, rng, args.requests, args.warmup)
+        for name, make_request in selected.items()
+    }
+
+    print(json.dumps({
+        'commit': git_commit(),
+        'backend': 'mongod' if args.mongo_uri else 'mongomock',
+        'scale': {
+            'users': args.users,
+            'following': args.following,
+            'cities': args.cities,
+            'neighborhoods': args.cities * args.neighborhoods,
+            'posts': args.posts
+        },
+        'seed_s': round(seed_s, 2),
+        'results': results
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
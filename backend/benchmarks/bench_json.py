@@ -0,0 +1,104 @@
+"""Serialization cost of one feed page.
+
+Compares the old path (stringify ObjectIds in Python, then Flask's stdlib
+provider) with MongoJSONProvider on orjson and on its stdlib fallback, for a
+50-post page whose posts carry large likes arrays. Run from the backend
+directory:
+
+    python benchmarks/bench_json.py --posts 50 --likes 2000
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from bson import ObjectId
+import json_provider
+from json_provider import MongoJSONProvider
+
+
+def make_page(posts, likes, comments):
+    page = []
+    for i in range(posts):
+        page.append({
+            '_id': ObjectId(),
+            'content': 'Post %d about the neighborhood' % i,
+            'images': [],
+            'likes': [ObjectId() for _ in range(likes)],
+            'comments': [
+                {'user': ObjectId(), 'text': 'Comment %d' % j, 'createdAt': datetime.utcnow()}
+                for j in range(comments)
+            ],
+            'createdAt': datetime.utcnow(),
+            'author': {
+                'id': ObjectId(),
+                'username': 'user%d' % i,
+                'fullName': 'User %d' % i,
+                'profilePicture': ''
+            }
+        })
+    return page
+
+
+def legacy_response(app, page):
+    # What get_posts did before MongoJSONProvider; shallow copies keep `page`
+    # reusable between runs without adding a deepcopy to the measurement
+    posts = []
+    for post in page:
+        post = dict(post, author=dict(post['author']))
+        post['_id'] = str(post['_id'])
+        post['author']['id'] = str(post['author']['id'])
+        post['likes'] = [str(like) for like in post.get('likes', [])]
+        post['comments'] = [dict(comment) for comment in post.get('comments', [])]
+        for comment in post['comments']:
+            if 'user' in comment and isinstance(comment['user'], ObjectId):
+                comment['user'] = str(comment['user'])
+        posts.append(post)
+    return app.json.response(posts)
+
+
+def provider_response(app, page):
+    return app.json.response(page)
+
+
+def bench(label, fn, app, page, number):
+    with app.app_context():
+        seconds = min(timeit.repeat(lambda: fn(app, page), number=number, repeat=3)) / number
+        size = len(fn(app, page).get_data())
+    print(f'{label:<22} {seconds * 1000:8.2f} ms/page  {size / 1024:8.1f} KiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=50)
+    parser.add_argument('--likes', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=20)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    page = make_page(args.posts, args.likes, args.comments)
+    print(f'posts={args.posts} likes/post={args.likes} comments/post={args.comments}')
+
+    legacy = Flask(__name__)
+    legacy.json = DefaultJSONProvider(legacy)
+    bench('legacy (str + stdlib)', legacy_response, legacy, page, args.number)
+
+    current = Flask(__name__)
+    current.json = MongoJSONProvider(current)
+    if json_provider.orjson is not None:
+        bench('provider (orjson)', provider_response, current, page, args.number)
+
+    orjson, json_provider.orjson = json_provider.orjson, None
+    try:
+        bench('provider (stdlib)', provider_response, current, page, args.number)
+    finally:
+        json_provider.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
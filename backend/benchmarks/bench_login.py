@@ -0,0 +1,74 @@
+"""Login throughput against bcrypt pool size.
+
+Simulates CLIENTS request threads that each verify a password, first inline
+(the old behaviour) and then through PasswordHasher with a growing number of
+workers. Run from the backend directory:
+
+    python benchmarks/bench_login.py --rounds 10 --requests 200
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from passwords import PasswordHasher, PasswordHasherBusy, _hashpw, _checkpw
+
+
+def run(check, clients, requests):
+    """Return (logins/sec, rejected) for `requests` checks spread over `clients` threads"""
+    rejected = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal rejected
+        try:
+            check()
+        except PasswordHasherBusy:
+            with lock:
+                rejected += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return (requests - rejected) / elapsed, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    password = 'correct horse battery staple'
+    hashed = _hashpw(password, args.rounds)
+
+    print(f'rounds={args.rounds} requests={args.requests} clients={args.clients}')
+    rate, _ = run(lambda: _checkpw(password, hashed), args.clients, args.requests)
+    print(f'{"inline":>10}  {rate:8.1f} logins/s')
+
+    for workers in args.workers:
+        app = Flask(__name__)
+        app.config.update(
+            BCRYPT_ROUNDS=args.rounds,
+            BCRYPT_WORKERS=workers,
+            BCRYPT_MAX_PENDING=args.clients,
+            BCRYPT_EXECUTOR=args.executor
+        )
+        hasher = PasswordHasher()
+        hasher.init_app(app)
+        rate, rejected = run(lambda: hasher.check_password(password, hashed), args.clients, args.requests)
+        hasher.shutdown()
+        print(f'{workers:>4} {args.executor:<5}  {rate:8.1f} logins/s  rejected={rejected}')
+
+
+if __name__ == '__main__':
+    main()
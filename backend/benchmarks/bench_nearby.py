@@ -0,0 +1,109 @@
+"""Nearby lookup over a synthetic set of points.
+
+Generates N random points around a city center and times "closest within
+radius" queries two ways: a full Python haversine scan (what a client-side
+or unindexed search amounts to) and MongoDB $geoNear over a 2dsphere index.
+The Mongo half needs a reachable mongod (MONGO_URI, default localhost) and
+writes to a throwaway database. Run from the backend directory:
+
+    python benchmarks/bench_nearby.py --points 100000 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from geo import haversine, parse_point
+
+CENTER = (30.2672, -97.7431)  # lat, lng
+SPREAD = 0.5  # degrees
+
+
+def random_point(rng):
+    return CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD)
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    print(f'{label:<16} p50={p50:8.3f} ms  p99={p99:8.3f} ms  ops/s={len(timings) / sum(timings):8.1f}')
+
+
+def bench_scan(points, queries, radius, limit):
+    timings = []
+    for lat, lng in queries:
+        start = time.perf_counter()
+        hits = []
+        for plat, plng in points:
+            d = haversine(lat, lng, plat, plng)
+            if d <= radius:
+                hits.append((d, plat, plng))
+        hits.sort()
+        hits = hits[:limit]
+        timings.append(time.perf_counter() - start)
+    report('python scan', timings)
+
+
+def bench_mongo(points, queries, radius, limit, uri):
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        print(f'mongo            skipped ({e.__class__.__name__}: set MONGO_URI to a running mongod)')
+        return
+
+    db = client['eyes_bench_nearby']
+    db.points.drop()
+    batch = [{'location': parse_point(lat, lng)} for lat, lng in points]
+    for i in range(0, len(batch), 10000):
+        db.points.insert_many(batch[i:i + 10000], ordered=False)
+    db.points.create_index([('location', '2dsphere')])
+
+    timings = []
+    for lat, lng in queries:
+        start = time.perf_counter()
+        list(db.points.aggregate([
+            {'$geoNear': {
+                'near': parse_point(lat, lng),
+                'distanceField': 'distance',
+                'maxDistance': radius,
+                'spherical': True
+            }},
+            {'$limit': limit}
+        ]))
+        timings.append(time.perf_counter() - start)
+    report('mongo $geoNear', timings)
+    client.drop_database(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--scan-queries', type=int, default=10,
+                        help='the Python scan is slow, so time fewer queries')
+    parser.add_argument('--radius', type=float, default=1000, help='meters')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    points = [random_point(rng) for _ in range(args.points)]
+    queries = [random_point(rng) for _ in range(args.queries)]
+    print(f'points={args.points} queries={args.queries} radius={args.radius:.0f}m limit={args.limit}')
+
+    bench_scan(points, queries[:args.scan_queries], args.radius, args.limit)
+    bench_mongo(points, queries, args.radius, args.limit, args.mongo_uri)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Per-keystroke latency of the prefix autocomplete index.
+
+Builds a PrefixIndex over N synthetic names and times searches for every
+prefix of a sample of names, as a user typing them would issue. Run from the
+backend directory:
+
+    python benchmarks/bench_suggest.py --names 200000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from suggest import PrefixIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--names', type=int, default=200000)
+    parser.add_argument('--typed', type=int, default=2000, help='names typed out keystroke by keystroke')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = [
+        ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 14)))
+        for _ in range(args.names)
+    ]
+
+    start = time.perf_counter()
+    index = PrefixIndex((name, {'name': name}) for name in names)
+    print(f'names={args.names} build={time.perf_counter() - start:.2f}s')
+
+    timings = []
+    for name in rng.sample(names, args.typed):
+        for i in range(1, len(name) + 1):
+            prefix = name[:i]
+            t = time.perf_counter()
+            index.search(prefix, args.limit)
+            timings.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    for name in rng.sample(names, 1000):
+        index.add(name + 'x', {'name': name})
+    add_us = (time.perf_counter() - start) * 1e6 / 1000
+
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[int(len(timings) * 0.99)] * 1e6
+    print(f'keystrokes={len(timings)} p50={p50:.1f}us p99={p99:.1f}us max={timings[-1] * 1e6:.1f}us')
+    print(f'incremental add: {add_us:.3f}us avg')
+
+
+if __name__ == '__main__':
+    main()
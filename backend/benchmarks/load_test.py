@@ -0,0 +1,115 @@
+"""Closed-loop HTTP load generator for the API.
+
+Opens CLIENTS keep-alive connections that each send requests back to back
+for DURATION seconds, then reports requests/second and latency percentiles
+as JSON. Uses only asyncio so it can hold 1k+ connections from one process.
+
+Compare serving profiles by starting the API with each and running the same
+command against it, e.g.:
+
+    GUNICORN_PROFILE=sync   gunicorn app:app
+    GUNICORN_PROFILE=gevent gunicorn app:app
+    python benchmarks/load_test.py --url http://127.0.0.1:5001/api/posts \\
+        --token <jwt> --clients 1000 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+async def client(host, port, request, deadline, latencies, errors):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError('connection closed')
+            status = int(status_line.split()[1])
+            length = 0
+            close = False
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                name = name.strip().lower()
+                if name == 'content-length':
+                    length = int(value)
+                elif name == 'connection' and value.strip().lower() == 'close':
+                    close = True
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors['http_%d' % status] = errors.get('http_%d' % status, 0) + 1
+            if close:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            errors[e.__class__.__name__] = errors.get(e.__class__.__name__, 0) + 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return round(sorted_values[index] * 1000, 3)
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    path = url.path + ('?' + url.query if url.query else '')
+    headers = [f'GET {path} HTTP/1.1', f'Host: {url.netloc}', 'Connection: keep-alive']
+    if args.token:
+        headers.append(f'x-access-token: {args.token}')
+    request = ('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1')
+
+    latencies, errors = [], {}
+    deadline = time.monotonic() + args.duration
+    start = time.monotonic()
+    await asyncio.gather(*(
+        client(host, port, request, deadline, latencies, errors)
+        for _ in range(args.clients)
+    ))
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    return {
+        'url': args.url,
+        'clients': args.clients,
+        'duration_s': round(elapsed, 2),
+        'requests': len(latencies),
+        'requests_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': percentile(latencies, 100),
+        'errors': errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5001/api/health')
+    parser.add_argument('--token', help='JWT sent as x-access-token')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=30)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import itertools
+import threading
+import time
+from cache import TTLCache
+from metrics import metrics
+
+_MISSING = object()
+
+# Every ReadCache, for the dedupe metrics
+_caches = {}
+
+
+class _Call:
+    """One in-flight load that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one `fn()` per key at a time; other callers share its result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return (value, shared) where `shared` is True for callers that waited"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+
+class ReadCache:
+    """Short-TTL cache for hot reads with single-flight loading.
+
+    Identical reads arriving together run one load and share its result, and
+    the result is kept for `ttl` seconds. Entries carry tags such as
+    'neighborhood:<id>'; `invalidate(tag)` from a write route drops every
+    entry with that tag, including ones whose load was still running when the
+    write happened. Invalidation only reaches this process, so other workers
+    serve their copy until it expires.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=5):
+        self.name = name
+        self.ttl = ttl
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flight = SingleFlight()
+        self._seq = itertools.count(1)
+        self._invalidated = {}  # tag -> (sequence, monotonic time)
+        self._cleared = 0
+        self._max_ttl = ttl
+        self._lock = threading.Lock()
+        self.counts = {'hit': 0, 'coalesced': 0, 'executed': 0}
+        _caches[name] = self
+
+    def _epoch(self, tags):
+        """Sequence number of the latest invalidation touching `tags`"""
+        epoch = self._cleared
+        for tag in tags:
+            record = self._invalidated.get(tag)
+            if record is not None and record[0] > epoch:
+                epoch = record[0]
+        return epoch
+
+    def _fresh(self, seq, tags):
+        return self._epoch(tags) < seq
+
+    def get_or_load(self, key, load, tags=(), ttl=None, value_tags=None):
+        """Return the cached value for `key`, or run `load()` once to fill it.
+
+        `value_tags(value)` adds tags that depend on the loaded value, such as
+        the posts on a page. None results are shared with concurrent callers
+        but not cached.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self._max_ttl = max(self._max_ttl, ttl)
+        entry = self._entries.get(key, _MISSING)
+        if entry is not _MISSING and self._fresh(entry[0], entry[1]):
+            self._count('hit')
+            return entry[2]
+
+        def run():
+            seq = next(self._seq)
+            started = time.monotonic()
+            value = load()
+            # Expire relative to the start of the load so a slow load can't
+            # outlive the invalidation records that would catch it
+            remaining = ttl - (time.monotonic() - started)
+            if value is not None and remaining > 0:
+                entry_tags = tuple(tags) + tuple(value_tags(value) if value_tags else ())
+                if self._fresh(seq, entry_tags):
+                    self._entries.set(key, (seq, entry_tags, value), ttl=remaining)
+            return value
+
+        # A load that started before the latest write to its tags is not
+        # joined, so a client reading right after its own write sees it
+        value, shared = self._flight.do((key, self._epoch(tags)), run)
+        self._count('coalesced' if shared else 'executed')
+        return value
+
+    def invalidate(self, *tags):
+        """Drop entries carrying any of `tags`, or every entry when none are given"""
+        seq = next(self._seq)
+        now = time.monotonic()
+        with self._lock:
+            if not tags:
+                self._cleared = seq
+                self._invalidated.clear()
+                self._entries.clear()
+                return
+            for tag in tags:
+                self._invalidated[tag] = (seq, now)
+            # An entry older than the longest TTL is gone anyway, so its
+            # invalidation record is no longer needed
+            if len(self._invalidated) > 1024:
+                self._invalidated = {
+                    tag: record for tag, record in self._invalidated.items()
+                    if now - record[1] <= self._max_ttl
+                }
+
+    def _count(self, result):
+        with self._lock:
+            self.counts[result] += 1
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        counts['dedupe_ratio'] = (counts['hit'] + counts['coalesced']) / total if total else 0.0
+        return counts
+
+
+metrics.collect(
+    'read_cache_requests_total',
+    'Cached reads by result: hit, coalesced onto an in-flight load, or executed',
+    lambda: [
+        ({'cache': name, 'result': result}, cache.counts[result])
+        for name, cache in sorted(_caches.items())
+        for result in ('hit', 'coalesced', 'executed')
+    ],
+    kind='counter'
+)
+metrics.collect(
+    'read_cache_dedupe_ratio',
+    'Share of cached reads that did not run their own query',
+    lambda: [({'cache': name}, cache.stats()['dedupe_ratio']) for name, cache in sorted(_caches.items())]
+)
@@ -0,0 +1,206 @@
+import click
+import zlib
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from extensions import mongo
+from feed import rebuild_timeline, mark_pull_authors, migrate_post_likes
+from schema import apply_indexes, schema_version, SCHEMA_VERSION
+from members import reconcile_member_counts
+from export import EXPORTS, export_documents, ndjson_line
+
+
+def register_commands(app):
+    """Attach maintenance commands to the `flask` CLI"""
+
+    @app.cli.command('apply-indexes')
+    def apply_indexes_command():
+        """Create the declared indexes and record the schema version"""
+        previous = schema_version(mongo.db)
+        created, failures = apply_indexes(mongo.db)
+        for collection, names in created.items():
+            click.echo(f'{collection}: {", ".join(names)}')
+        for collection, error in failures.items():
+            click.echo(f'{collection} FAILED: {error}', err=True)
+        if failures:
+            raise click.ClickException(f'Schema version stays at {previous}')
+        click.echo(f'Schema version {previous} -> {SCHEMA_VERSION}')
+
+    @app.cli.command('rebuild-timelines')
+    def rebuild_timelines():
+        """Rebuild every user's home timeline from the follow graph"""
+        mark_pull_authors()
+        count = 0
+        for user in mongo.db.users.find({}, {'_id': 1}):
+            rebuild_timeline(user)
+            count += 1
+        click.echo(f'Rebuilt {count} timelines')
+
+    @app.cli.command('migrate-likes')
+    def migrate_likes():
+        """Move embedded likes arrays into the likes collection"""
+        count = 0
+        for post in mongo.db.posts.find({'likes': {'$exists': True}}, {'likes': 1, 'createdAt': 1}):
+            migrate_post_likes(post)
+            count += 1
+        click.echo(f'Migrated likes on {count} posts')
+
+    @app.cli.command('reconcile-likes')
+    def reconcile_likes():
+        """Recount like_count from the likes collection where it drifted"""
+        counts = {
+            row['_id']: row['count']
+            for row in mongo.db.likes.aggregate([{'$group': {'_id': '$post_id', 'count': {'$sum': 1}}}])
+        }
+        ops = []
+        for post in mongo.db.posts.find({'likes': {'$exists': False}}, {'like_count': 1}):
+            expected = counts.get(post['_id'], 0)
+            if post.get('like_count', 0) != expected:
+                ops.append(UpdateOne({'_id': post['_id']}, {'$set': {'like_count': expected}}))
+        for i in range(0, len(ops), 1000):
+            mongo.db.posts.bulk_write(ops[i:i + 1000], ordered=False)
+        click.echo(f'Corrected like_count on {len(ops)} posts')
+
+    @app.cli.command('migrate-comments')
+    def migrate_comments():
+        """Move embedded comments arrays into the comments collection"""
+        preview_count = app.config.get('COMMENT_PREVIEW_COUNT', 3)
+        usernames = {}
+        count = 0
+        for post in mongo.db.posts.find({'comments': {'$exists': True}}, {'comments': 1, 'createdAt': 1}):
+            embedded_comments = post.get('comments', [])
+            # Give old comments a fixed _id and date on the post itself first, so
+            # a rerun after a crash upserts the same documents instead of copies
+            if any('_id' not in c or 'createdAt' not in c for c in embedded_comments):
+                for embedded in embedded_comments:
+                    embedded.setdefault('_id', ObjectId())
+                    embedded.setdefault('createdAt', post.get('createdAt', datetime.utcnow()))
+                mongo.db.posts.update_one({'_id': post['_id']}, {'$set': {'comments': embedded_comments}})
+
+            comments = []
+            for embedded in embedded_comments:
+                user_id = embedded.get('user')
+                if user_id not in usernames:
+                    user = mongo.db.users.find_one({'_id': user_id}, {'username': 1}) or {}
+                    usernames[user_id] = user.get('username', '')
+                comments.append({
+                    '_id': embedded['_id'],
+                    'post_id': post['_id'],
+                    'user': user_id,
+                    'username': usernames[user_id],
+                    'text': embedded.get('text', ''),
+                    'createdAt': embedded['createdAt']
+                })
+            ops = [
+                UpdateOne({'_id': c['_id']}, {'$setOnInsert': c}, upsert=True)
+                for c in comments
+            ]
+            if ops:
+                mongo.db.comments.bulk_write(ops, ordered=False)
+            comments.sort(key=lambda c: c['createdAt'])
+            recent = [
+                {k: c[k] for k in ('_id', 'user', 'username', 'text', 'createdAt')}
+                for c in comments[-preview_count:]
+            ]
+            mongo.db.posts.update_one(
+                {'_id': post['_id']},
+                {
+                    '$set': {'comment_count': len(comments), 'recent_comments': recent},
+                    '$unset': {'comments': ''}
+                }
+            )
+            count += 1
+        click.echo(f'Migrated comments on {count} posts')
+
+    @app.cli.command('migrate-follows')
+    def migrate_follows():
+        """Move embedded follower/following arrays into the follows collection"""
+        count = 0
+        for user in mongo.db.users.find({'following': {'$exists': True}}, {'following': 1}):
+            ops = [
+                UpdateOne(
+                    {'follower': user['_id'], 'followee': followee},
+                    {'$setOnInsert': {'createdAt': datetime.utcnow()}},
+                    upsert=True
+                )
+                for followee in user.get('following', [])
+            ]
+            if ops:
+                mongo.db.follows.bulk_write(ops, ordered=False)
+            count += 1
+
+        # Recount both sides from the edges, then drop the arrays
+        for user in mongo.db.users.find({}, {'_id': 1}):
+            mongo.db.users.update_one(
+                {'_id': user['_id']},
+                {
+                    '$set': {
+                        'followersCount': mongo.db.follows.count_documents({'followee': user['_id']}),
+                        'followingCount': mongo.db.follows.count_documents({'follower': user['_id']})
+                    },
+                    '$unset': {'followers': '', 'following': ''}
+                }
+            )
+        click.echo(f'Migrated follows for {count} users')
+
+    @app.cli.command('migrate-neighborhoods')
+    def migrate_neighborhoods():
+        """Move neighborhoods embedded in cities into the neighborhoods collection"""
+        count = 0
+        for city in mongo.db.cities.find({'neighborhoods': {'$exists': True}}, {'neighborhoods': 1}):
+            ops = [
+                UpdateOne(
+                    {'_id': ObjectId(n['id'])},
+                    {'$setOnInsert': {
+                        'city_id': city['_id'],
+                        'name': n['name'],
+                        'name_lower': n.get('name_lower', n['name'].lower()),
+                        'created_at': n.get('created_at', datetime.utcnow()),
+                        'member_count': n.get('member_count', 0)
+                    }},
+                    upsert=True
+                )
+                for n in city.get('neighborhoods', [])
+            ]
+            if ops:
+                mongo.db.neighborhoods.bulk_write(ops, ordered=False)
+            mongo.db.cities.update_one({'_id': city['_id']}, {'$unset': {'neighborhoods': ''}})
+            count += len(ops)
+        click.echo(f'Migrated {count} neighborhoods')
+
+    @app.cli.command('reconcile-members')
+    def reconcile_members():
+        """Recount neighborhood member_count from users' locations"""
+        fixed = reconcile_member_counts()
+        click.echo(f'Corrected {len(fixed)} neighborhoods')
+
+    @app.cli.command('export')
+    @click.argument('collection', type=click.Choice(sorted(EXPORTS)))
+    @click.option('--output', '-o', type=click.File('wb'), default='-', help='Defaults to stdout')
+    @click.option('--after', help='Resume after this _id')
+    @click.option('--limit', type=int, help='Stop after this many documents')
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+    @click.option('--batch-size', type=int, help='Defaults to EXPORT_BATCH_SIZE')
+    def export_command(collection, output, after, limit, compress, batch_size):
+        """Stream a collection as NDJSON in _id order"""
+        batch_size = batch_size or app.config.get('EXPORT_BATCH_SIZE', 1000)
+        try:
+            after_id = ObjectId(after) if after else None
+        except InvalidId:
+            raise click.BadParameter('not an ObjectId', param_hint='--after')
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        count, last_id = 0, after_id
+        try:
+            for doc in export_documents(collection, after_id, limit, batch_size):
+                line = ndjson_line(doc)
+                output.write(compressor.compress(line) if compressor else line)
+                count += 1
+                last_id = doc['_id']
+        finally:
+            # Runs on Ctrl-C too, leaving a complete file and a checkpoint
+            if compressor:
+                output.write(compressor.flush())
+            output.flush()
+            click.echo(f'Exported {count} {collection}; resume with --after {last_id}', err=True)
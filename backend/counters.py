@@ -0,0 +1,160 @@
+import atexit
+import logging
+import os
+import threading
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+from extensions import mongo
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """Write-behind buffer for `$inc` counters on hot documents.
+
+    Deltas are summed per (collection, _id, field) in memory and written with
+    one unordered bulk_write per collection every COUNTER_FLUSH_INTERVAL
+    seconds, or straight away once COUNTER_FLUSH_SIZE documents are pending.
+    A thousand likes on a viral post become one update. Counters therefore
+    lag by up to one interval, and a worker killed with SIGKILL loses its
+    pending deltas; a normal shutdown flushes them. Deltas whose write may
+    or may not have landed (a dropped connection) are not replayed either.
+
+    An interval of 0 disables buffering and writes every delta immediately.
+    """
+
+    def __init__(self, interval=1.0, max_pending=1000, db=None):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._db = db
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._listeners = []
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        atexit.register(self.close)
+
+    def init_app(self, app):
+        self.interval = app.config.get('COUNTER_FLUSH_INTERVAL', self.interval)
+        self.max_pending = app.config.get('COUNTER_FLUSH_SIZE', self.max_pending)
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else mongo.db
+
+    def on_flush(self, listener):
+        """Call `listener(touched)` after each flush with {collection: set of ids}"""
+        self._listeners.append(listener)
+        return listener
+
+    def incr(self, collection, doc_id, field, delta=1):
+        if self.interval <= 0:
+            self.db[collection].update_one({'_id': doc_id}, {'$inc': {field: delta}})
+            self._notify({collection: {doc_id}})
+            return
+
+        with self._lock:
+            fields = self._pending.setdefault((collection, doc_id), {})
+            fields[field] = fields.get(field, 0) + delta
+            size = len(self._pending)
+
+        self._ensure_thread()
+        if size >= self.max_pending:
+            self.flush()
+
+    def flush(self):
+        """Write all pending deltas; returns the number of documents updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            grouped = {}
+            for (collection, doc_id), fields in pending.items():
+                fields = {field: delta for field, delta in fields.items() if delta}
+                if fields:
+                    grouped.setdefault(collection, {})[doc_id] = fields
+            if not grouped:
+                return 0
+            return self._write(grouped)
+
+    def _write(self, grouped):
+        written = 0
+        touched = {}
+        for collection, docs in grouped.items():
+            doc_ids = list(docs)
+            ops = [UpdateOne({'_id': doc_id}, {'$inc': docs[doc_id]}) for doc_id in doc_ids]
+            try:
+                self.db[collection].bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: everything but the listed ops was applied, so only
+                # those go back for the next flush
+                failed = {doc_ids[error['index']] for error in e.details.get('writeErrors', [])}
+                logger.error('Flushing %d of %d %s counters failed', len(failed), len(ops), collection)
+                self._restore(collection, {doc_id: docs[doc_id] for doc_id in failed})
+                written += len(ops) - len(failed)
+                touched[collection] = set(doc_ids) - failed
+                continue
+            except ConnectionFailure as e:
+                # Some of the batch may have been applied; replaying it could
+                # count twice, so drop it and leave the drift to a recount
+                # (`flask reconcile-members`, `flask reconcile-likes`)
+                logger.error('Flushing %d %s counters was interrupted, deltas dropped: %s', len(ops), collection, e)
+                continue
+            except PyMongoError as e:
+                # Rejected before anything was written; retry on the next flush
+                logger.error('Flushing %d %s counters failed: %s', len(ops), collection, e)
+                self._restore(collection, docs)
+                continue
+            written += len(ops)
+            touched[collection] = set(doc_ids)
+
+        touched = {collection: ids for collection, ids in touched.items() if ids}
+        if touched:
+            self._notify(touched)
+        return written
+
+    def _notify(self, touched):
+        for listener in self._listeners:
+            try:
+                listener(touched)
+            except Exception:
+                logger.exception('Counter flush listener failed')
+
+    def _restore(self, collection, docs):
+        with self._lock:
+            for doc_id, fields in docs.items():
+                pending = self._pending.setdefault((collection, doc_id), {})
+                for field, delta in fields.items():
+                    pending[field] = pending.get(field, 0) + delta
+
+    def _ensure_thread(self):
+        # One flusher per process; a forked worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='counter-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Counter flush failed')
+
+    def close(self):
+        """Stop the flusher and write whatever is still pending"""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Final counter flush failed')
+
+
+counter_buffer = CounterBuffer()
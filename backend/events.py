@@ -0,0 +1,185 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from extensions import mongo
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One stream's bounded event queue and the topics it listens to"""
+
+    def __init__(self, topics, maxsize):
+        self.topics = set(topics)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def get(self, timeout):
+        """Return the next event, None once dropped, or raise queue.Empty"""
+        if self.dropped:
+            return None
+        return self.queue.get(timeout=timeout)
+
+
+class EventBus:
+    """Topic-based fan-out of events to connected streams.
+
+    Topics are strings such as 'neighborhood:<id>', 'city:<id>',
+    'author:<id>' and 'user:<id>'. Every subscriber has a queue of
+    EVENT_QUEUE_SIZE events. A subscriber that falls that far behind is
+    dropped instead of holding up publishers or growing without bound, and
+    its client reconnects.
+
+    With EVENT_BUS_BACKEND='local' events only reach streams served by the
+    publishing process. 'mongo' writes them to a capped collection that every
+    process tails, so all workers see all events.
+    """
+
+    def __init__(self):
+        self.backend = 'local'
+        self.queue_size = 100
+        self.capped_size = 16 * 1024 * 1024
+        self._topics = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._tailer = None
+
+    def init_app(self, app):
+        self.backend = app.config.get('EVENT_BUS_BACKEND', self.backend)
+        self.queue_size = app.config.get('EVENT_QUEUE_SIZE', self.queue_size)
+        self.capped_size = app.config.get('EVENT_CAPPED_SIZE', self.capped_size)
+        if self.backend == 'mongo':
+            with app.app_context():
+                try:
+                    mongo.db.create_collection('events', capped=True, size=self.capped_size)
+                except CollectionInvalid:
+                    pass  # Already there
+
+        metrics.collect(
+            'event_subscribers',
+            'Open event stream subscriptions in this process',
+            lambda: len(self._subscribers())
+        )
+
+    def _subscribers(self):
+        with self._lock:
+            return {sub for subs in self._topics.values() for sub in subs}
+
+    def subscribe(self, topics):
+        sub = Subscription(topics, self.queue_size)
+        with self._lock:
+            for topic in sub.topics:
+                self._topics.setdefault(topic, set()).add(sub)
+        if self.backend == 'mongo':
+            self._ensure_tailer()
+        return sub
+
+    def update(self, sub, add=(), remove=()):
+        """Change a live subscription's topics, e.g. after a follow"""
+        with self._lock:
+            for topic in remove:
+                subs = self._topics.get(topic)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._topics[topic]
+                sub.topics.discard(topic)
+            for topic in add:
+                self._topics.setdefault(topic, set()).add(sub)
+                sub.topics.add(topic)
+
+    def unsubscribe(self, sub):
+        self.update(sub, remove=list(sub.topics))
+
+    def publish(self, event_type, topics, data, **meta):
+        """Send an event with an already-serialized JSON `data` payload"""
+        event = {'type': event_type, 'topics': list(topics), 'data': data, 'meta': meta}
+        metrics.counter(
+            'events_published_total', 'Events published by type', {'type': event_type}
+        ).inc()
+        if self.backend == 'mongo':
+            try:
+                mongo.db.events.insert_one(event)
+                return
+            except PyMongoError as e:
+                # Still reach the streams on this process
+                logger.error('Publishing %s event failed: %s', event_type, e)
+                event.pop('_id', None)
+        event['id'] = next(self._ids)
+        self.dispatch(event)
+
+    def dispatch(self, event):
+        """Queue `event` for every subscriber of any of its topics"""
+        with self._lock:
+            targets = set()
+            for topic in event['topics']:
+                targets.update(self._topics.get(topic, ()))
+
+        for sub in targets:
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                sub.dropped = True
+                self.unsubscribe(sub)
+                metrics.counter(
+                    'event_subscribers_dropped_total',
+                    'Streams disconnected for falling behind'
+                ).inc()
+
+    def _ensure_tailer(self):
+        if self._tailer is not None and self._tailer.is_alive():
+            return
+        with self._lock:
+            if self._tailer is None or not self._tailer.is_alive():
+                self._tailer = threading.Thread(target=self._tail, name='event-tail', daemon=True)
+                self._tailer.start()
+
+    def _tail(self):
+        """Follow the capped events collection and dispatch new documents.
+
+        ObjectIds from different processes are not ordered within a second,
+        so a restarted cursor never resumes with `_id > last`. It reads the
+        collection again in insertion ($natural) order and skips up to the
+        last event already dispatched.
+        """
+        last = mongo.db.events.find_one({}, {'_id': 1}, sort=[('$natural', -1)])
+        last_id = last['_id'] if last else None
+        while True:
+            try:
+                if last_id is not None and not mongo.db.events.find_one({'_id': last_id}, {'_id': 1}):
+                    # Overwritten, so everything still there is newer
+                    logger.warning('Event tail fell behind the capped collection; events were lost')
+                    last_id = None
+                cursor = mongo.db.events.find(
+                    {}, cursor_type=CursorType.TAILABLE_AWAIT
+                ).max_await_time_ms(1000)
+                last_id = self._follow(cursor, last_id)
+            except PyMongoError as e:
+                logger.error('Tailing events failed: %s', e)
+            # An empty capped collection has nothing to tail yet
+            time.sleep(1)
+
+    def _follow(self, cursor, last_id):
+        """Dispatch what `cursor` yields after `last_id`; returns the last id seen"""
+        skipping = last_id is not None
+        while cursor.alive:
+            for doc in cursor:
+                if skipping:
+                    skipping = doc['_id'] != last_id
+                    continue
+                last_id = doc['_id']
+                doc['id'] = str(doc.pop('_id'))
+                self.dispatch(doc)
+            if skipping:
+                # Overwritten between the check in _tail and this read
+                logger.warning('Event tail fell behind the capped collection; events were lost')
+                skipping = False
+        return last_id
+
+
+event_bus = EventBus()
@@ -0,0 +1,88 @@
+import json
+import zlib
+from datetime import date, datetime, timezone
+from bson import ObjectId, Decimal128, Timestamp
+from extensions import mongo
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Exportable collections and their projections; passwords never leave
+EXPORTS = {
+    'posts': None,
+    'users': {'password': 0},
+    'cities': None
+}
+
+
+def _default(o):
+    """Encode BSON types for analytics: hex ids and ISO 8601 UTC timestamps"""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, datetime):
+        if o.tzinfo is None:
+            o = o.replace(tzinfo=timezone.utc)
+        return o.isoformat()
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, Decimal128):
+        return str(o.to_decimal())
+    if isinstance(o, Timestamp):
+        return o.as_datetime().isoformat()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def ndjson_line(doc):
+    if orjson is None:
+        return json.dumps(doc, default=_default, separators=(',', ':')).encode('utf-8') + b'\n'
+    return orjson.dumps(doc, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME) + b'\n'
+
+
+def export_documents(collection, after=None, limit=None, batch_size=1000, db=None):
+    """Yield a collection's documents in _id order, starting after `after`.
+
+    Each batch is its own bounded query on _id, so memory stays at one batch
+    however large the collection is, no server cursor has to survive a slow
+    reader, and an export that stops can resume from the last _id written.
+    """
+    db = mongo.db if db is None else db
+    projection = EXPORTS[collection]
+    last_id = after
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+        batch = list(db[collection].find(query, projection).sort('_id', 1).limit(size))
+        for doc in batch:
+            yield doc
+        if len(batch) < size:
+            return
+        last_id = batch[-1]['_id']
+        if remaining is not None:
+            remaining -= len(batch)
+
+
+def ndjson_chunks(docs, chunk_size=64 * 1024):
+    """Join NDJSON lines into chunks of roughly `chunk_size` bytes"""
+    lines, size = [], 0
+    for doc in docs:
+        line = ndjson_line(doc)
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b''.join(lines)
+            lines, size = [], 0
+    if lines:
+        yield b''.join(lines)
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of byte chunks without holding more than one in memory"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
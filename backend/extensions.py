@@ -1,3 +1,24 @@
 from flask_pymongo import PyMongo
 
 mongo = PyMongo()
+
+# app.config key -> MongoClient keyword argument
+MONGO_CLIENT_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGO_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGO_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGO_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGO_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+    'MONGO_READ_PREFERENCE': 'readPreference',
+    'MONGO_COMPRESSORS': 'compressors'
+}
+
+def mongo_client_options(config):
+    """Build MongoClient keyword arguments from the MONGO_* settings that are set"""
+    return {
+        option: config[key]
+        for key, option in MONGO_CLIENT_OPTIONS.items()
+        if config.get(key) not in (None, '')
+    }
@@ -0,0 +1,300 @@
+import heapq
+from datetime import datetime
+from flask import current_app
+from bson import ObjectId
+from pymongo import UpdateOne
+from extensions import mongo
+from cache import TTLCache
+from coalesce import ReadCache
+from counters import counter_buffer
+from pagination import encode_cursor, keyset_filter
+from follows import following_among, iter_follower_ids, iter_following_ids
+
+# Authors with too many followers to fan out to; refreshed once a minute
+_pull_authors = TTLCache(maxsize=1, ttl=60)
+
+# Hydrated feed pages, shared by identical concurrent reads. Tagged with
+# 'timeline:<owner>', 'neighborhood:<id>' or 'city:<id>' and 'post:<id>'.
+feed_cache = ReadCache('feed', maxsize=4096, ttl=5)
+
+TIMELINE_SORT = [('createdAt', -1), ('post_id', -1)]
+
+
+@counter_buffer.on_flush
+def refresh_post_counts(touched):
+    """Drop cached pages showing posts whose like counts were just written"""
+    if 'posts' in touched:
+        feed_cache.invalidate(*(f'post:{post_id}' for post_id in touched['posts']))
+
+
+def page_tags(page):
+    """Tags for a cached (posts, next_cursor) page"""
+    return [f"post:{post['_id']}" for post in page[0]]
+
+
+def _timeline_entry(owner_id, post):
+    return {
+        'owner': owner_id,
+        'post_id': post['_id'],
+        'author': post['author'],
+        'visibility': post.get('visibility'),
+        'createdAt': post['createdAt']
+    }
+
+
+def fanout_post(post, author):
+    """Copy a new post into the timeline of its author and followers.
+
+    Authors with more than TIMELINE_FANOUT_LIMIT followers are flagged as
+    `fanout_on_read` instead; their posts are merged in when a follower
+    reads their timeline.
+    """
+    limit = current_app.config.get('TIMELINE_FANOUT_LIMIT', 5000)
+
+    # The author always sees their own posts
+    mongo.db.timeline.insert_one(_timeline_entry(post['author'], post))
+    feed_cache.invalidate(f"timeline:{post['author']}")
+
+    if author.get('followersCount', 0) > limit:
+        if not author.get('fanout_on_read'):
+            mongo.db.users.update_one(
+                {'_id': post['author']},
+                {'$set': {'fanout_on_read': True}}
+            )
+            _pull_authors.clear()
+        return
+
+    batch = []
+    for follower_id in iter_follower_ids(post['author']):
+        batch.append(_timeline_entry(follower_id, post))
+        if len(batch) == 1000:
+            _insert_entries(batch)
+            batch = []
+    if batch:
+        _insert_entries(batch)
+
+
+def _insert_entries(entries):
+    mongo.db.timeline.insert_many(entries, ordered=False)
+    feed_cache.invalidate(*(f"timeline:{entry['owner']}" for entry in entries))
+
+
+def backfill_author(owner_id, author_id):
+    """Copy an author's most recent posts into `owner_id`'s timeline after a follow"""
+    if ObjectId(author_id) in pull_authors():
+        return
+
+    limit = current_app.config.get('TIMELINE_BACKFILL', 50)
+    posts = mongo.db.posts.find(
+        {'author': ObjectId(author_id)},
+        {'author': 1, 'visibility': 1, 'createdAt': 1}
+    ).sort('createdAt', -1).limit(limit)
+
+    ops = [
+        UpdateOne(
+            {'owner': ObjectId(owner_id), 'post_id': post['_id']},
+            {'$setOnInsert': _timeline_entry(ObjectId(owner_id), post)},
+            upsert=True
+        )
+        for post in posts
+    ]
+    if ops:
+        mongo.db.timeline.bulk_write(ops, ordered=False)
+        feed_cache.invalidate(f'timeline:{owner_id}')
+
+
+def remove_author(owner_id, author_id):
+    """Drop an author's posts from `owner_id`'s timeline after an unfollow"""
+    mongo.db.timeline.delete_many({'owner': ObjectId(owner_id), 'author': ObjectId(author_id)})
+    feed_cache.invalidate(f'timeline:{owner_id}')
+
+
+def pull_authors():
+    """Return the set of author ids whose posts are fanned out on read"""
+    authors = _pull_authors.get('authors')
+    if authors is None:
+        authors = {u['_id'] for u in mongo.db.users.find({'fanout_on_read': True}, {'_id': 1})}
+        _pull_authors.set('authors', authors)
+    return authors
+
+
+def read_timeline(user, limit, visibility=None, cursor=None, skip=0):
+    """Return one page of `user`'s home timeline as (createdAt, post_id) pairs.
+
+    Pages are addressed either by a decoded `cursor` (keyset pagination) or,
+    for older clients, by a `skip` offset.
+    """
+    user_id = ObjectId(user['_id'])
+    pulled = list(following_among(user_id, list(pull_authors())))
+
+    query = {'owner': user_id}
+    if visibility:
+        query['visibility'] = visibility
+    if cursor:
+        query.update(keyset_filter(cursor, id_field='post_id'))
+
+    if not pulled:
+        entries = mongo.db.timeline.find(query, {'post_id': 1, 'createdAt': 1}) \
+            .sort(TIMELINE_SORT).skip(skip).limit(limit)
+        return [(entry['createdAt'], entry['post_id']) for entry in entries]
+
+    # Merge the materialized timeline with posts from high-follower authors
+    post_query = {'author': {'$in': pulled}}
+    if visibility:
+        post_query['visibility'] = visibility
+    if cursor:
+        post_query.update(keyset_filter(cursor))
+
+    pushed = mongo.db.timeline.find(query, {'post_id': 1, 'createdAt': 1}) \
+        .sort(TIMELINE_SORT).limit(skip + limit)
+    pulled_posts = mongo.db.posts.find(post_query, {'createdAt': 1}) \
+        .sort([('createdAt', -1), ('_id', -1)]).limit(skip + limit)
+
+    merged = heapq.merge(
+        ((e['createdAt'], e['post_id']) for e in pushed),
+        ((p['createdAt'], p['_id']) for p in pulled_posts),
+        reverse=True
+    )
+
+    # Posts pushed before the author crossed the limit show up in both streams
+    page = []
+    for entry in merged:
+        if not page or page[-1] != entry:
+            page.append(entry)
+    return page[skip:skip + limit]
+
+
+def read_posts(query, limit, cursor=None):
+    """Return one newest-first page of posts matching `query` as (createdAt, _id) pairs"""
+    if cursor:
+        query = dict(query, **keyset_filter(cursor))
+    posts = mongo.db.posts.find(query, {'createdAt': 1}) \
+        .sort([('createdAt', -1), ('_id', -1)]).limit(limit)
+    return [(post['createdAt'], post['_id']) for post in posts]
+
+
+def hydrate_posts(post_ids):
+    """Load posts with their author info, preserving the order of `post_ids`"""
+    if not post_ids:
+        return []
+
+    preview_count = current_app.config.get('COMMENT_PREVIEW_COUNT', 3)
+    posts_cursor = mongo.db.posts.aggregate([
+        {'$match': {'_id': {'$in': post_ids}}},
+        {'$lookup': {
+            'from': 'users',
+            'localField': 'author',
+            'foreignField': '_id',
+            'as': 'author_info'
+        }},
+        {'$unwind': '$author_info'},
+        {'$project': {
+            'content': 1,
+            'images': 1,
+            'images_full': 1,
+            # Posts created before the likes collection still carry an array
+            'like_count': {'$ifNull': ['$like_count', {'$size': {'$ifNull': ['$likes', []]}}]},
+            'legacy_likes': {'$isArray': '$likes'},
+            # Only the count and the newest few comments are shipped with the feed
+            'comment_count': {'$ifNull': ['$comment_count', {'$size': {'$ifNull': ['$comments', []]}}]},
+            'comments': {'$ifNull': ['$recent_comments', {'$slice': [{'$ifNull': ['$comments', []]}, -preview_count]}]},
+            'createdAt': 1,
+            'author': {
+                'id': '$author_info._id',
+                'username': '$author_info.username',
+                'fullName': '$author_info.fullName',
+                'profilePicture': '$author_info.profilePicture'
+            }
+        }}
+    ])
+
+    by_id = {post['_id']: post for post in posts_cursor}
+    return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+
+
+def post_page(entries, limit):
+    """Hydrate (createdAt, post_id) entries into a (posts, next_cursor) page"""
+    next_cursor = None
+    if len(entries) == limit:
+        next_cursor = encode_cursor(*entries[-1])
+    return hydrate_posts([post_id for _, post_id in entries]), next_cursor
+
+
+def attach_viewer_likes(posts, viewer_id):
+    """Set `liked_by_me` on each post with a single query against likes.
+
+    Posts not yet moved off an embedded likes array are checked against the
+    array with one more query, only when the page has any.
+    """
+    if not posts:
+        return posts
+    viewer_id = ObjectId(viewer_id)
+    liked = {
+        like['post_id'] for like in mongo.db.likes.find(
+            {'post_id': {'$in': [post['_id'] for post in posts]}, 'user_id': viewer_id},
+            {'post_id': 1}
+        )
+    }
+    legacy = [post['_id'] for post in posts if post.pop('legacy_likes', False)]
+    if legacy:
+        liked.update(
+            post['_id'] for post in mongo.db.posts.find({'_id': {'$in': legacy}, 'likes': viewer_id}, {'_id': 1})
+        )
+    for post in posts:
+        post['liked_by_me'] = post['_id'] in liked
+    return posts
+
+
+def migrate_post_likes(post):
+    """Move one post's embedded likes array into the likes collection.
+
+    Safe to repeat or race: edges are upserted, and only the write that
+    removes the array sets like_count, before any $inc can reach it.
+    """
+    ops = [
+        UpdateOne(
+            {'post_id': post['_id'], 'user_id': user_id},
+            {'$setOnInsert': {'createdAt': post.get('createdAt', datetime.utcnow())}},
+            upsert=True
+        )
+        for user_id in post.get('likes', [])
+    ]
+    if ops:
+        mongo.db.likes.bulk_write(ops, ordered=False)
+    mongo.db.posts.update_one(
+        {'_id': post['_id'], 'likes': {'$exists': True}},
+        {
+            '$set': {'like_count': mongo.db.likes.count_documents({'post_id': post['_id']})},
+            '$unset': {'likes': ''}
+        }
+    )
+
+
+def rebuild_timeline(user):
+    """Rebuild a user's timeline from scratch out of the posts they follow"""
+    user_id = ObjectId(user['_id'])
+    limit = current_app.config.get('TIMELINE_BACKFILL', 50)
+    mongo.db.timeline.delete_many({'owner': user_id})
+
+    for author_id in [user_id, *iter_following_ids(user_id)]:
+        if author_id != user_id and author_id in pull_authors():
+            continue
+        posts = mongo.db.posts.find(
+            {'author': author_id},
+            {'author': 1, 'visibility': 1, 'createdAt': 1}
+        ).sort('createdAt', -1).limit(limit)
+        entries = [_timeline_entry(user_id, post) for post in posts]
+        if entries:
+            mongo.db.timeline.insert_many(entries, ordered=False)
+    feed_cache.invalidate(f'timeline:{user_id}')
+
+
+def mark_pull_authors():
+    """Flag every author above TIMELINE_FANOUT_LIMIT followers as fan-out-on-read"""
+    limit = current_app.config.get('TIMELINE_FANOUT_LIMIT', 5000)
+    mongo.db.users.update_many({'followersCount': {'$gt': limit}}, {'$set': {'fanout_on_read': True}})
+    mongo.db.users.update_many(
+        {'followersCount': {'$not': {'$gt': limit}}, 'fanout_on_read': True},
+        {'$unset': {'fanout_on_read': ''}}
+    )
+    _pull_authors.clear()
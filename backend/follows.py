@@ -0,0 +1,104 @@
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from extensions import mongo
+from pagination import encode_cursor, keyset_filter
+
+EDGE_SORT = [('createdAt', -1), ('_id', -1)]
+
+# Fields returned for each user in follower/following listings
+USER_SUMMARY = {'username': 1, 'fullName': 1, 'profilePicture': 1}
+
+
+def toggle_follow(follower_id, followee_id):
+    """Follow `followee_id`, or unfollow if the edge already exists.
+
+    Returns True if the user is now following. Relies on the unique
+    (follower, followee) index so the check and the write are one operation.
+    """
+    follower_id = ObjectId(follower_id)
+    followee_id = ObjectId(followee_id)
+
+    try:
+        mongo.db.follows.insert_one({
+            'follower': follower_id,
+            'followee': followee_id,
+            'createdAt': datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        result = mongo.db.follows.delete_one({'follower': follower_id, 'followee': followee_id})
+        if result.deleted_count:
+            _update_counts(follower_id, followee_id, -1)
+        return False
+
+    _update_counts(follower_id, followee_id, 1)
+    return True
+
+
+def _update_counts(follower_id, followee_id, delta):
+    mongo.db.users.update_one({'_id': follower_id}, {'$inc': {'followingCount': delta}})
+    mongo.db.users.update_one({'_id': followee_id}, {'$inc': {'followersCount': delta}})
+
+
+def following_among(follower_id, user_ids):
+    """Return the subset of `user_ids` that `follower_id` follows"""
+    if not user_ids:
+        return set()
+    edges = mongo.db.follows.find(
+        {'follower': ObjectId(follower_id), 'followee': {'$in': [ObjectId(u) for u in user_ids]}},
+        {'followee': 1}
+    )
+    return {edge['followee'] for edge in edges}
+
+
+def iter_follower_ids(followee_id, batch_size=1000):
+    """Yield every follower id of `followee_id` from a batched cursor"""
+    edges = mongo.db.follows.find({'followee': ObjectId(followee_id)}, {'follower': 1}) \
+        .batch_size(batch_size)
+    for edge in edges:
+        yield edge['follower']
+
+
+def iter_following_ids(follower_id, batch_size=1000):
+    """Yield every user id that `follower_id` follows"""
+    edges = mongo.db.follows.find({'follower': ObjectId(follower_id)}, {'followee': 1}) \
+        .batch_size(batch_size)
+    for edge in edges:
+        yield edge['followee']
+
+
+def list_edges(user_id, direction, limit, cursor=None):
+    """Return one page of a user's followers or followings.
+
+    `direction` is 'followers' or 'following'. Returns (users, next_cursor)
+    where users are summaries in newest-follow-first order.
+    """
+    if direction == 'followers':
+        key, other = 'followee', 'follower'
+    else:
+        key, other = 'follower', 'followee'
+
+    query = {key: ObjectId(user_id)}
+    if cursor:
+        query.update(keyset_filter(cursor))
+
+    edges = list(mongo.db.follows.find(query, {other: 1, 'createdAt': 1}).sort(EDGE_SORT).limit(limit))
+    ids = [edge[other] for edge in edges]
+    users = {u['_id']: u for u in mongo.db.users.find({'_id': {'$in': ids}}, USER_SUMMARY)}
+
+    page = []
+    for edge in edges:
+        user = users.get(edge[other])
+        if user:
+            page.append({
+                'id': user['_id'],
+                'username': user.get('username', ''),
+                'fullName': user.get('fullName', ''),
+                'profilePicture': user.get('profilePicture', ''),
+                'followedAt': edge['createdAt']
+            })
+
+    next_cursor = None
+    if len(edges) == limit:
+        next_cursor = encode_cursor(edges[-1]['createdAt'], edges[-1]['_id'])
+    return page, next_cursor
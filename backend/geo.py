@@ -0,0 +1,29 @@
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def parse_point(lat, lng):
+    """Build a GeoJSON Point from latitude/longitude; raises ValueError if out of range"""
+    lat = float(lat)
+    lng = float(lng)
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        raise ValueError('Coordinates out of range')
+    # GeoJSON orders coordinates longitude first
+    return {'type': 'Point', 'coordinates': [lng, lat]}
+
+
+def point_from(data):
+    """Return a GeoJSON Point from `lat`/`lng` keys in `data`, or None if absent"""
+    if data.get('lat') is None or data.get('lng') is None:
+        return None
+    return parse_point(data['lat'], data['lng'])
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
@@ -0,0 +1,63 @@
+"""Gunicorn settings for the Flask API.
+
+Start from the backend directory with `gunicorn app:app`; this file is picked
+up automatically. GUNICORN_PROFILE picks the concurrency model:
+
+  gevent   up to WORKER_CONNECTIONS requests per process on greenlets (default;
+           needed for the long-lived /api/stream connections)
+  gthread  THREADS requests per process on OS threads
+  sync     one request per process (gunicorn's own default model)
+
+Routes spend most of their time waiting on MongoDB, so gthread or gevent
+serve many more concurrent clients from the same number of processes. The
+Mongo pool is sized to the per-process concurrency plus one connection for
+each background thread sharing the client, unless MONGO_MAX_POOL_SIZE is set
+explicitly. Settings are read from the environment and from .env, which is
+loaded here because gunicorn reads this file before it imports the app.
+"""
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+profile = os.getenv('GUNICORN_PROFILE', 'gevent')
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+accesslog = os.getenv('GUNICORN_ACCESSLOG')
+
+# Threads that use the worker's MongoClient next to requests: the counter
+# flusher, the member reconciler and the event tailer, when enabled
+background_threads = sum([
+    float(os.getenv('COUNTER_FLUSH_INTERVAL', 1.0)) > 0,
+    int(os.getenv('MEMBER_RECONCILE_INTERVAL', 0)) > 0,
+    os.getenv('EVENT_BUS_BACKEND', 'local') == 'mongo'
+])
+
+if profile == 'gevent':
+    worker_class = 'gevent'
+    workers = int(os.getenv('WEB_CONCURRENCY', cpus))
+    worker_connections = int(os.getenv('WORKER_CONNECTIONS', 1000))
+    # Greenlets queue on the pool's wait queue instead of opening a socket each
+    pool_size = min(worker_connections, 100)
+elif profile == 'gthread':
+    worker_class = 'gthread'
+    workers = int(os.getenv('WEB_CONCURRENCY', cpus))
+    threads = int(os.getenv('THREADS', 32))
+    pool_size = threads
+else:
+    worker_class = 'sync'
+    workers = int(os.getenv('WEB_CONCURRENCY', cpus * 2 + 1))
+    pool_size = 1
+
+# Background work never makes a request wait for the only socket
+os.environ.setdefault('MONGO_MAX_POOL_SIZE', str(pool_size + background_threads))
+
+
+def worker_exit(server, worker):
+    # Write buffered like/comment/member counters before the worker goes away
+    from counters import counter_buffer
+    counter_buffer.close()
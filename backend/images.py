@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Pillow format -> stored extension for originals
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class InvalidImage(Exception):
+    """Raised when an upload is not an image in one of FORMATS"""
+
+
+class HashingFile:
+    """Write-only file that hashes bytes on their way to a temporary file.
+
+    Used as Werkzeug's stream_factory so multipart bodies go straight to disk
+    in chunks, next to their final location, and the SHA-256 that names the
+    asset is ready when the upload ends without reading the file back.
+    """
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(prefix='.upload-', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def _make_variants(source, directory, digest, sizes, quality):
+    """Write one JPEG per size next to the original; runs in the process pool"""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            # Flatten transparency onto white; JPEG has no alpha
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        for name, size in sizes.items():
+            target = os.path.join(directory, f'{digest}_{name}.jpg')
+            if os.path.exists(target):
+                continue
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            # Write under a temporary name so readers never see half a file
+            fd, tmp = tempfile.mkstemp(prefix='.variant-', dir=directory)
+            with os.fdopen(fd, 'wb') as out:
+                variant.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+            os.replace(tmp, target)
+    return digest
+
+
+class ImageStore:
+    """Content-addressed image storage under UPLOAD_FOLDER.
+
+    Originals are named by the SHA-256 of their bytes and sharded by the first
+    two hex digits (uploads/ab/abcd....jpg), so an image uploaded twice is
+    stored once. Resized JPEG variants are produced on a process pool after
+    the upload returns; until one exists the original is served in its place.
+    """
+
+    def __init__(self):
+        self.folder = 'uploads'
+        self.sizes = {'thumb': 160, 'small': 640, 'large': 1600}
+        self.quality = 82
+        self.workers = 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.folder = app.config.get('UPLOAD_FOLDER', self.folder)
+        self.sizes = app.config.get('IMAGE_SIZES', self.sizes)
+        self.quality = app.config.get('IMAGE_QUALITY', self.quality)
+        self.workers = app.config.get('IMAGE_WORKERS', self.workers)
+        self.shutdown()
+
+    @property
+    def executor(self):
+        # Created lazily so every forked gunicorn worker gets its own pool.
+        # Spawned, not forked: a fork would copy the worker's threads' locks
+        # and its Mongo sockets into the resize processes.
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._executor
+
+    def stream_factory(self, created, max_files=None):
+        """Return a Werkzeug stream_factory whose files are appended to `created`.
+
+        Raises InvalidImage as soon as the body holds more than `max_files`
+        files, before the extra one is written to disk.
+        """
+        files = 0
+
+        def factory(total_content_length, content_type, filename, content_length=None):
+            nonlocal files
+            if filename:
+                files += 1
+                if max_files is not None and files > max_files:
+                    raise InvalidImage('Too many images')
+            stream = HashingFile(self.folder)
+            created.append(stream)
+            return stream
+        return factory
+
+    def shard(self, digest):
+        return os.path.join(self.folder, digest[:2])
+
+    def save(self, stream):
+        """Move an uploaded HashingFile into place; returns (digest, ext, created)"""
+        stream.close()
+        try:
+            with Image.open(stream.path) as image:
+                ext = FORMATS.get(image.format)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+            ext = None
+        if ext is None:
+            os.unlink(stream.path)
+            raise InvalidImage('Only JPEG, PNG, GIF and WebP images are accepted')
+
+        digest = stream.hexdigest()
+        directory = self.shard(digest)
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, f'{digest}.{ext}')
+        if os.path.exists(target):
+            os.unlink(stream.path)
+            return digest, ext, False
+        os.replace(stream.path, target)
+        return digest, ext, True
+
+    def resize_later(self, digest, ext):
+        future = self.executor.submit(
+            _make_variants,
+            os.path.join(self.shard(digest), f'{digest}.{ext}'),
+            self.shard(digest), digest, self.sizes, self.quality
+        )
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception() is not None:
+            logger.error('Resizing image failed: %s', future.exception())
+
+    def original_path(self, digest):
+        """Return the stored original for `digest`, or None"""
+        directory = self.shard(digest)
+        for ext in FORMATS.values():
+            path = os.path.join(directory, f'{digest}.{ext}')
+            if os.path.exists(path):
+                return path
+        return None
+
+    def variant_path(self, digest, name):
+        path = os.path.join(self.shard(digest), f'{digest}_{name}.jpg')
+        return path if os.path.exists(path) else None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def image_url(digest, variant=None):
+    if variant:
+        return f'/api/uploads/{digest}/{variant}'
+    return f'/api/uploads/{digest}'
+
+
+image_store = ImageStore()
@@ -0,0 +1,58 @@
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+from bson import ObjectId, Decimal128, Timestamp
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _default(o):
+    """Encode BSON and date types; dates keep Flask's HTTP date format"""
+    if o.__class__ is ObjectId:
+        # Same as str(o) without the hexlify/decode round trip
+        return o.binary.hex()
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, (datetime, date)):
+        return http_date(o)
+    if isinstance(o, Decimal128):
+        return str(o.to_decimal())
+    if isinstance(o, Timestamp):
+        return http_date(o.as_datetime())
+    return DefaultJSONProvider.default(o)
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes Mongo documents without per-route conversion.
+
+    Uses orjson when it is installed and falls back to the standard library
+    otherwise. Output matches Flask's default provider: ObjectIds become hex
+    strings and datetimes use the HTTP date format.
+    """
+
+    default = staticmethod(_default)
+
+    def _orjson_options(self, indent=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._orjson_options()).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        data = orjson.dumps(obj, default=_default, option=self._orjson_options(indent))
+        return self._app.response_class(data + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,133 @@
+import logging
+import threading
+from bson import ObjectId
+from pymongo import UpdateOne
+from extensions import mongo
+from counters import counter_buffer
+from pagination import encode_cursor, keyset_filter
+from follows import USER_SUMMARY
+
+logger = logging.getLogger(__name__)
+
+MEMBER_SORT = [('createdAt', -1), ('_id', -1)]
+
+
+def move_member(old_neighborhood_id, new_neighborhood_id):
+    """Shift one member between neighborhoods.
+
+    Callers get `old_neighborhood_id` from the same atomic update that set the
+    new location, so concurrent moves of one user can't both count the same
+    departure. Both deltas go through the counter buffer and are written in
+    the same flush.
+    """
+    if old_neighborhood_id == new_neighborhood_id:
+        return
+    if old_neighborhood_id:
+        counter_buffer.incr('neighborhoods', ObjectId(old_neighborhood_id), 'member_count', -1)
+    if new_neighborhood_id:
+        counter_buffer.incr('neighborhoods', ObjectId(new_neighborhood_id), 'member_count', 1)
+
+
+def count_members():
+    """Return {neighborhood ObjectId: member count} from one $group over users"""
+    counts = {}
+    pipeline = [
+        {'$match': {'location.neighborhood_id': {'$exists': True, '$ne': None}}},
+        {'$group': {'_id': '$location.neighborhood_id', 'count': {'$sum': 1}}}
+    ]
+    for row in mongo.db.users.aggregate(pipeline):
+        try:
+            neighborhood_id = ObjectId(row['_id'])
+        except Exception:
+            continue
+        counts[neighborhood_id] = counts.get(neighborhood_id, 0) + row['count']
+    return counts
+
+
+def reconcile_member_counts():
+    """Overwrite every drifted neighborhood member_count; returns the ids fixed.
+
+    Buffered deltas from this process are flushed first. Deltas still pending
+    in other workers land after the reconcile and may leave a count off by a
+    few moves until the next run.
+    """
+    counter_buffer.flush()
+    counts = count_members()
+
+    ops = []
+    fixed = []
+    for neighborhood in mongo.db.neighborhoods.find({}, {'member_count': 1}):
+        expected = counts.get(neighborhood['_id'], 0)
+        if neighborhood.get('member_count') != expected:
+            ops.append(UpdateOne({'_id': neighborhood['_id']}, {'$set': {'member_count': expected}}))
+            fixed.append(neighborhood['_id'])
+    for i in range(0, len(ops), 1000):
+        mongo.db.neighborhoods.bulk_write(ops[i:i + 1000], ordered=False)
+    return fixed
+
+
+def list_members(neighborhood_id, limit, cursor=None):
+    """Return one page of a neighborhood's members, newest accounts first"""
+    query = {'location.neighborhood_id': str(ObjectId(neighborhood_id))}
+    if cursor:
+        query.update(keyset_filter(cursor))
+
+    projection = dict(USER_SUMMARY, createdAt=1)
+    users = list(mongo.db.users.find(query, projection).sort(MEMBER_SORT).limit(limit))
+    page = [
+        {
+            'id': user['_id'],
+            'username': user.get('username', ''),
+            'fullName': user.get('fullName', ''),
+            'profilePicture': user.get('profilePicture', '')
+        }
+        for user in users
+    ]
+
+    next_cursor = None
+    if len(users) == limit:
+        next_cursor = encode_cursor(users[-1]['createdAt'], users[-1]['_id'])
+    return page, next_cursor
+
+
+class MemberReconciler:
+    """Runs `reconcile_member_counts` every MEMBER_RECONCILE_INTERVAL seconds.
+
+    Off by default: each worker would run its own copy, so enable it on one
+    process, or schedule `flask reconcile-members` instead.
+    """
+
+    def __init__(self):
+        self.interval = 0
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self.interval = app.config.get('MEMBER_RECONCILE_INTERVAL', 0)
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='member-reconcile', daemon=True)
+            self._thread.start()
+
+    def on_reconcile(self, listener):
+        """Call `listener(fixed_ids)` after a run that corrected any counts"""
+        self._listeners.append(listener)
+        return listener
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                fixed = reconcile_member_counts()
+            except Exception:
+                logger.exception('Member count reconcile failed')
+                continue
+            if fixed:
+                logger.info('Corrected member_count on %d neighborhoods', len(fixed))
+                for listener in self._listeners:
+                    listener(fixed)
+
+    def stop(self):
+        self._stop.set()
+
+
+member_reconciler = MemberReconciler()
@@ -0,0 +1,125 @@
+import bisect
+import threading
+
+# Latency buckets in seconds, from 0.5 ms to 10 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + list(extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect plus a few adds under a lock"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items())) if labels else ()
+        family = self._families.get(name)
+        if family is None:
+            with self._lock:
+                family = self._families.setdefault(name, {'type': kind, 'help': help_text, 'series': {}})
+        series = family['series'].get(key)
+        if series is None:
+            with self._lock:
+                series = family['series'].setdefault(key, factory())
+        return series
+
+    def histogram(self, name, help_text, labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get('histogram', name, help_text, labels, lambda: Histogram(buckets))
+
+    def counter(self, name, help_text, labels=None):
+        return self._get('counter', name, help_text, labels, Counter)
+
+    def series(self, name):
+        """Return {label tuple: series} for a histogram or counter family"""
+        family = self._families.get(name) or {}
+        return dict(family.get('series', {}))
+
+    def collect(self, name, help_text, fn, kind='gauge'):
+        """Register a metric whose samples come from `fn()` at scrape time.
+
+        `fn` returns a number, or a list of (labels dict, number) pairs.
+        """
+        with self._lock:
+            self._families[name] = {'type': kind, 'help': help_text, 'fn': fn}
+
+    def render(self):
+        lines = []
+        for name, family in sorted(self._families.items()):
+            lines.append(f'# HELP {name} {family["help"]}')
+            lines.append(f'# TYPE {name} {family["type"]}')
+
+            if 'fn' in family:
+                samples = family['fn']()
+                if not isinstance(samples, list):
+                    samples = [({}, samples)]
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(sorted(labels.items()))} {_number(value)}')
+                continue
+
+            for key, series in sorted(family['series'].items()):
+                if family['type'] == 'counter':
+                    lines.append(f'{name}{_labels(key)} {_number(series.value)}')
+                    continue
+                counts, total, count = series.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(series.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{_labels(key, [("le", _number(bound))])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(key)} {_number(total)}')
+                lines.append(f'{name}_count{_labels(key)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,65 @@
+import contextvars
+import logging
+from pymongo import monitoring
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Holds a one-item list while a request is being served so commands can be
+# counted against it; PyMongo calls listeners on the thread issuing the command
+request_commands = contextvars.ContextVar('request_commands', default=None)
+
+
+class CommandLatencyListener(monitoring.CommandListener):
+    """Records per-collection, per-command latency and logs slow commands.
+
+    Registered on the MongoClient through `event_listeners`, so it sees every
+    command the app sends, including those issued outside a request.
+    """
+
+    def __init__(self, slow_ms=100):
+        self.slow_ms = slow_ms
+        # (request_id, connection) -> (command, collection); started events are
+        # the only ones that carry the command document
+        self._inflight = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        if not isinstance(collection, str):
+            collection = ''
+        counter = request_commands.get()
+        if counter is not None:
+            counter[0] += 1
+        self._inflight[(event.request_id, event.connection_id)] = (event.command_name, collection)
+
+    def _finish(self, event, failed):
+        command, collection = self._inflight.pop(
+            (event.request_id, event.connection_id),
+            (event.command_name, '')
+        )
+        seconds = event.duration_micros / 1e6
+        labels = {'command': command, 'collection': collection}
+        metrics.histogram(
+            'mongodb_command_duration_seconds',
+            'Latency of MongoDB commands',
+            labels
+        ).observe(seconds)
+        if failed:
+            metrics.counter(
+                'mongodb_command_failures_total',
+                'MongoDB commands that returned an error',
+                labels
+            ).inc()
+        if seconds * 1000 >= self.slow_ms:
+            logger.warning(
+                'Slow MongoDB command %s on %s took %.1f ms',
+                command, collection or event.database_name, seconds * 1000
+            )
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
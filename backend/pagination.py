@@ -0,0 +1,33 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(created_at, doc_id):
+    """Encode a (createdAt, _id) position as an opaque URL-safe string"""
+    millis = (created_at.replace(tzinfo=None) - EPOCH) // timedelta(milliseconds=1)
+    raw = json.dumps([millis, str(doc_id)], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from `encode_cursor`; raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        millis, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = EPOCH + timedelta(milliseconds=millis)
+        return created_at, ObjectId(doc_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def keyset_filter(cursor, time_field='createdAt', id_field='_id'):
+    """Build a query matching documents strictly after `cursor` in newest-first order"""
+    created_at, doc_id = cursor
+    return {'$or': [
+        {time_field: {'$lt': created_at}},
+        {time_field: created_at, id_field: {'$lt': doc_id}}
+    ]}
@@ -0,0 +1,108 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError
+import bcrypt
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many bcrypt operations are already queued"""
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded worker pool instead of the request thread.
+
+    At most BCRYPT_MAX_PENDING operations may be queued or running at once;
+    beyond that `PasswordHasherBusy` is raised so the route can answer 503
+    straight away rather than tying up the worker behind a login burst.
+    """
+
+    def __init__(self):
+        self.rounds = 12
+        self.workers = os.cpu_count() or 1
+        self.max_pending = self.workers * 4
+        self.timeout = 10
+        self.executor_type = 'thread'
+        self._executor = None
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', self.rounds)
+        self.workers = app.config.get('BCRYPT_WORKERS', self.workers)
+        self.max_pending = app.config.get('BCRYPT_MAX_PENDING', self.workers * 4)
+        self.timeout = app.config.get('BCRYPT_TIMEOUT', self.timeout)
+        self.executor_type = app.config.get('BCRYPT_EXECUTOR', self.executor_type)
+        self.shutdown()
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+
+    @property
+    def executor(self):
+        # Created lazily so every forked gunicorn worker gets its own pool
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.executor_type == 'process':
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    elif _gevent_patched():
+                        # Patched threads are greenlets and bcrypt would block the
+                        # hub; gevent's executor always runs on native threads
+                        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+                        self._executor = NativeThreadPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers,
+                            thread_name_prefix='bcrypt'
+                        )
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._pending.acquire(blocking=False):
+            raise PasswordHasherBusy('Too many password operations in progress')
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy('Password operation timed out')
+
+    def hash_password(self, password):
+        return self._run(_hashpw, password, self.rounds)
+
+    def check_password(self, password, hashed):
+        return self._run(_checkpw, password, hashed)
+
+    def needs_rehash(self, hashed):
+        """Return True if `hashed` was made with a cost other than BCRYPT_ROUNDS"""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,221 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+from pymongo import ReturnDocument
+from extensions import mongo
+from authentication import auth_cache
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rule(rule):
+    """Turn '10/minute' into (capacity, refill rate in tokens per second)"""
+    count, _, period = rule.partition('/')
+    seconds = PERIODS.get(period.strip())
+    if seconds is None or int(count) <= 0:
+        raise ValueError(f'Invalid rate limit {rule!r}')
+    return int(count), int(count) / seconds
+
+
+class MemoryStore:
+    """Token buckets in a bounded in-process LRU; the default and the test store.
+
+    Each worker limits on its own, so N workers allow up to N times the rate.
+    When full, the least recently used bucket is forgotten, which only ever
+    errs towards letting a request through.
+    """
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Take one token; returns 0 if allowed, else seconds until one is available"""
+        now = self.clock()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class MongoStore:
+    """Token buckets shared by every worker, one atomic update per request.
+
+    Documents live in `rate_limits` and expire through a TTL index once the
+    bucket would be full again.
+    """
+
+    def __init__(self, db=None):
+        self._db = db
+
+    @property
+    def collection(self):
+        return (self._db if self._db is not None else mongo.db).rate_limits
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        refilled = {'$min': [capacity, {'$add': [
+            {'$ifNull': ['$tokens', capacity]},
+            {'$multiply': [{'$max': [0, {'$subtract': [now, {'$ifNull': ['$stamp', now]}]}]}, rate]}
+        ]}]}
+        bucket = self.collection.find_one_and_update(
+            {'_id': key},
+            [
+                {'$set': {'tokens': refilled, 'stamp': now}},
+                {'$set': {
+                    'allowed': {'$gte': ['$tokens', 1]},
+                    'tokens': {'$cond': [{'$gte': ['$tokens', 1]}, {'$subtract': ['$tokens', 1]}, '$tokens']},
+                    'expires_at': datetime.utcnow() + timedelta(seconds=capacity / rate)
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket['allowed']:
+            return 0
+        return (1 - bucket['tokens']) / rate
+
+
+# Same algorithm as MemoryStore.take, run atomically inside Redis. The wait is
+# returned as a string because Redis truncates Lua numbers to integers.
+_REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or capacity
+local stamp = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'stamp', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisStore:
+    """Token buckets in Redis (or anything speaking its protocol and Lua)"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATE_LIMIT_STORAGE=redis needs the redis package installed')
+        self.client = redis.Redis.from_url(url)
+        self._take = self.client.register_script(_REDIS_TAKE)
+
+    def take(self, key, capacity, rate):
+        return float(self._take(keys=[f'ratelimit:{key}'], args=[capacity, rate, time.time()]))
+
+
+class RateLimiter:
+    """Per-IP and per-user token buckets for the endpoints in RATE_LIMITS.
+
+    RATE_LIMITS maps an endpoint ('auth.login') or a whole blueprint
+    ('posts') to rules such as {'ip': '10/minute', 'user': '30/minute'}; the
+    endpoint entry wins. A rule of N/period allows bursts of N requests and
+    refills at N per period. 'user' buckets are keyed on the user id in the
+    request's token and fall back to the IP for anonymous requests. Limited
+    requests get a 429 with Retry-After. If the store is unreachable,
+    requests are let through rather than failed.
+
+    Behind reverse proxies or a load balancer, set TRUSTED_PROXIES to the
+    number of hops in front of the app; their X-Forwarded-For then supplies
+    the client address (through ProxyFix, for the whole app). Left at 0, the
+    header is ignored so clients can't pick their own bucket.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.store = MemoryStore()
+        self._rules = {}
+
+    def init_app(self, app):
+        hops = app.config.get('TRUSTED_PROXIES', 0)
+        if hops:
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        storage = app.config.get('RATE_LIMIT_STORAGE', 'memory')
+        if storage == 'mongo':
+            self.store = MongoStore()
+        elif storage == 'redis':
+            self.store = RedisStore(app.config['RATE_LIMIT_REDIS_URL'])
+        else:
+            self.store = MemoryStore(app.config.get('RATE_LIMIT_MEMORY_SIZE', 100000))
+
+        # Parse every rule up front so a typo fails at startup
+        self._rules = {
+            name: [(scope, *parse_rule(rule)) for scope, rule in rules.items()]
+            for name, rules in app.config.get('RATE_LIMITS', {}).items()
+        }
+        app.before_request(self._check)
+
+    def rules_for(self, endpoint):
+        rules = self._rules.get(endpoint)
+        if rules is None and '.' in endpoint:
+            rules = self._rules.get(endpoint.split('.', 1)[0])
+        return rules
+
+    def _client_key(self, scope):
+        if scope == 'user':
+            token = request.headers.get('x-access-token')
+            if token:
+                try:
+                    return f'user:{auth_cache.decode_token(token)}'
+                except Exception:
+                    pass  # token_required rejects it
+        return f'ip:{request.remote_addr}'
+
+    def _check(self):
+        if not self.enabled or request.endpoint is None or request.method == 'OPTIONS':
+            return None
+        rules = self.rules_for(request.endpoint)
+        if not rules:
+            return None
+
+        wait = 0
+        for scope, capacity, rate in rules:
+            key = f'{request.endpoint}:{self._client_key(scope)}'
+            try:
+                wait = max(wait, self.store.take(key, capacity, rate))
+            except Exception as e:
+                logger.error('Rate limit store failed, allowing request: %s', e)
+        if not wait:
+            return None
+
+        metrics.counter(
+            'rate_limited_requests_total',
+            'Requests rejected by the rate limiter',
+            {'endpoint': request.endpoint}
+        ).inc()
+        response = jsonify({'message': 'Too many requests, please slow down'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+        return response
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,51 @@
+import time
+from flask import g, request
+from metrics import metrics
+from mongo_monitoring import request_commands
+
+# Mongo commands issued while serving one request
+COMMAND_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+class RequestMetrics:
+    """Records latency and Mongo round trips for every request by endpoint.
+
+    Labels use the Flask endpoint name rather than the path so ids in URLs
+    don't multiply the series; requests that match no route share one label.
+    """
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def _before(self):
+        g._request_started = time.perf_counter()
+        g._request_commands = [0]
+        g._request_commands_token = request_commands.set(g._request_commands)
+
+    def _after(self, response):
+        started = g.pop('_request_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        metrics.histogram(
+            'http_request_duration_seconds',
+            'Request latency by endpoint, method and status',
+            {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)}
+        ).observe(time.perf_counter() - started)
+        metrics.histogram(
+            'http_request_mongo_commands',
+            'MongoDB commands issued per request',
+            {'endpoint': endpoint},
+            buckets=COMMAND_BUCKETS
+        ).observe(g._request_commands[0])
+        return response
+
+    def _teardown(self, exc):
+        token = g.pop('_request_commands_token', None)
+        if token is not None:
+            request_commands.reset(token)
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,42 @@
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from bson import ObjectId
+from bson.errors import InvalidId
+from authentication import admin_required
+from export import EXPORTS, export_documents, ndjson_chunks, gzip_chunks
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.route('/export/<collection>', methods=['GET'])
+@admin_required
+def export_collection(collection):
+    """Stream a collection as NDJSON in _id order.
+
+    ?after=<_id> resumes after the last line received, ?limit= caps the
+    number of documents and ?gzip=1 compresses the stream.
+    """
+    if collection not in EXPORTS:
+        return jsonify({'message': 'Unknown collection'}), 404
+    
+    try:
+        after = ObjectId(request.args['after']) if request.args.get('after') else None
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except (InvalidId, ValueError):
+        return jsonify({'message': 'Invalid after or limit'}), 400
+    
+    docs = export_documents(
+        collection, after, limit,
+        batch_size=current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    )
+    chunks = ndjson_chunks(docs)
+    filename = f'{collection}.ndjson'
+    mimetype = 'application/x-ndjson'
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    response = current_app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
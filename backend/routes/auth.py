@@ -2,12 +2,29 @@ from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
 from datetime import datetime, timedelta
 import jwt
-import bcrypt
+from pymongo.errors import DuplicateKeyError
 from extensions import mongo
+from passwords import password_hasher, PasswordHasherBusy
+from suggest import suggest_index
 
 # Create blueprint
 auth_bp = Blueprint('auth', __name__)
 
+def duplicate_key_field(error, user):
+    """Return the first field of the unique index that rejected `user`"""
+    key_pattern = (error.details or {}).get('keyPattern')
+    if key_pattern:
+        return next(iter(key_pattern))
+    # Servers before 4.4 don't report the key; only this rare path pays a lookup
+    if mongo.db.users.find_one({'username': user['username']}, {'_id': 1}):
+        return 'username'
+    return 'email'
+
+def busy_response():
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -18,29 +35,31 @@ def register():
         if field not in data or not str(data[field]).strip():
             return jsonify({'message': f'{field} is required'}), 400
     
-    # Check if user already exists
-    if mongo.db.users.find_one({'email': data['email']}):
-        return jsonify({'message': 'Email already registered'}), 400
-    
-    if mongo.db.users.find_one({'username': data['username']}):
-        return jsonify({'message': 'Username already taken'}), 400
-    
     # Hash password
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(data['password'].encode('utf-8'), salt)
+    try:
+        hashed_password = password_hasher.hash_password(data['password'])
+    except PasswordHasherBusy:
+        return busy_response()
     
     # Create user
     user = {
         'fullName': data['fullName'],
         'username': data['username'],
         'email': data['email'].lower(),
-        'password': hashed_password.decode('utf-8'),
+        'password': hashed_password,
         'createdAt': datetime.utcnow(),
         'updatedAt': datetime.utcnow()
     }
     
-    # Insert user into database
-    result = mongo.db.users.insert_one(user)
+    # Insert user into database; the unique email and username indexes
+    # reject duplicates, including two registrations racing each other
+    try:
+        result = mongo.db.users.insert_one(user)
+    except DuplicateKeyError as e:
+        if duplicate_key_field(e, user) == 'username':
+            return jsonify({'message': 'Username already taken'}), 400
+        return jsonify({'message': 'Email already registered'}), 400
+    suggest_index.add_user(user)
     
     # Generate JWT token
     token = jwt.encode(
@@ -75,13 +94,25 @@ def login():
         return jsonify({'message': 'Invalid email or password'}), 401
     
     # Check password
-    if not bcrypt.checkpw(data['password'].encode('utf-8'), user['password'].encode('utf-8')):
-        return jsonify({'message': 'Invalid email or password'}), 401
+    try:
+        if not password_hasher.check_password(data['password'], user['password']):
+            return jsonify({'message': 'Invalid email or password'}), 401
+    except PasswordHasherBusy:
+        return busy_response()
     
     # Update last login time
+    update = {'lastLogin': datetime.utcnow()}
+    
+    # Upgrade the stored hash if BCRYPT_ROUNDS changed since it was made
+    if password_hasher.needs_rehash(user['password']):
+        try:
+            update['password'] = password_hasher.hash_password(data['password'])
+        except PasswordHasherBusy:
+            pass  # Try again on the next login
+    
     mongo.db.users.update_one(
         {'_id': user['_id']},
-        {'$set': {'lastLogin': datetime.utcnow()}}
+        {'$set': update}
     )
     
     # Generate JWT token
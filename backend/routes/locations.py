@@ -1,19 +1,128 @@
-from flask import Blueprint, request, jsonify
+import hashlib
+from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 from extensions import mongo
+from authentication import invalidate_user, token_required
+from feed import read_posts, hydrate_posts, post_page, page_tags, attach_viewer_likes, feed_cache
+from pagination import decode_cursor
+from geo import parse_point, point_from
+from suggest import suggest_index
+from coalesce import ReadCache
+from counters import counter_buffer
+from members import move_member, list_members, member_reconciler
 from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 locations_bp = Blueprint('locations', __name__)
 
+# Rendered directory responses. Concurrent misses share one build, and
+# invalidating while a build runs keeps its result from being cached.
+_directory_cache = ReadCache('directory', maxsize=1024, ttl=300)
+
+def invalidate_directory(key=None):
+    """Drop one cached directory response, or all of them when key is None"""
+    if key is not None:
+        _directory_cache.invalidate(key)
+        return
+    _directory_cache.invalidate()
+
+def invalidate_member_counts(neighborhood_ids):
+    """Drop the neighborhood listings of the cities these neighborhoods belong to.
+
+    member_count only appears in those listings, so the city list and the
+    compact directory stay cached.
+    """
+    city_ids = mongo.db.neighborhoods.distinct('city_id', {'_id': {'$in': list(neighborhood_ids)}})
+    for city_id in city_ids:
+        invalidate_directory(('neighborhoods', str(city_id)))
+
+@counter_buffer.on_flush
+def refresh_member_counts(touched):
+    """Drop cached neighborhood listings once new member counts are written"""
+    if touched.get('neighborhoods'):
+        invalidate_member_counts(touched['neighborhoods'])
+
+@member_reconciler.on_reconcile
+def refresh_reconciled_counts(fixed):
+    invalidate_member_counts(fixed)
+
+def cached_directory_response(key, build):
+    """Serve `build()` from the directory cache with a strong ETag.
+
+    `build` returns the JSON-serializable payload, or None for a 404.
+    Clients sending a matching If-None-Match get an empty 304.
+    """
+    def render():
+        data = build()
+        if data is None:
+            return None
+        body = current_app.json.dumps(data).encode('utf-8')
+        return hashlib.sha1(body).hexdigest(), body
+    
+    entry = _directory_cache.get_or_load(
+        key, render, tags=[key],
+        ttl=current_app.config.get('DIRECTORY_CACHE_TTL', 300)
+    )
+    if entry is None:
+        return None
+    
+    etag, body = entry
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def location_feed(current_user, scope, query):
+    """Serve a cursor-paginated page of posts matching `query`.
+
+    Pages are shared by every viewer in the scope and dropped when a post
+    lands in it; liked_by_me is added per request.
+    """
+    per_page = max(1, min(int(request.args.get('limit', 10)), 50))
+    cursor = None
+    if request.args.get('cursor'):
+        try:
+            cursor = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+    
+    def load():
+        return post_page(read_posts(query, per_page, cursor), per_page)
+    
+    kind, scope_id = scope
+    posts, next_cursor = feed_cache.get_or_load(
+        (kind, scope_id, per_page, cursor), load,
+        tags=[f'{kind}:{scope_id}'],
+        ttl=current_app.config.get('LOCATION_FEED_CACHE_TTL', 5),
+        value_tags=page_tags
+    )
+    posts = attach_viewer_likes([dict(post) for post in posts], current_user['_id'])
+    return jsonify({'posts': posts, 'next_cursor': next_cursor}), 200
+
+def neighborhood_response(neighborhood):
+    """Shape a neighborhoods document like the entries the API has always returned"""
+    response = {
+        'id': str(neighborhood['_id']),
+        'name': neighborhood['name'],
+        'name_lower': neighborhood['name_lower'],
+        'created_at': neighborhood.get('created_at'),
+        'member_count': neighborhood.get('member_count', 0)
+    }
+    if neighborhood.get('location'):
+        lng, lat = neighborhood['location']['coordinates']
+        response.update(lat=lat, lng=lng)
+    return response
+
 @locations_bp.route('/api/locations/cities', methods=['GET'])
 def get_cities():
     """Get a list of all available cities"""
     try:
-        cities = list(mongo.db.cities.find({}, {'neighborhoods': 0}))
-        for city in cities:
-            city['_id'] = str(city['_id'])
-        return jsonify(cities)
+        return cached_directory_response(
+            'cities',
+            lambda: list(mongo.db.cities.find({}, {'neighborhoods': 0}))
+        )
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -21,23 +130,152 @@ def get_cities():
 def get_neighborhoods(city_id):
     """Get neighborhoods for a specific city"""
     try:
-        city = mongo.db.cities.find_one(
-            {'_id': ObjectId(city_id)},
-            {'neighborhoods': 1, 'name': 1}
-        )
-        if not city:
+        city_oid = ObjectId(city_id)
+        
+        def build():
+            city = mongo.db.cities.find_one({'_id': city_oid}, {'name': 1})
+            if not city:
+                return None
+            neighborhoods = mongo.db.neighborhoods.find({'city_id': city_oid}).sort('created_at', 1)
+            return {
+                'city_id': city['_id'],
+                'city_name': city.get('name', ''),
+                'neighborhoods': [neighborhood_response(n) for n in neighborhoods]
+            }
+        
+        response = cached_directory_response(('neighborhoods', str(city_oid)), build)
+        if response is None:
             return jsonify({'message': 'City not found'}), 404
-            
-        return jsonify({
-            'city_id': str(city['_id']),
-            'city_name': city.get('name', ''),
-            'neighborhoods': city.get('neighborhoods', [])
-        })
+        return response
     except InvalidId:
         return jsonify({'message': 'Invalid city ID'}), 400
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
+@locations_bp.route('/api/locations/directory', methods=['GET'])
+def get_directory():
+    """Get every city with its neighborhoods in one compact payload"""
+    def build():
+        by_city = {}
+        for n in mongo.db.neighborhoods.find({}, {'city_id': 1, 'name': 1}).sort('name_lower', 1):
+            by_city.setdefault(n['city_id'], []).append({'id': n['_id'], 'name': n['name']})
+        
+        cities = mongo.db.cities.find(
+            {},
+            {'name': 1, 'state': 1, 'country': 1}
+        ).sort('name_lower', 1)
+        return [{
+            'id': city['_id'],
+            'name': city.get('name', ''),
+            'state': city.get('state', ''),
+            'country': city.get('country', ''),
+            'neighborhoods': by_city.get(city['_id'], [])
+        } for city in cities]
+    
+    try:
+        return cached_directory_response('directory', build)
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@locations_bp.route('/api/locations/neighborhoods/<neighborhood_id>/members', methods=['GET'])
+@token_required
+def get_neighborhood_members(current_user, neighborhood_id):
+    """Get the users living in a neighborhood, newest accounts first"""
+    try:
+        per_page = max(1, min(int(request.args.get('limit', 20)), 100))
+        cursor = None
+        if request.args.get('cursor'):
+            try:
+                cursor = decode_cursor(request.args['cursor'])
+            except ValueError:
+                return jsonify({'message': 'Invalid cursor'}), 400
+        
+        users, next_cursor = list_members(neighborhood_id, per_page, cursor)
+        return jsonify({'users': users, 'next_cursor': next_cursor}), 200
+    except InvalidId:
+        return jsonify({'message': 'Invalid neighborhood ID'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@locations_bp.route('/api/locations/neighborhoods/<neighborhood_id>/posts', methods=['GET'])
+@token_required
+def get_neighborhood_posts(current_user, neighborhood_id):
+    """Get the newest posts from a neighborhood"""
+    try:
+        query = {'neighborhood_id': ObjectId(neighborhood_id)}
+        return location_feed(current_user, ('neighborhood', str(query['neighborhood_id'])), query)
+    except InvalidId:
+        return jsonify({'message': 'Invalid neighborhood ID'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@locations_bp.route('/api/locations/cities/<city_id>/posts', methods=['GET'])
+@token_required
+def get_city_posts(current_user, city_id):
+    """Get the newest city-wide posts from a city"""
+    try:
+        query = {'city_id': ObjectId(city_id), 'visibility': 'city'}
+        return location_feed(current_user, ('city', str(query['city_id'])), query)
+    except InvalidId:
+        return jsonify({'message': 'Invalid city ID'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@locations_bp.route('/api/locations/nearby', methods=['GET'])
+@token_required
+def get_nearby(current_user):
+    """Get neighborhoods and recent posts near a point, closest first"""
+    try:
+        near = parse_point(request.args['lat'], request.args['lng'])
+        radius = float(request.args.get('radius', 1000))  # meters
+        limit = max(1, min(int(request.args.get('limit', 20)), 50))
+    except (KeyError, ValueError):
+        return jsonify({'message': 'Valid lat and lng are required'}), 400
+    # Also false for NaN
+    if not 0 <= radius:
+        return jsonify({'message': 'radius must be a non-negative number of meters'}), 400
+    radius = min(radius, 50000)
+    
+    try:
+        neighborhoods = list(mongo.db.neighborhoods.aggregate([
+            {'$geoNear': {
+                'near': near,
+                'distanceField': 'distance',
+                'maxDistance': radius,
+                'spherical': True
+            }},
+            {'$limit': limit}
+        ]))
+        
+        max_age = current_app.config.get('NEARBY_POST_MAX_AGE', 7 * 24 * 3600)
+        nearby_posts = list(mongo.db.posts.aggregate([
+            {'$geoNear': {
+                'near': near,
+                'distanceField': 'distance',
+                'maxDistance': radius,
+                'spherical': True,
+                'query': {'createdAt': {'$gte': datetime.utcnow() - timedelta(seconds=max_age)}}
+            }},
+            {'$limit': limit},
+            {'$project': {'distance': 1, 'location': 1}}
+        ]))
+        
+        nearby = {post['_id']: post for post in nearby_posts}
+        posts = attach_viewer_likes(hydrate_posts(list(nearby)), current_user['_id'])
+        for post in posts:
+            lng, lat = nearby[post['_id']]['location']['coordinates']
+            post.update(lat=lat, lng=lng, distance=round(nearby[post['_id']]['distance']))
+        
+        return jsonify({
+            'neighborhoods': [
+                dict(neighborhood_response(n), city_id=n['city_id'], distance=round(n['distance']))
+                for n in neighborhoods
+            ],
+            'posts': posts
+        }), 200
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
 @locations_bp.route('/api/locations/cities', methods=['POST'])
 def create_city():
     """Create a new city"""
@@ -63,13 +301,15 @@ def create_city():
             'state': data.get('state', ''),
             'country': data.get('country', 'USA'),
             'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow(),
-            'neighborhoods': []
+            'updated_at': datetime.utcnow()
         }
         
-        result = mongo.db.cities.insert_one(city_data)
-        city_data['_id'] = str(result.inserted_id)
+        mongo.db.cities.insert_one(city_data)
+        invalidate_directory('cities')
+        invalidate_directory('directory')
+        suggest_index.add_city(city_data)
         city_data.pop('name_lower', None)
+        city_data['neighborhoods'] = []
         
         return jsonify({
             'message': 'City created successfully',
@@ -89,38 +329,46 @@ def add_neighborhood(city_id):
     
     try:
         # Check if city exists
-        city = mongo.db.cities.find_one({'_id': ObjectId(city_id)})
+        city = mongo.db.cities.find_one({'_id': ObjectId(city_id)}, {'_id': 1})
         if not city:
             return jsonify({'message': 'City not found'}), 404
         
-        # Check if neighborhood already exists
         neighborhood_name = data['name'].strip()
         neighborhood_lower = neighborhood_name.lower()
         
-        for neighborhood in city.get('neighborhoods', []):
-            if neighborhood.get('name_lower') == neighborhood_lower:
-                return jsonify({
-                    'message': 'Neighborhood already exists in this city',
-                    'neighborhood': neighborhood
-                }), 400
+        try:
+            centroid = point_from(data)
+        except ValueError:
+            return jsonify({'message': 'Invalid coordinates'}), 400
         
-        # Create new neighborhood
+        # Create new neighborhood; the unique (city_id, name_lower) index
+        # rejects duplicates
         new_neighborhood = {
-            'id': str(ObjectId()),
+            'city_id': city['_id'],
             'name': neighborhood_name,
             'name_lower': neighborhood_lower,
             'created_at': datetime.utcnow(),
             'member_count': 0
         }
+        if centroid:
+            new_neighborhood['location'] = centroid
         
-        # Add neighborhood to city
-        mongo.db.cities.update_one(
-            {'_id': ObjectId(city_id)},
-            {'$push': {'neighborhoods': new_neighborhood}}
-        )
+        try:
+            mongo.db.neighborhoods.insert_one(new_neighborhood)
+        except DuplicateKeyError:
+            existing = mongo.db.neighborhoods.find_one(
+                {'city_id': city['_id'], 'name_lower': neighborhood_lower}
+            )
+            return jsonify({
+                'message': 'Neighborhood already exists in this city',
+                'neighborhood': neighborhood_response(existing)
+            }), 400
+        invalidate_directory(('neighborhoods', str(city['_id'])))
+        invalidate_directory('directory')
+        suggest_index.add_neighborhood(new_neighborhood)
         
         # Remove internal fields from response
-        response_neighborhood = new_neighborhood.copy()
+        response_neighborhood = neighborhood_response(new_neighborhood)
         response_neighborhood.pop('name_lower', None)
         
         return jsonify({
@@ -142,50 +390,42 @@ def update_user_location(user_id):
         return jsonify({'message': 'City ID and Neighborhood ID are required'}), 400
     
     try:
-        # Check if user exists
-        user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
-        if not user:
-            return jsonify({'message': 'User not found'}), 404
-        
-        # Check if city exists and contains the neighborhood
-        city = mongo.db.cities.find_one(
-            {'_id': ObjectId(data['city_id']), 'neighborhoods.id': data['neighborhood_id']},
-            {'name': 1, 'neighborhoods.$': 1}
+        # Check the neighborhood exists and belongs to the city
+        neighborhood = mongo.db.neighborhoods.find_one(
+            {'_id': ObjectId(data['neighborhood_id']), 'city_id': ObjectId(data['city_id'])},
+            {'name': 1}
         )
+        city = mongo.db.cities.find_one({'_id': ObjectId(data['city_id'])}, {'name': 1})
         
-        if not city:
+        if not city or not neighborhood:
             return jsonify({'message': 'City or neighborhood not found'}), 404
         
-        # Get neighborhood name
-        neighborhood = next(
-            (n for n in city['neighborhoods'] if n['id'] == data['neighborhood_id']),
-            None
-        )
-        
-        if not neighborhood:
-            return jsonify({'message': 'Neighborhood not found'}), 404
-        
         # Update user's location
         update_data = {
             'location': {
-                'city_id': data['city_id'],
+                'city_id': str(city['_id']),
                 'city_name': city['name'],
-                'neighborhood_id': data['neighborhood_id'],
+                'neighborhood_id': str(neighborhood['_id']),
                 'neighborhood_name': neighborhood['name']
             },
             'updated_at': datetime.utcnow()
         }
         
-        mongo.db.users.update_one(
+        # Swap the location and read the old one in a single atomic write
+        previous = mongo.db.users.find_one_and_update(
             {'_id': ObjectId(user_id)},
-            {'$set': update_data}
+            {'$set': update_data},
+            projection={'location.neighborhood_id': 1},
+            return_document=ReturnDocument.BEFORE
         )
+        if not previous:
+            return jsonify({'message': 'User not found'}), 404
+        invalidate_user(user_id)
         
-        # Update neighborhood member count
-        mongo.db.cities.update_one(
-            {'_id': ObjectId(data['city_id']), 'neighborhoods.id': data['neighborhood_id']},
-            {'$inc': {'neighborhoods.$.member_count': 1}}
-        )
+        # Move the member count; the directory is refreshed when the buffered
+        # counts are written
+        old_neighborhood_id = (previous.get('location') or {}).get('neighborhood_id')
+        move_member(old_neighborhood_id, update_data['location']['neighborhood_id'])
         
         return jsonify({
             'message': 'Location updated successfully',
@@ -1,35 +1,43 @@
-from functools import wraps
-from flask import Blueprint, request, jsonify, current_app, g
+from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
-import jwt
 from extensions import mongo
+from authentication import token_required
+from feed import fanout_post, read_timeline, post_page, page_tags, attach_viewer_likes, feed_cache, migrate_post_likes
+from pagination import encode_cursor, decode_cursor, keyset_filter
+from geo import point_from
+from counters import counter_buffer
+from images import image_store, image_url, DIGEST_RE
+from events import event_bus
+from schema import requires_indexes
 
 posts_bp = Blueprint('posts', __name__)
 
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Check if token is in the headers
-        if 'x-access-token' in request.headers:
-            token = request.headers['x-access-token']
-            
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-            
-        try:
-            data = jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=["HS256"])
-            current_user = mongo.db.users.find_one({'_id': ObjectId(data['user_id'])})
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
-            g.current_user = current_user
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
-            
-        return f(current_user, *args, **kwargs)
-    return decorated
+def post_topics(post):
+    """Event topics a post is visible on: its author, neighborhood and city"""
+    topics = [f"author:{post['author']}"]
+    if post.get('neighborhood_id'):
+        topics.append(f"neighborhood:{post['neighborhood_id']}")
+    if post.get('city_id') and post.get('visibility') == 'city':
+        topics.append(f"city:{post['city_id']}")
+    return topics
+
+def publish_post(post, author):
+    event_bus.publish('post', post_topics(post), current_app.json.dumps({
+        'id': post['_id'],
+        'content': post['content'],
+        'images': post['images'],
+        'visibility': post['visibility'],
+        'createdAt': post['createdAt'],
+        'author': {
+            'id': author['_id'],
+            'username': author.get('username', ''),
+            'fullName': author.get('fullName', ''),
+            'profilePicture': author.get('profilePicture', '')
+        }
+    }))
 
 @posts_bp.route('', methods=['POST'])
 @posts_bp.route('/', methods=['POST'])
@@ -41,18 +49,51 @@ def create_post(current_user):
         if not data.get('content'):
             return jsonify({'message': 'Post content is required'}), 400
         
+        try:
+            point = point_from(data)
+        except ValueError:
+            return jsonify({'message': 'Invalid coordinates'}), 400
+        
+        # Uploaded images are referenced by id; the feed shows the small
+        # variant and links the original. Plain URLs are kept as given.
+        images, images_full = [], []
+        for image in data.get('images', []):
+            if isinstance(image, str) and DIGEST_RE.match(image):
+                if not image_store.original_path(image):
+                    return jsonify({'message': 'Unknown image'}), 400
+                images.append(image_url(image, 'small'))
+                images_full.append(image_url(image))
+            else:
+                images.append(image)
+                images_full.append(image)
+        
         post = {
             'content': data['content'],
-            'images': data.get('images', []),
+            'images': images,
+            'images_full': images_full,
             'author': ObjectId(current_user['_id']),
             'visibility': data.get('visibility', 'neighborhood'),  # Default to neighborhood
-            'likes': [],
-            'comments': [],
+            'like_count': 0,
+            'comment_count': 0,
+            'recent_comments': [],
             'createdAt': datetime.utcnow(),
             'updatedAt': datetime.utcnow()
         }
         
+        # Stamp the author's location so neighborhood and city feeds can find it
+        location = current_user.get('location') or {}
+        if location.get('city_id'):
+            post['city_id'] = ObjectId(location['city_id'])
+        if location.get('neighborhood_id'):
+            post['neighborhood_id'] = ObjectId(location['neighborhood_id'])
+        
+        if point:
+            post['location'] = point
+        
         post_id = mongo.db.posts.insert_one(post).inserted_id
+        fanout_post(post, current_user)
+        feed_cache.invalidate(*post_topics(post))
+        publish_post(post, current_user)
         
         return jsonify({
             'message': 'Post created successfully',
@@ -68,94 +109,196 @@ def create_post(current_user):
 def get_posts(current_user):
     try:
         # Get pagination parameters
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('limit', 10))
-        skip = (page - 1) * per_page
+        try:
+            per_page = max(1, min(int(request.args.get('limit', 10)), 50))
+            page = int(request.args.get('page', 1))
+        except ValueError:
+            return jsonify({'message': 'Invalid limit or page'}), 400
+        if page < 1:
+            return jsonify({'message': 'Invalid limit or page'}), 400
         
         # Get visibility filter from query params
         visibility = request.args.get('visibility')
+        if visibility not in ['city', 'neighborhood']:
+            visibility = None
         
-        # Get posts from users that current_user follows
-        following = current_user.get('following', []) + [ObjectId(current_user['_id'])]
-        
-        # Build match query
-        match_query = {'author': {'$in': following}}
+        user_id = str(current_user['_id'])
         
-        # Add visibility filter if provided
-        if visibility in ['city', 'neighborhood']:
-            match_query['visibility'] = visibility
-        
-        # Query posts with pagination
-        posts_cursor = mongo.db.posts.aggregate([
-            {'$match': match_query},
-            {'$sort': {'createdAt': -1}},
-            {'$skip': skip},
-            {'$limit': per_page},
-            {'$lookup': {
-                'from': 'users',
-                'localField': 'author',
-                'foreignField': '_id',
-                'as': 'author_info'
-            }},
-            {'$unwind': '$author_info'},
-            {'$project': {
-                'content': 1,
-                'images': 1,
-                'likes': 1,
-                'comments': 1,
-                'createdAt': 1,
-                'author': {
-                    'id': '$author_info._id',
-                    'username': '$author_info.username',
-                    'fullName': '$author_info.fullName',
-                    'profilePicture': '$author_info.profilePicture'
-                }
-            }}
-        ])
+        # Legacy offset pagination, kept for clients that still send ?page=
+        legacy = 'page' in request.args
+        if legacy:
+            key = ('timeline', user_id, visibility, per_page, 'page', page)
+            def load():
+                skip = (page - 1) * per_page
+                return post_page(read_timeline(current_user, per_page, visibility, skip=skip), per_page)
+        else:
+            cursor = None
+            if request.args.get('cursor'):
+                try:
+                    cursor = decode_cursor(request.args['cursor'])
+                except ValueError:
+                    return jsonify({'message': 'Invalid cursor'}), 400
+            key = ('timeline', user_id, visibility, per_page, cursor)
+            def load():
+                return post_page(read_timeline(current_user, per_page, visibility, cursor=cursor), per_page)
         
-        posts = list(posts_cursor)
+        # Repeated reads of the same page share one query; liked_by_me is per viewer
+        posts, next_cursor = feed_cache.get_or_load(
+            key, load,
+            tags=[f'timeline:{user_id}'],
+            ttl=current_app.config.get('TIMELINE_CACHE_TTL', 2),
+            value_tags=page_tags
+        )
+        posts = attach_viewer_likes([dict(post) for post in posts], current_user['_id'])
         
-        # Convert ObjectId to string for JSON serialization
-        for post in posts:
-            post['_id'] = str(post['_id'])
-            post['author']['id'] = str(post['author']['id'])
-            post['likes'] = [str(like) for like in post.get('likes', [])]
-            
-            # Format comments
-            for comment in post.get('comments', []):
-                if 'user' in comment and isinstance(comment['user'], ObjectId):
-                    comment['user'] = str(comment['user'])
+        if legacy:
+            return jsonify(posts), 200
         
-        return jsonify(posts), 200
+        return jsonify({'posts': posts, 'next_cursor': next_cursor}), 200
         
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
 @posts_bp.route('/<post_id>/like', methods=['POST'])
 @posts_bp.route('/<post_id>/like/', methods=['POST'])
+@requires_indexes('likes')
 @token_required
 def like_post(current_user, post_id):
     try:
-        post = mongo.db.posts.find_one({'_id': ObjectId(post_id)})
+        post_id = ObjectId(post_id)
+        user_id = ObjectId(current_user['_id'])
+        
+        # The post document itself is only written by the counter flush
+        post = mongo.db.posts.find_one(
+            {'_id': post_id},
+            {'author': 1, 'visibility': 1, 'city_id': 1, 'neighborhood_id': 1, 'likes': 1, 'createdAt': 1}
+        )
         if not post:
             return jsonify({'message': 'Post not found'}), 404
         
-        user_id = ObjectId(current_user['_id'])
+        # Older posts still embed their likes; move them over before the
+        # first toggle so the count starts from the array, not from zero
+        if 'likes' in post:
+            migrate_post_likes(post)
         
-        # Toggle like
-        if user_id in post.get('likes', []):
-            mongo.db.posts.update_one(
-                {'_id': ObjectId(post_id)},
-                {'$pull': {'likes': user_id}}
-            )
+        # Toggle like: the unique (post_id, user_id) index decides which way
+        try:
+            mongo.db.likes.insert_one({
+                'post_id': post_id,
+                'user_id': user_id,
+                'createdAt': datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            result = mongo.db.likes.delete_one({'post_id': post_id, 'user_id': user_id})
+            if result.deleted_count:
+                counter_buffer.incr('posts', post_id, 'like_count', -1)
             return jsonify({'message': 'Post unliked', 'liked': False}), 200
-        else:
-            mongo.db.posts.update_one(
-                {'_id': ObjectId(post_id)},
-                {'$addToSet': {'likes': user_id}},
-                upsert=True
-            )
-            return jsonify({'message': 'Post liked', 'liked': True}), 200
+        
+        counter_buffer.incr('posts', post_id, 'like_count', 1)
+        event_bus.publish(
+            'like',
+            post_topics(post) + [f"user:{post['author']}"],
+            current_app.json.dumps({
+                'post_id': post_id,
+                'user': {'id': user_id, 'username': current_user['username']}
+            })
+        )
+        return jsonify({'message': 'Post liked', 'liked': True}), 200
             
     except Exception as e:
         return jsonify({'message': str(e)}), 500
+
+@posts_bp.route('/<post_id>/comments', methods=['POST'])
+@token_required
+def create_comment(current_user, post_id):
+    try:
+        data = request.get_json()
+        
+        if not data.get('text') or not str(data['text']).strip():
+            return jsonify({'message': 'Comment text is required'}), 400
+        
+        post_id = ObjectId(post_id)
+        comment = {
+            'post_id': post_id,
+            'user': ObjectId(current_user['_id']),
+            'username': current_user['username'],
+            'text': data['text'].strip(),
+            'createdAt': datetime.utcnow()
+        }
+        mongo.db.comments.insert_one(comment)
+        
+        # Keep the count and the newest few comments on the post for the feed
+        preview = {k: comment[k] for k in ('_id', 'user', 'username', 'text', 'createdAt')}
+        result = mongo.db.posts.update_one(
+            {'_id': post_id},
+            {
+                '$inc': {'comment_count': 1},
+                '$push': {'recent_comments': {
+                    '$each': [preview],
+                    '$slice': -current_app.config.get('COMMENT_PREVIEW_COUNT', 3)
+                }}
+            }
+        )
+        if not result.matched_count:
+            mongo.db.comments.delete_one({'_id': comment['_id']})
+            return jsonify({'message': 'Post not found'}), 404
+        feed_cache.invalidate(f'post:{post_id}')
+        
+        comment.pop('post_id')
+        return jsonify({
+            'message': 'Comment added successfully',
+            'comment': comment
+        }), 201
+        
+    except InvalidId:
+        return jsonify({'message': 'Invalid post ID'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@posts_bp.route('/<post_id>/comments', methods=['GET'])
+@token_required
+def get_comments(current_user, post_id):
+    try:
+        per_page = max(1, min(int(request.args.get('limit', 20)), 100))
+        query = {'post_id': ObjectId(post_id)}
+        
+        if request.args.get('cursor'):
+            try:
+                query.update(keyset_filter(decode_cursor(request.args['cursor'])))
+            except ValueError:
+                return jsonify({'message': 'Invalid cursor'}), 400
+        
+        comments = list(mongo.db.comments.aggregate([
+            {'$match': query},
+            {'$sort': {'createdAt': -1, '_id': -1}},
+            {'$limit': per_page},
+            {'$lookup': {
+                'from': 'users',
+                'localField': 'user',
+                'foreignField': '_id',
+                'as': 'author_info'
+            }},
+            # Keep comments whose author was deleted, under the stored username
+            {'$unwind': {'path': '$author_info', 'preserveNullAndEmptyArrays': True}},
+            {'$project': {
+                'text': 1,
+                'createdAt': 1,
+                'author': {
+                    'id': '$user',
+                    'username': {'$ifNull': ['$author_info.username', '$username']},
+                    'fullName': '$author_info.fullName',
+                    'profilePicture': '$author_info.profilePicture'
+                }
+            }}
+        ]))
+        
+        next_cursor = None
+        if len(comments) == per_page:
+            next_cursor = encode_cursor(comments[-1]['createdAt'], comments[-1]['_id'])
+        
+        return jsonify({'comments': comments, 'next_cursor': next_cursor}), 200
+        
+    except InvalidId:
+        return jsonify({'message': 'Invalid post ID'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
@@ -0,0 +1,23 @@
+from flask import Blueprint, request, jsonify
+from authentication import token_required
+from suggest import suggest_index
+
+search_bp = Blueprint('search', __name__)
+
+@search_bp.route('/suggest', methods=['GET'])
+@token_required
+def suggest(current_user):
+    """Autocomplete cities, neighborhoods and usernames by prefix"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 25))
+        kinds = None
+        if request.args.get('types'):
+            kinds = [k for k in request.args['types'].split(',') if k in suggest_index.kinds]
+            if not kinds:
+                return jsonify({'message': 'types must include city, neighborhood or user'}), 400
+        
+        suggestions = suggest_index.search(request.args.get('q', ''), limit, kinds)
+        return jsonify({'suggestions': suggestions}), 200
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
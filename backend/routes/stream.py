@@ -0,0 +1,133 @@
+import queue
+import uuid
+from datetime import datetime, timedelta
+import jwt
+from flask import Blueprint, request, jsonify, current_app
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from extensions import mongo
+from authentication import auth_cache, token_required
+from events import event_bus
+from follows import iter_following_ids
+
+stream_bp = Blueprint('stream', __name__)
+
+SCOPES = ('neighborhood', 'city', 'following')
+
+def redeem_ticket(ticket):
+    """Return the user id of an unused, unexpired stream ticket, or None.
+
+    Tickets are marked used in `stream_tickets` so each one opens a single
+    stream, whichever worker it reaches.
+    """
+    try:
+        data = jwt.decode(ticket, current_app.config['JWT_SECRET'], algorithms=['HS256'], audience='stream')
+    except jwt.InvalidTokenError:
+        return None
+    try:
+        mongo.db.stream_tickets.insert_one({
+            '_id': data['jti'],
+            'expires_at': datetime.utcfromtimestamp(data['exp'])
+        })
+    except DuplicateKeyError:
+        return None
+    return data['user_id']
+
+def stream_user():
+    """Resolve the user from x-access-token, or ?ticket= for EventSource clients.
+
+    EventSource can't send headers, and an API token in the URL would end up
+    in access logs, so browsers trade their token for a short-lived ticket.
+    """
+    try:
+        token = request.headers.get('x-access-token')
+        if token:
+            return auth_cache.get_user(auth_cache.decode_token(token))
+        ticket = request.args.get('ticket')
+        user_id = redeem_ticket(ticket) if ticket else None
+        return auth_cache.get_user(user_id) if user_id else None
+    except Exception:
+        return None
+
+def topics_for(user, scopes):
+    user_id = str(user['_id'])
+    topics = {f'user:{user_id}'}
+    location = user.get('location') or {}
+    if 'neighborhood' in scopes and location.get('neighborhood_id'):
+        topics.add(f"neighborhood:{location['neighborhood_id']}")
+    if 'city' in scopes and location.get('city_id'):
+        topics.add(f"city:{location['city_id']}")
+    if 'following' in scopes:
+        topics.add(f'author:{user_id}')
+        topics.update(f'author:{author_id}' for author_id in iter_following_ids(user_id))
+    return topics
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {event['data']}\n\n"
+
+@stream_bp.route('/ticket', methods=['POST'])
+@token_required
+def create_ticket(current_user):
+    """Issue a single-use ticket for opening the stream with ?ticket=.
+
+    A ticket is only good for STREAM_TICKET_TTL seconds and one connection,
+    so clients fetch a new one before every (re)connect.
+    """
+    ttl = current_app.config.get('STREAM_TICKET_TTL', 30)
+    ticket = jwt.encode(
+        {
+            'user_id': str(current_user['_id']),
+            # The audience keeps tickets from passing as API tokens
+            'aud': 'stream',
+            'jti': uuid.uuid4().hex,
+            'exp': datetime.utcnow() + timedelta(seconds=ttl)
+        },
+        current_app.config['JWT_SECRET'],
+        algorithm='HS256'
+    )
+    return jsonify({'ticket': ticket, 'expires_in': ttl}), 201
+
+@stream_bp.route('', methods=['GET'])
+def stream():
+    """Server-sent events for the current user's neighborhood, city and followings"""
+    current_user = stream_user()
+    if not current_user:
+        return jsonify({'message': 'Token is missing or invalid!'}), 401
+    
+    scopes = set(request.args.get('scopes', ','.join(SCOPES)).split(',')) & set(SCOPES)
+    user_id = ObjectId(current_user['_id'])
+    sub = event_bus.subscribe(topics_for(current_user, scopes))
+    keepalive = current_app.config.get('STREAM_KEEPALIVE', 15)
+    
+    def generate():
+        try:
+            # Ask EventSource to reconnect quickly after a drop
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = sub.get(timeout=keepalive)
+                except queue.Empty:
+                    # Comment line; keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    yield 'event: dropped\ndata: {}\n\n'
+                    return
+                
+                # Start or stop following an author's posts without reconnecting
+                meta = event.get('meta') or {}
+                if event['type'] == 'follow' and meta.get('follower') == user_id and 'following' in scopes:
+                    topic = f"author:{meta['followee']}"
+                    if meta.get('following'):
+                        event_bus.update(sub, add=[topic])
+                    else:
+                        event_bus.update(sub, remove=[topic])
+                yield format_event(event)
+        finally:
+            event_bus.unsubscribe(sub)
+    
+    response = current_app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
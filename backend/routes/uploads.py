@@ -0,0 +1,85 @@
+import os
+from flask import Blueprint, request, jsonify, current_app, send_file
+from werkzeug.exceptions import HTTPException
+from werkzeug.formparser import parse_form_data
+from authentication import token_required
+from images import image_store, image_url, InvalidImage, DIGEST_RE
+
+uploads_bp = Blueprint('uploads', __name__)
+
+# Assets are content-addressed, so a stored file never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def upload_response(digest):
+    response = {'id': digest, 'url': image_url(digest)}
+    for name in image_store.sizes:
+        response[name] = image_url(digest, name)
+    return response
+
+@uploads_bp.route('', methods=['POST'])
+@token_required
+def upload_images(current_user):
+    """Store multipart image uploads and queue their resized variants"""
+    created = []
+    try:
+        # Parse the body ourselves so each file streams through a hashing
+        # temp file instead of Werkzeug's default spooled buffer; the factory
+        # stops the parse at the first file past IMAGE_MAX_FILES
+        _, _, files = parse_form_data(
+            request.environ,
+            stream_factory=image_store.stream_factory(
+                created, current_app.config.get('IMAGE_MAX_FILES', 10)
+            ),
+            max_content_length=current_app.config.get('MAX_CONTENT_LENGTH'),
+            silent=False
+        )
+        uploads = [f for _, f in files.items(multi=True) if f.filename]
+        
+        if not uploads:
+            return jsonify({'message': 'No image uploaded'}), 400
+        
+        images = []
+        for upload in uploads:
+            digest, ext, new = image_store.save(upload.stream)
+            if new:
+                image_store.resize_later(digest, ext)
+            images.append(upload_response(digest))
+        
+        return jsonify({'images': images}), 201
+    except InvalidImage as e:
+        return jsonify({'message': str(e)}), 400
+    except HTTPException:
+        raise
+    except ValueError as e:
+        return jsonify({'message': f'Malformed upload: {e}'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+    finally:
+        # Temp files that weren't moved into place
+        for stream in created:
+            stream.close()
+            if os.path.exists(stream.path):
+                os.unlink(stream.path)
+
+@uploads_bp.route('/<digest>', methods=['GET'])
+@uploads_bp.route('/<digest>/<variant>', methods=['GET'])
+def get_image(digest, variant=None):
+    """Serve an original or resized image, falling back to the original"""
+    if not DIGEST_RE.match(digest) or (variant and variant not in image_store.sizes):
+        return jsonify({'message': 'Image not found'}), 404
+    
+    path = image_store.variant_path(digest, variant) if variant else None
+    exact = path is not None or variant is None
+    path = path or image_store.original_path(digest)
+    if not path:
+        return jsonify({'message': 'Image not found'}), 404
+    
+    # A fallback is replaced once the variant is ready, so keep it short-lived
+    response = send_file(
+        os.path.abspath(path),
+        max_age=IMMUTABLE_MAX_AGE if exact else 60,
+        conditional=True
+    )
+    if exact:
+        response.headers['Cache-Control'] += ', immutable'
+    return response
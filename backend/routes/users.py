@@ -1,50 +1,31 @@
-from functools import wraps
-from flask import Blueprint, request, jsonify, current_app, g
+from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime
-import jwt
 from extensions import mongo
+from authentication import token_required, invalidate_user, USER_PROJECTION
+from feed import backfill_author, remove_author
+from follows import toggle_follow, following_among, list_edges
+from pagination import decode_cursor
+from events import event_bus
+from schema import requires_indexes
 
 users_bp = Blueprint('users', __name__)
 
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Check if token is in the headers
-        if 'x-access-token' in request.headers:
-            token = request.headers['x-access-token']
-            
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-            
-        try:
-            data = jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=["HS256"])
-            current_user = mongo.db.users.find_one({'_id': ObjectId(data['user_id'])})
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
-            g.current_user = current_user
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
-            
-        return f(current_user, *args, **kwargs)
-    return decorated
-
 @users_bp.route('/me', methods=['GET'])
 @token_required
 def get_me(current_user):
     try:
         # Remove sensitive data before sending response
         user = {
-            'id': str(current_user['_id']),
+            'id': current_user['_id'],
             'username': current_user['username'],
             'email': current_user['email'],
             'fullName': current_user.get('fullName', ''),
             'bio': current_user.get('bio', ''),
             'profilePicture': current_user.get('profilePicture', ''),
-            'followers': [str(follower) for follower in current_user.get('followers', [])],
-            'following': [str(following) for following in current_user.get('following', [])],
+            'followersCount': current_user.get('followersCount', 0),
+            'followingCount': current_user.get('followingCount', 0),
             'createdAt': current_user.get('createdAt', datetime.utcnow())
         }
         
@@ -57,19 +38,19 @@ def get_me(current_user):
 @token_required
 def get_user(current_user, user_id):
     try:
-        user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+        user = mongo.db.users.find_one({'_id': ObjectId(user_id)}, USER_PROJECTION)
         if not user:
             return jsonify({'message': 'User not found'}), 404
             
         # Remove sensitive data
         user_data = {
-            'id': str(user['_id']),
+            'id': user['_id'],
             'username': user['username'],
             'fullName': user.get('fullName', ''),
             'bio': user.get('bio', ''),
             'profilePicture': user.get('profilePicture', ''),
-            'followers': [str(follower) for follower in user.get('followers', [])],
-            'following': [str(following) for following in user.get('following', [])],
+            'followersCount': user.get('followersCount', 0),
+            'followingCount': user.get('followingCount', 0),
             'createdAt': user.get('createdAt', datetime.utcnow())
         }
         
@@ -79,6 +60,7 @@ def get_user(current_user, user_id):
         return jsonify({'message': str(e)}), 500
 
 @users_bp.route('/<user_id>/follow', methods=['POST'])
+@requires_indexes('follows')
 @token_required
 def follow_user(current_user, user_id):
     try:
@@ -87,38 +69,83 @@ def follow_user(current_user, user_id):
             return jsonify({'message': 'You cannot follow yourself'}), 400
             
         # Check if target user exists
-        target_user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+        target_user = mongo.db.users.find_one({'_id': ObjectId(user_id)}, {'_id': 1})
         if not target_user:
             return jsonify({'message': 'User not found'}), 404
             
         current_user_id = ObjectId(current_user['_id'])
         target_user_id = ObjectId(user_id)
         
-        # Check if already following
-        if target_user_id in current_user.get('following', []):
-            # Unfollow
-            mongo.db.users.update_one(
-                {'_id': current_user_id},
-                {'$pull': {'following': target_user_id}}
-            )
-            mongo.db.users.update_one(
-                {'_id': target_user_id},
-                {'$pull': {'followers': current_user_id}}
-            )
+        # Follow, or unfollow if already following
+        following = toggle_follow(current_user_id, target_user_id)
+        invalidate_user(current_user_id, target_user_id)
+        event_bus.publish(
+            'follow',
+            [f'user:{target_user_id}', f'user:{current_user_id}'],
+            current_app.json.dumps({
+                'follower': {'id': current_user_id, 'username': current_user['username']},
+                'followee': {'id': target_user_id},
+                'following': following
+            }),
+            follower=current_user_id, followee=target_user_id, following=following
+        )
+        if not following:
+            remove_author(current_user_id, target_user_id)
             return jsonify({'message': 'User unfollowed', 'following': False}), 200
-        else:
-            # Follow
-            mongo.db.users.update_one(
-                {'_id': current_user_id},
-                {'$addToSet': {'following': target_user_id}},
-                upsert=True
-            )
-            mongo.db.users.update_one(
-                {'_id': target_user_id},
-                {'$addToSet': {'followers': current_user_id}},
-                upsert=True
-            )
-            return jsonify({'message': 'User followed', 'following': True}), 200
+        
+        backfill_author(current_user_id, target_user_id)
+        return jsonify({'message': 'User followed', 'following': True}), 200
             
     except Exception as e:
         return jsonify({'message': str(e)}), 500
+
+@users_bp.route('/<user_id>/followers', methods=['GET'])
+@token_required
+def get_followers(current_user, user_id):
+    return list_users(user_id, 'followers')
+
+@users_bp.route('/<user_id>/following', methods=['GET'])
+@token_required
+def get_following(current_user, user_id):
+    return list_users(user_id, 'following')
+
+def list_users(user_id, direction):
+    try:
+        per_page = max(1, min(int(request.args.get('limit', 20)), 100))
+        cursor = None
+        if request.args.get('cursor'):
+            try:
+                cursor = decode_cursor(request.args['cursor'])
+            except ValueError:
+                return jsonify({'message': 'Invalid cursor'}), 400
+        
+        users, next_cursor = list_edges(user_id, direction, per_page, cursor)
+        return jsonify({'users': users, 'next_cursor': next_cursor}), 200
+        
+    except InvalidId:
+        return jsonify({'message': 'Invalid user ID'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@users_bp.route('/following/check', methods=['POST'])
+@token_required
+def check_following(current_user):
+    """Report which of the given users the current user follows"""
+    try:
+        data = request.get_json(silent=True) or {}
+        user_ids = data.get('user_ids') or []
+        
+        if not isinstance(user_ids, list) or len(user_ids) > 500:
+            return jsonify({'message': 'user_ids must be a list of at most 500 ids'}), 400
+        if not all(isinstance(user_id, str) and ObjectId.is_valid(user_id) for user_id in user_ids):
+            return jsonify({'message': 'Invalid user ID'}), 400
+        
+        followed = following_among(current_user['_id'], user_ids)
+        return jsonify({
+            'following': {user_id: ObjectId(user_id) in followed for user_id in user_ids}
+        }), 200
+        
+    except InvalidId:
+        return jsonify({'message': 'Invalid user ID'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
@@ -0,0 +1,164 @@
+import logging
+from datetime import datetime
+from functools import wraps
+from flask import jsonify
+from pymongo import IndexModel, ASCENDING, DESCENDING, GEOSPHERE
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever INDEXES changes so running deployments pick the change up
+SCHEMA_VERSION = 4
+
+INDEXES = {
+    'users': [
+        # Login looks users up by email; register relies on these being unique
+        IndexModel([('email', ASCENDING)], unique=True),
+        IndexModel([('username', ASCENDING)], unique=True),
+        IndexModel([('fanout_on_read', ASCENDING)], sparse=True),
+        # Member listings and the member_count reconcile
+        IndexModel([
+            ('location.neighborhood_id', ASCENDING),
+            ('createdAt', DESCENDING), ('_id', DESCENDING)
+        ])
+    ],
+    'cities': [
+        # Unique city names (case-insensitive)
+        IndexModel([('name_lower', ASCENDING)], unique=True)
+    ],
+    'neighborhoods': [
+        # Neighborhood names are unique within a city (case-insensitive)
+        IndexModel([('city_id', ASCENDING), ('name_lower', ASCENDING)], unique=True),
+        IndexModel([('location', GEOSPHERE)])
+    ],
+    'timeline': [
+        # Home timelines are read newest-first per owner
+        IndexModel([('owner', ASCENDING), ('createdAt', DESCENDING), ('post_id', DESCENDING)]),
+        IndexModel([('owner', ASCENDING), ('post_id', ASCENDING)], unique=True),
+        IndexModel([('owner', ASCENDING), ('author', ASCENDING)])
+    ],
+    'posts': [
+        # Keyset pagination over an author's posts
+        IndexModel([('author', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)]),
+        # Location feeds
+        IndexModel([('neighborhood_id', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([
+            ('city_id', ASCENDING), ('visibility', ASCENDING),
+            ('createdAt', DESCENDING), ('_id', DESCENDING)
+        ]),
+        # Nearby queries; documents without coordinates are left out of the index
+        IndexModel([('location', GEOSPHERE)])
+    ],
+    'likes': [
+        # One like per user per post; also serves liked_by_me lookups
+        IndexModel([('post_id', ASCENDING), ('user_id', ASCENDING)], unique=True)
+    ],
+    'comments': [
+        # Comments are paged newest-first per post
+        IndexModel([('post_id', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)])
+    ],
+    'follows': [
+        # Follow graph edges, listed newest-first from either side
+        IndexModel([('follower', ASCENDING), ('followee', ASCENDING)], unique=True),
+        IndexModel([('followee', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('follower', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)])
+    ],
+    'rate_limits': [
+        # Buckets from RATE_LIMIT_STORAGE=mongo go away once they are full again
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0)
+    ],
+    'stream_tickets': [
+        # Used stream tickets only need remembering until they expire
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0)
+    ]
+}
+
+
+def schema_version(db):
+    """Return the schema version recorded in the meta collection, or 0"""
+    doc = db.meta.find_one({'_id': 'schema'}, {'version': 1})
+    return doc.get('version', 0) if doc else 0
+
+
+# Collections whose indexes failed to build in this process. Routes that
+# toggle on DuplicateKeyError (likes, follows) must not run without them.
+_failed = set()
+
+
+def normalize_emails(db):
+    """Lowercase stored emails so the unique email index can be built.
+
+    Older registrations compared the raw email but stored it lowercased, so
+    case variants may exist. Users whose lowercased email is already taken
+    are left alone and returned; those need merging by hand.
+    """
+    conflicts = []
+    for user in db.users.find({'email': {'$regex': '[A-Z]'}}, {'email': 1}):
+        lower = user['email'].lower()
+        if db.users.find_one({'email': lower, '_id': {'$ne': user['_id']}}, {'_id': 1}):
+            conflicts.append(user['email'])
+            continue
+        db.users.update_one({'_id': user['_id']}, {'$set': {'email': lower}})
+    return conflicts
+
+
+def apply_indexes(db):
+    """Create every declared index; returns (created, failures).
+
+    create_index is a no-op for indexes that already exist with the same
+    options, so this is safe to run repeatedly and from several processes.
+    Each collection is applied on its own so one failure (e.g. duplicates
+    blocking a unique index) doesn't leave the others unbuilt. SCHEMA_VERSION
+    is only recorded once every collection succeeded.
+    """
+    conflicts = normalize_emails(db)
+    if conflicts:
+        logger.error('Emails differing only in case block the unique email index: %s', ', '.join(conflicts))
+
+    created, failures = {}, {}
+    for collection, indexes in INDEXES.items():
+        try:
+            created[collection] = db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            failures[collection] = str(e)
+
+    _failed.clear()
+    _failed.update(failures)
+    if not failures:
+        db.meta.update_one(
+            {'_id': 'schema'},
+            {'$set': {'version': SCHEMA_VERSION, 'appliedAt': datetime.utcnow()}},
+            upsert=True
+        )
+    return created, failures
+
+
+def ensure_schema(db):
+    """Apply indexes only when the stored version is behind SCHEMA_VERSION.
+
+    A current database costs a single primary-key read at startup. Failures
+    are logged rather than raised so a worker can still boot and
+    `flask apply-indexes` can be run; routes guarded by `requires_indexes`
+    answer 503 until their collections' indexes exist.
+    """
+    if schema_version(db) >= SCHEMA_VERSION:
+        return False
+    created, failures = apply_indexes(db)
+    for collection, error in failures.items():
+        logger.error('Indexes on %s failed, run `flask apply-indexes`: %s', collection, error)
+    return not failures
+
+
+def requires_indexes(*collections):
+    """Answer 503 while any of `collections` is missing its indexes"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            missing = [c for c in collections if c in _failed]
+            if missing:
+                return jsonify({
+                    'message': f'Unavailable until indexes on {", ".join(missing)} are built'
+                }), 503
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
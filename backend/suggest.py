@@ -0,0 +1,157 @@
+import bisect
+import logging
+import threading
+import time
+from extensions import mongo
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixIndex:
+    """Sorted array of lowercase keys searched by prefix with bisect.
+
+    Lookups are O(log n + k) for k results and inserts are O(n) memmoves,
+    which stays well under a millisecond for the few hundred thousand names
+    the directory and user list hold.
+    """
+
+    def __init__(self, items=()):
+        pairs = sorted(items, key=lambda item: item[0])
+        self._keys = [key for key, _ in pairs]
+        self._entries = [entry for _, entry in pairs]
+        self._lock = threading.Lock()
+
+    def add(self, key, entry):
+        with self._lock:
+            i = bisect.bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self._entries.insert(i, entry)
+
+    def search(self, prefix, limit=10):
+        """Return up to `limit` entries whose key starts with `prefix`, in key order"""
+        results = []
+        with self._lock:
+            i = bisect.bisect_left(self._keys, prefix)
+            while i < len(self._keys) and len(results) < limit:
+                if not self._keys[i].startswith(prefix):
+                    break
+                results.append(self._entries[i])
+                i += 1
+        return results
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def _city_item(city):
+    return city['name_lower'], {'type': 'city', 'id': str(city['_id']), 'name': city['name']}
+
+
+def _neighborhood_item(neighborhood):
+    return neighborhood['name_lower'], {
+        'type': 'neighborhood',
+        'id': str(neighborhood['_id']),
+        'name': neighborhood['name'],
+        'city_id': str(neighborhood['city_id'])
+    }
+
+
+def _user_item(user):
+    return user['username'].lower(), {'type': 'user', 'id': str(user['_id']), 'name': user['username']}
+
+
+class SuggestIndex:
+    """Per-worker prefix indexes over cities, neighborhoods and usernames.
+
+    Built lazily from Mongo on the first query and rebuilt every
+    SUGGEST_INDEX_TTL seconds so writes handled by other workers show up.
+    The rebuild runs on a background thread while queries keep using the
+    stale index. Writes handled by this worker are added incrementally
+    straight away.
+    """
+
+    kinds = ('city', 'neighborhood', 'user')
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._indexes = None
+        self._built_at = 0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SUGGEST_INDEX_TTL', self.ttl)
+        self._indexes = None
+
+    def build(self):
+        indexes = {
+            'city': PrefixIndex(
+                _city_item(c) for c in mongo.db.cities.find({}, {'name': 1, 'name_lower': 1})
+            ),
+            'neighborhood': PrefixIndex(
+                _neighborhood_item(n)
+                for n in mongo.db.neighborhoods.find({}, {'name': 1, 'name_lower': 1, 'city_id': 1})
+            ),
+            'user': PrefixIndex(
+                _user_item(u) for u in mongo.db.users.find({}, {'username': 1})
+            )
+        }
+        self._indexes = indexes
+        self._built_at = time.monotonic()
+        return indexes
+
+    def indexes(self):
+        indexes = self._indexes
+        if indexes is None:
+            with self._lock:
+                # Another thread may have built it while we waited
+                indexes = self._indexes
+                if indexes is None:
+                    indexes = self.build()
+        elif time.monotonic() - self._built_at > self.ttl:
+            self._rebuild_in_background()
+        return indexes
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name='suggest-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Suggest index rebuild failed; serving the stale one')
+        finally:
+            self._rebuilding = False
+
+    def search(self, prefix, limit=10, kinds=None):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        indexes = self.indexes()
+        results = []
+        for kind in kinds or self.kinds:
+            results.extend(indexes[kind].search(prefix, limit - len(results)))
+            if len(results) >= limit:
+                break
+        return results
+
+    def _add(self, kind, item):
+        # Nothing to do before the first build; it will read the new document
+        if self._indexes is not None:
+            self._indexes[kind].add(*item)
+
+    def add_city(self, city):
+        self._add('city', _city_item(city))
+
+    def add_neighborhood(self, neighborhood):
+        self._add('neighborhood', _neighborhood_item(neighborhood))
+
+    def add_user(self, user):
+        self._add('user', _user_item(user))
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,51 @@
+"""A test app running on mongomock (see requirements-dev.txt).
+
+Import this before `app` so Flask-PyMongo connects to mongomock instead of
+a real server. Collections and the process-local caches are shared by every
+test, so call `reset()` in setUp.
+"""
+import os
+import flask_pymongo
+import mongomock
+from mongomock_compat import patch_mongomock
+
+patch_mongomock()
+flask_pymongo.MongoClient = mongomock.MongoClient
+
+# Write counters through and keep the limiter out of the way
+os.environ.setdefault('COUNTER_FLUSH_INTERVAL', '0')
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from app import create_app
+from extensions import mongo
+from authentication import auth_cache
+from feed import feed_cache, _pull_authors
+from routes.locations import invalidate_directory
+
+app = create_app()
+app.config['TESTING'] = True
+
+
+def reset():
+    """Empty every collection and drop cached users, feeds, pull authors and directories"""
+    with app.app_context():
+        for name in mongo.db.list_collection_names():
+            mongo.db[name].delete_many({})
+    auth_cache.clear()
+    feed_cache.invalidate()
+    _pull_authors.clear()
+    invalidate_directory()
+
+
+def register(client, username):
+    """Register a user; returns (token, user id)"""
+    response = client.post('/api/auth/register', json={
+        'username': username,
+        'email': f'{username}@example.com',
+        'password': 'Test@123',
+        'fullName': username.title()
+    })
+    assert response.status_code == 201, response.get_data(as_text=True)
+    data = response.get_json()
+    return data['token'], data['user']['id']
@@ -0,0 +1,18 @@
+"""Patches that let mongomock (see requirements-dev.txt) run the app's queries.
+
+Shared by the tests (through fakemongo) and benchmarks/bench_api.py.
+"""
+import inspect
+from mongomock import collection
+
+
+def patch_mongomock():
+    """Apply the patches; safe to call more than once"""
+    # PyMongo 4.11+ passes a `sort` option through UpdateOne that mongomock
+    # 4.3 doesn't accept; UpdateOne never sets it here, so it is dropped
+    add_update = collection.BulkOperationBuilder.add_update
+    if 'sort' not in inspect.signature(add_update).parameters:
+        def add_update_without_sort(self, *args, sort=None, **kwargs):
+            return add_update(self, *args, **kwargs)
+
+        collection.BulkOperationBuilder.add_update = add_update_without_sort
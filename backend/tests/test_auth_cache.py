@@ -0,0 +1,76 @@
+import unittest
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+import jwt
+from cache import TTLCache
+from authentication import AuthCache
+
+class TestTTLCache(unittest.TestCase):
+    def test_hit_and_miss_counters(self):
+        """Test that lookups are counted as hits or misses"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test that the cache never grows past maxsize"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+    def test_entries_expire(self):
+        """Test that entries are dropped once their TTL runs out"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set('a', 1, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+class TestAuthCache(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['JWT_SECRET'] = 'test-secret'
+        self.cache = AuthCache(maxsize=10, ttl=60)
+
+    def make_token(self, user_id, expires_in):
+        return jwt.encode(
+            {'user_id': user_id, 'exp': datetime.utcnow() + timedelta(seconds=expires_in)},
+            self.app.config['JWT_SECRET'],
+            algorithm='HS256'
+        )
+
+    def test_decoded_tokens_are_cached(self):
+        """Test that a token is only verified once"""
+        token = self.make_token('abc', 3600)
+        with self.app.app_context():
+            self.assertEqual(self.cache.decode_token(token), 'abc')
+            self.assertEqual(self.cache.decode_token(token), 'abc')
+        self.assertEqual(self.cache.tokens.hits, 1)
+        self.assertEqual(self.cache.tokens.misses, 1)
+
+    def test_invalid_token_is_rejected(self):
+        """Test that a token signed with another secret raises"""
+        token = jwt.encode({'user_id': 'abc'}, 'other-secret', algorithm='HS256')
+        with self.app.app_context():
+            with self.assertRaises(jwt.InvalidTokenError):
+                self.cache.decode_token(token)
+        self.assertEqual(len(self.cache.tokens), 0)
+
+    def test_invalidate_user(self):
+        """Test that invalidation drops the cached user document"""
+        self.cache.users.set('abc', {'_id': 'abc', 'username': 'test'})
+        self.cache.invalidate_user('abc')
+        self.assertIsNone(self.cache.users.get('abc'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import threading
+import unittest
+from coalesce import ReadCache, SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving during a load wait for it instead of running their own"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def load():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'page'
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', load)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('k', load))) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('page', False)] + [('page', True)] * 4)
+
+    def test_errors_reach_every_caller(self):
+        """Test that a failed load raises in the leader and is not remembered"""
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            flight.do('k', fail)
+        self.assertEqual(flight.do('k', lambda: 1), (1, False))
+
+class TestReadCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ReadCache('test', maxsize=16, ttl=60)
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return {'posts': [{'_id': 'p1'}], 'n': self.loads}
+
+    def test_hits_within_ttl(self):
+        """Test that a repeated read is served from the cache"""
+        first = self.cache.get_or_load('k', self.load, tags=['neighborhood:1'])
+        second = self.cache.get_or_load('k', self.load, tags=['neighborhood:1'])
+        self.assertIs(first, second)
+        self.assertEqual(self.loads, 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hit'], stats['executed']), (1, 1))
+        self.assertEqual(stats['dedupe_ratio'], 0.5)
+
+    def test_invalidate_by_tag(self):
+        """Test that invalidating a tag reloads only the entries carrying it"""
+        self.cache.get_or_load('a', self.load, tags=['neighborhood:1'])
+        self.cache.get_or_load('b', self.load, tags=['neighborhood:2'])
+        self.cache.invalidate('neighborhood:1')
+        self.assertEqual(self.cache.get_or_load('a', self.load, tags=['neighborhood:1'])['n'], 3)
+        self.assertEqual(self.cache.get_or_load('b', self.load, tags=['neighborhood:2'])['n'], 2)
+
+    def test_value_tags(self):
+        """Test that tags derived from the loaded value also invalidate it"""
+        value_tags = lambda value: [f"post:{post['_id']}" for post in value['posts']]
+        self.cache.get_or_load('a', self.load, value_tags=value_tags)
+        self.cache.invalidate('post:p1')
+        self.assertEqual(self.cache.get_or_load('a', self.load, value_tags=value_tags)['n'], 2)
+
+    def test_write_during_load_is_not_cached(self):
+        """Test that a result loaded across an invalidation of its tags is not kept"""
+        def racing_load():
+            self.cache.invalidate('neighborhood:1')
+            return self.load()
+
+        self.cache.get_or_load('a', racing_load, tags=['neighborhood:1'])
+        self.assertEqual(self.cache.get_or_load('a', self.load, tags=['neighborhood:1'])['n'], 2)
+
+    def test_invalidate_all_and_none_results(self):
+        """Test that invalidate() with no tags clears everything and None is never cached"""
+        self.cache.get_or_load('a', self.load)
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get_or_load('a', self.load)['n'], 2)
+        self.assertIsNone(self.cache.get_or_load('missing', lambda: None))
+        self.assertIsNone(self.cache.get_or_load('missing', lambda: None))
+        self.assertEqual(self.cache.stats()['executed'], 4)
+
+if __name__ == '__main__':
+    unittest.main()
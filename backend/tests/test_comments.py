@@ -0,0 +1,74 @@
+import unittest
+from datetime import datetime
+from bson import ObjectId
+import fakemongo
+from extensions import mongo
+
+class TestComments(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.token, self.user_id = fakemongo.register(self.client, 'alice')
+        response = self.client.post('/api/posts', json={'content': 'hello'}, headers={'x-access-token': self.token})
+        self.post_id = response.get_json()['postId']
+
+    def comments(self, query=''):
+        return self.client.get(f'/api/posts/{self.post_id}/comments{query}', headers={'x-access-token': self.token})
+
+    def test_comments_by_deleted_users_are_kept(self):
+        """Test that a comment outlives its author under the stored username"""
+        _, bob_id = fakemongo.register(self.client, 'bob')
+        with fakemongo.app.app_context():
+            mongo.db.comments.insert_one({
+                'post_id': ObjectId(self.post_id),
+                'user': ObjectId(bob_id),
+                'username': 'bob',
+                'text': 'bye',
+                'createdAt': datetime.utcnow()
+            })
+            mongo.db.users.delete_one({'_id': ObjectId(bob_id)})
+
+        comments = self.comments().get_json()['comments']
+        self.assertEqual(len(comments), 1)
+        self.assertEqual(comments[0]['author']['username'], 'bob')
+
+    def test_limit_below_one_is_clamped(self):
+        """Test that limit=0 still returns a page instead of failing"""
+        self.client.post(f'/api/posts/{self.post_id}/comments', json={'text': 'hi'}, headers={'x-access-token': self.token})
+        response = self.comments('?limit=0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['comments']), 1)
+
+class TestMigrateComments(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.runner = fakemongo.app.test_cli_runner()
+
+    def test_rerun_does_not_duplicate(self):
+        """Test that running migrate-comments again after a crash copies nothing twice"""
+        user_id = ObjectId()
+        with fakemongo.app.app_context():
+            mongo.db.users.insert_one({'_id': user_id, 'username': 'carol'})
+            post_id = mongo.db.posts.insert_one({
+                'createdAt': datetime(2024, 1, 1),
+                'comments': [
+                    {'_id': ObjectId(), 'user': user_id, 'text': 'first', 'createdAt': datetime(2024, 1, 2)},
+                    {'user': user_id, 'text': 'no id'}
+                ]
+            }).inserted_id
+
+            # Simulate a crash after the comments were copied but before the $unset
+            self.runner.invoke(args=['migrate-comments'])
+            mongo.db.posts.update_one({'_id': post_id}, {
+                '$set': {'comments': mongo.db.posts.find_one({'_id': post_id}, {'recent_comments': 1})['recent_comments']}
+            })
+            result = self.runner.invoke(args=['migrate-comments'])
+
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual(mongo.db.comments.count_documents({'post_id': post_id}), 2)
+            post = mongo.db.posts.find_one({'_id': post_id})
+            self.assertEqual(post['comment_count'], 2)
+            self.assertNotIn('comments', post)
+
+if __name__ == '__main__':
+    unittest.main()
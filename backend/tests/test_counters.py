@@ -0,0 +1,113 @@
+import unittest
+from pymongo.errors import AutoReconnect, BulkWriteError, OperationFailure
+from counters import CounterBuffer
+
+class FakeCollection:
+    def __init__(self, fail=None):
+        self.batches = []
+        self.fail = fail
+
+    def bulk_write(self, ops, ordered=True):
+        if self.fail:
+            raise self.fail
+        self.batches.append([(op._filter, op._doc) for op in ops])
+
+    def update_one(self, query, update):
+        self.batches.append([(query, update)])
+
+class FakeDb(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+class TestCounterBuffer(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDb()
+        self.buffer = CounterBuffer(interval=60, max_pending=100, db=self.db)
+
+    def tearDown(self):
+        self.buffer._stop.set()
+
+    def test_deltas_are_coalesced(self):
+        """Test that increments to one document become a single $inc"""
+        for _ in range(5):
+            self.buffer.incr('posts', 'p1', 'like_count', 1)
+        self.buffer.incr('posts', 'p1', 'like_count', -1)
+        self.buffer.incr('posts', 'p2', 'like_count', 1)
+        self.buffer.incr('neighborhoods', 'n1', 'member_count', 1)
+        self.assertEqual(self.db, {})
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(self.db['posts'].batches, [[
+            ({'_id': 'p1'}, {'$inc': {'like_count': 4}}),
+            ({'_id': 'p2'}, {'$inc': {'like_count': 1}})
+        ]])
+        self.assertEqual(self.db['neighborhoods'].batches, [[
+            ({'_id': 'n1'}, {'$inc': {'member_count': 1}})
+        ]])
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_deltas_that_cancel_out_are_not_written(self):
+        """Test that a like followed by an unlike costs no write"""
+        self.buffer.incr('posts', 'p1', 'like_count', 1)
+        self.buffer.incr('posts', 'p1', 'like_count', -1)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.db, {})
+
+    def test_size_threshold_flushes(self):
+        """Test that reaching max_pending documents flushes immediately"""
+        self.buffer.max_pending = 2
+        self.buffer.incr('posts', 'p1', 'like_count', 1)
+        self.assertEqual(self.db, {})
+        self.buffer.incr('posts', 'p2', 'like_count', 1)
+        self.assertEqual(len(self.db['posts'].batches), 1)
+
+    def test_failed_flush_is_retried(self):
+        """Test that deltas survive a bulk_write rejected before writing anything"""
+        self.db['posts'] = FakeCollection(fail=OperationFailure('not primary'))
+        self.buffer.incr('posts', 'p1', 'like_count', 2)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.buffer.incr('posts', 'p1', 'like_count', 1)
+        self.db['posts'].fail = None
+        self.buffer.flush()
+        self.assertEqual(self.db['posts'].batches, [[({'_id': 'p1'}, {'$inc': {'like_count': 3}})]])
+
+    def test_partial_bulk_failure_retries_only_failed_ops(self):
+        """Test that applied ops of a BulkWriteError are not written twice"""
+        self.db['posts'] = FakeCollection(fail=BulkWriteError({
+            'writeErrors': [{'index': 1, 'code': 11000, 'errmsg': 'boom'}], 'nInserted': 0
+        }))
+        touched = []
+        self.buffer.on_flush(touched.append)
+        self.buffer.incr('posts', 'p1', 'like_count', 2)
+        self.buffer.incr('posts', 'p2', 'like_count', 5)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(touched, [{'posts': {'p1'}}])
+        self.db['posts'].fail = None
+        self.buffer.flush()
+        self.assertEqual(self.db['posts'].batches, [[({'_id': 'p2'}, {'$inc': {'like_count': 5}})]])
+
+    def test_interrupted_flush_is_not_replayed(self):
+        """Test that deltas are dropped when a network error hides what was applied"""
+        self.db['posts'] = FakeCollection(fail=AutoReconnect('connection reset'))
+        self.buffer.incr('posts', 'p1', 'like_count', 2)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.db['posts'].fail = None
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.db['posts'].batches, [])
+
+    def test_flush_listeners(self):
+        """Test that listeners hear which documents were written"""
+        touched = []
+        self.buffer.on_flush(touched.append)
+        self.buffer.incr('neighborhoods', 'n1', 'member_count', 1)
+        self.buffer.close()
+        self.assertEqual(touched, [{'neighborhoods': {'n1'}}])
+
+    def test_zero_interval_writes_through(self):
+        """Test that buffering can be turned off"""
+        self.buffer.interval = 0
+        self.buffer.incr('posts', 'p1', 'like_count', 1)
+        self.assertEqual(self.db['posts'].batches, [[({'_id': 'p1'}, {'$inc': {'like_count': 1}})]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import unittest
+from dotenv import dotenv_values
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so the example's settings (rate limiting,
+# buffered counters) don't leak into the shared test app
+CHECK = """
+import fakemongo
+from extensions import mongo_client_options
+app = fakemongo.app
+print(sorted(mongo_client_options(app.config)))
+print(app.test_client().get('/api/admin/export/users', headers={'X-Admin-Token': ''}).status_code)
+"""
+
+class TestEnvExample(unittest.TestCase):
+    def test_values_are_not_comments(self):
+        """Test that python-dotenv reads no inline comment as a value"""
+        values = dotenv_values(os.path.join(BACKEND, '.env.example'))
+        self.assertEqual({k: v for k, v in values.items() if v.startswith('#')}, {})
+
+    def test_create_app_with_the_example(self):
+        """Test that create_app() starts with .env.example loaded as the environment"""
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([BACKEND, os.path.join(BACKEND, 'tests')]))
+        env.update(dotenv_values(os.path.join(BACKEND, '.env.example')))
+        result = subprocess.run(
+            [sys.executable, '-c', CHECK], cwd=BACKEND, env=env,
+            capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        options, admin_status = result.stdout.splitlines()[-2:]
+        self.assertNotIn('readPreference', options)
+        self.assertNotIn('compressors', options)
+        self.assertEqual(admin_status, '404')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import queue
+import unittest
+from bson import ObjectId
+from events import EventBus
+
+class FakeTailCursor:
+    """A tailable cursor that yields one batch per iteration, then dies"""
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+
+    @property
+    def alive(self):
+        return bool(self.batches)
+
+    def __iter__(self):
+        return iter(self.batches.pop(0))
+
+class TestEventBus(unittest.TestCase):
+    def setUp(self):
+        self.bus = EventBus()
+        self.bus.queue_size = 2
+
+    def test_events_reach_matching_topics_only(self):
+        """Test that subscribers only receive events on their topics"""
+        near = self.bus.subscribe({'neighborhood:1'})
+        far = self.bus.subscribe({'neighborhood:2'})
+        self.bus.publish('post', ['neighborhood:1', 'author:9'], '{}')
+        self.assertEqual(near.get(timeout=0)['type'], 'post')
+        with self.assertRaises(queue.Empty):
+            far.get(timeout=0)
+
+    def test_one_copy_per_subscriber(self):
+        """Test that an event on several of a subscriber's topics is queued once"""
+        sub = self.bus.subscribe({'author:1', 'neighborhood:1'})
+        self.bus.publish('post', ['author:1', 'neighborhood:1'], '{}')
+        sub.get(timeout=0)
+        with self.assertRaises(queue.Empty):
+            sub.get(timeout=0)
+
+    def test_slow_consumer_is_dropped(self):
+        """Test that a full queue drops the subscriber instead of blocking"""
+        slow = self.bus.subscribe({'city:1'})
+        for _ in range(3):
+            self.bus.publish('post', ['city:1'], '{}')
+        self.assertTrue(slow.dropped)
+        self.assertIsNone(slow.get(timeout=0))
+        self.assertEqual(self.bus._topics, {})
+
+    def test_update_topics(self):
+        """Test that topics can be added and removed on a live subscription"""
+        sub = self.bus.subscribe({'user:1'})
+        self.bus.update(sub, add=['author:2'])
+        self.bus.publish('post', ['author:2'], '{}')
+        self.assertEqual(sub.get(timeout=0)['type'], 'post')
+        self.bus.update(sub, remove=['author:2'])
+        self.bus.publish('post', ['author:2'], '{}')
+        with self.assertRaises(queue.Empty):
+            sub.get(timeout=0)
+        self.bus.unsubscribe(sub)
+        self.assertEqual(self.bus._topics, {})
+
+class TestEventTail(unittest.TestCase):
+    def setUp(self):
+        self.bus = EventBus()
+        self.sub = self.bus.subscribe({'city:1'})
+        # Two workers' ids in one second: insertion order differs from _id order
+        self.ids = [ObjectId('6500000000000000000000b0'), ObjectId('6500000000000000000000a0'),
+                    ObjectId('6500000000000000000000a5')]
+
+    def event(self, _id):
+        return {'_id': _id, 'type': 'post', 'topics': ['city:1'], 'data': '{}', 'meta': {}}
+
+    def received(self):
+        ids = []
+        while True:
+            try:
+                ids.append(self.sub.get(timeout=0)['id'])
+            except queue.Empty:
+                return ids
+
+    def test_resume_skips_to_last_seen_in_insertion_order(self):
+        """Test that a restarted tail delivers events written just before it with lower ids"""
+        cursor = FakeTailCursor([self.event(_id) for _id in self.ids])
+        self.assertEqual(self.bus._follow(cursor, self.ids[0]), self.ids[2])
+        self.assertEqual(self.received(), [str(self.ids[1]), str(self.ids[2])])
+
+    def test_resume_after_wraparound_delivers_what_is_left(self):
+        """Test that an overwritten last event doesn't stall the tail"""
+        newer = ObjectId()
+        cursor = FakeTailCursor([self.event(_id) for _id in self.ids[1:]], [self.event(newer)])
+        self.assertEqual(self.bus._follow(cursor, self.ids[0]), newer)
+        self.assertEqual(self.received(), [str(newer)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import gzip
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+from bson import ObjectId
+import fakemongo
+import export
+from export import export_documents, ndjson_chunks, ndjson_line, gzip_chunks
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        return iter(self.docs[:n])
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append((query, projection))
+        after = query.get('_id', {}).get('$gt')
+        docs = [dict(doc) for doc in self.docs if after is None or doc['_id'] > after]
+        if projection:
+            docs = [{k: v for k, v in doc.items() if projection.get(k, 1)} for doc in docs]
+        return FakeCursor(docs)
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.ids = sorted(ObjectId() for _ in range(7))
+        self.db = {'users': FakeCollection([
+            {'_id': _id, 'username': f'user{i}', 'password': 'hash'} for i, _id in enumerate(self.ids)
+        ])}
+
+    def test_batches_in_id_order_without_passwords(self):
+        """Test that every document is exported once, in _id order, without its password"""
+        docs = list(export_documents('users', batch_size=3, db=self.db))
+        self.assertEqual([doc['_id'] for doc in docs], self.ids)
+        self.assertTrue(all('password' not in doc for doc in docs))
+        # Three bounded queries: 3 + 3 + 1
+        self.assertEqual(len(self.db['users'].queries), 3)
+
+    def test_resume_after_checkpoint_with_limit(self):
+        """Test that an export resumes after a given _id and stops at the limit"""
+        docs = list(export_documents('users', after=self.ids[2], limit=3, batch_size=2, db=self.db))
+        self.assertEqual([doc['_id'] for doc in docs], self.ids[3:6])
+
+    def test_ndjson_encoding(self):
+        """Test that ids become hex strings and dates ISO 8601 UTC"""
+        line = ndjson_line({'_id': self.ids[0], 'createdAt': datetime(2024, 5, 1, 12, 30)})
+        self.assertTrue(line.endswith(b'\n'))
+        self.assertEqual(json.loads(line), {'_id': str(self.ids[0]), 'createdAt': '2024-05-01T12:30:00+00:00'})
+
+    def test_gzip_stream_round_trips(self):
+        """Test that the gzip stream decompresses to the same NDJSON"""
+        docs = export_documents('users', batch_size=2, db=self.db)
+        plain = b''.join(ndjson_chunks(export_documents('users', db=self.db), chunk_size=100))
+        compressed = b''.join(gzip_chunks(ndjson_chunks(docs, chunk_size=100)))
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertEqual(len(plain.splitlines()), 7)
+
+class TestExportRoute(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.ids = [fakemongo.register(self.client, f'user{i}')[1] for i in range(5)]
+        self.addCleanup(fakemongo.app.config.update, ADMIN_TOKEN=fakemongo.app.config['ADMIN_TOKEN'])
+        fakemongo.app.config['ADMIN_TOKEN'] = 's3cret-admin-token'
+
+    def export(self, token='s3cret-admin-token', **params):
+        return self.client.get('/api/admin/export/users', query_string=params, headers={'X-Admin-Token': token})
+
+    def lines(self, body):
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_disabled_without_admin_token(self):
+        """Test that the admin API is a 404 while ADMIN_TOKEN is unset"""
+        fakemongo.app.config['ADMIN_TOKEN'] = ''
+        self.assertEqual(self.export(token='').status_code, 404)
+        self.assertEqual(self.export(token='anything').status_code, 404)
+
+    def test_short_or_comment_tokens_disable_the_api(self):
+        """Test that a short ADMIN_TOKEN, or a .env comment read as one, keeps the API off"""
+        for token in ('short', '# empty disables it'):
+            fakemongo.app.config['ADMIN_TOKEN'] = token
+            self.assertEqual(self.export(token=token).status_code, 404)
+
+    def test_bad_token(self):
+        """Test that a missing or wrong X-Admin-Token is a 401"""
+        self.assertEqual(self.export(token='').status_code, 401)
+        self.assertEqual(self.export(token='s3cret-admin-toke').status_code, 401)
+
+    def test_streams_ndjson_without_passwords(self):
+        """Test that the export streams every user in _id order without passwords"""
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+        docs = self.lines(response.get_data())
+        self.assertEqual([doc['_id'] for doc in docs], self.ids)
+        self.assertTrue(all('password' not in doc for doc in docs))
+
+    def test_gzip(self):
+        """Test that ?gzip=1 sends a gzip attachment of the same NDJSON"""
+        plain = self.export().get_data()
+        response = self.export(gzip=1)
+        self.assertEqual(response.mimetype, 'application/gzip')
+        self.assertIn('users.ndjson.gz', response.headers['Content-Disposition'])
+        self.assertEqual(gzip.decompress(response.get_data()), plain)
+
+    def test_resume(self):
+        """Test that ?after= resumes after the last id received and ?limit= stops early"""
+        docs = self.lines(self.export(after=self.ids[1], limit=2).get_data())
+        self.assertEqual([doc['_id'] for doc in docs], self.ids[2:4])
+        self.assertEqual(self.export(after='nope').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/export/secrets', headers={'X-Admin-Token': 's3cret-admin-token'}).status_code, 404)
+
+    def test_cli_batch_size_defaults_to_config(self):
+        """Test that `flask export` reads its batch size from EXPORT_BATCH_SIZE"""
+        self.addCleanup(fakemongo.app.config.update, EXPORT_BATCH_SIZE=fakemongo.app.config['EXPORT_BATCH_SIZE'])
+        fakemongo.app.config['EXPORT_BATCH_SIZE'] = 2
+        runner = fakemongo.app.test_cli_runner()
+        with mock.patch('commands.export_documents', wraps=export.export_documents) as documents:
+            result = runner.invoke(args=['export', 'users'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual(documents.call_args.args[3], 2)
+            runner.invoke(args=['export', 'users', '--batch-size', '3'])
+            self.assertEqual(documents.call_args.args[3], 3)
+
+if __name__ == '__main__':
+    unittest.main()
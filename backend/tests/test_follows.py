@@ -0,0 +1,42 @@
+import unittest
+import fakemongo
+
+class TestFollows(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.token, self.user_id = fakemongo.register(self.client, 'alice')
+        _, self.other_id = fakemongo.register(self.client, 'bob')
+        self.client.post(f'/api/users/{self.other_id}/follow', headers={'x-access-token': self.token})
+
+    def check(self, user_ids):
+        return self.client.post(
+            '/api/users/following/check',
+            json={'user_ids': user_ids},
+            headers={'x-access-token': self.token}
+        )
+
+    def test_check_following(self):
+        """Test that the batch check reports followed and unfollowed users"""
+        response = self.check([self.other_id, self.user_id])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['following'], {self.other_id: True, self.user_id: False})
+
+    def test_check_following_rejects_invalid_ids(self):
+        """Test that malformed or non-string ids are a 400, not a 500"""
+        for user_ids in (['nope'], [42], [None], [{'$ne': 1}]):
+            response = self.check(user_ids)
+            self.assertEqual(response.status_code, 400, user_ids)
+
+    def test_follower_list_limit_is_clamped(self):
+        """Test that limit=0 and negative limits still return a page"""
+        for limit in (0, -5):
+            response = self.client.get(
+                f'/api/users/{self.other_id}/followers?limit={limit}',
+                headers={'x-access-token': self.token}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.get_json()['users']), 1)
+
+if __name__ == '__main__':
+    unittest.main()
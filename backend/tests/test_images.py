@@ -0,0 +1,126 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from PIL import Image
+import fakemongo
+from images import ImageStore, HashingFile, InvalidImage, _make_variants, image_store
+
+def png_bytes(size=(400, 200)):
+    buffer = io.BytesIO()
+    Image.new('RGBA', size, (0, 128, 255, 128)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+class TestImageStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = ImageStore()
+        self.store.folder = self.folder
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def upload(self, data):
+        stream = HashingFile(self.folder)
+        for i in range(0, len(data), 1000):
+            stream.write(data[i:i + 1000])
+        return stream
+
+    def test_uploads_are_content_addressed(self):
+        """Test that identical uploads are stored once under their SHA-256"""
+        data = png_bytes()
+        digest, ext, created = self.store.save(self.upload(data))
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        self.assertEqual(ext, 'png')
+        self.assertTrue(created)
+
+        self.assertEqual(self.store.save(self.upload(data)), (digest, 'png', False))
+        self.assertEqual(os.listdir(self.store.shard(digest)), [f'{digest}.png'])
+        self.assertFalse([name for name in os.listdir(self.folder) if name.startswith('.')])
+
+    def test_non_images_are_rejected(self):
+        """Test that uploads Pillow can't identify are refused and removed"""
+        with self.assertRaises(InvalidImage):
+            self.store.save(self.upload(b'<html>not an image</html>'))
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_variants(self):
+        """Test that variants fit their bounding box and fall back to nothing"""
+        digest, ext, _ = self.store.save(self.upload(png_bytes()))
+        self.assertIsNone(self.store.variant_path(digest, 'thumb'))
+        _make_variants(
+            self.store.original_path(digest), self.store.shard(digest),
+            digest, {'thumb': 100}, 80
+        )
+        with Image.open(self.store.variant_path(digest, 'thumb')) as thumb:
+            self.assertEqual(thumb.format, 'JPEG')
+            self.assertEqual(thumb.size, (100, 50))
+
+    def test_stream_factory_stops_past_max_files(self):
+        """Test that the file past max_files is refused before a temp file is made for it"""
+        created = []
+        factory = self.store.stream_factory(created, max_files=2)
+        factory(None, 'image/png', 'a.png')
+        factory(None, 'application/octet-stream', '')  # an empty file input isn't counted
+        factory(None, 'image/png', 'b.png')
+        with self.assertRaises(InvalidImage):
+            factory(None, 'image/png', 'c.png')
+        self.assertEqual(len(created), 3)
+        for stream in created:
+            stream.close()
+
+    def test_variants_are_made_in_a_spawned_process(self):
+        """Test that the resize pool spawns its processes and produces the variants"""
+        self.store.sizes = {'thumb': 100}
+        self.addCleanup(self.store.shutdown)
+        digest, ext, _ = self.store.save(self.upload(png_bytes()))
+        self.store.resize_later(digest, ext).result(timeout=60)
+        self.assertEqual(self.store.executor._mp_context.get_start_method(), 'spawn')
+        self.assertIsNotNone(self.store.variant_path(digest, 'thumb'))
+
+class TestUploadRoute(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.token, _ = fakemongo.register(self.client, 'alice')
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        for patcher in (
+            mock.patch.object(image_store, 'folder', self.folder),
+            mock.patch.object(image_store, 'resize_later'),
+            mock.patch.dict(fakemongo.app.config, IMAGE_MAX_FILES=2)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, count):
+        data = {'images': [(io.BytesIO(png_bytes((10 + i, 10))), f'{i}.png') for i in range(count)]}
+        return self.client.post(
+            '/api/uploads', data=data, content_type='multipart/form-data',
+            headers={'x-access-token': self.token}
+        )
+
+    def stored(self):
+        return [name for _, _, names in os.walk(self.folder) for name in names]
+
+    def test_upload_within_the_limit(self):
+        """Test that up to IMAGE_MAX_FILES images are stored and queued for resizing"""
+        response = self.upload(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.get_json()['images']), 2)
+        self.assertEqual(image_store.resize_later.call_count, 2)
+        self.assertEqual(len(self.stored()), 2)
+
+    def test_too_many_images_are_refused_without_leftovers(self):
+        """Test that a body past IMAGE_MAX_FILES is a 400 and leaves no files behind"""
+        response = self.upload(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['message'], 'Too many images')
+        self.assertEqual(self.stored(), [])
+        image_store.resize_later.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
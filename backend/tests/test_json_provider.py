@@ -0,0 +1,65 @@
+import json
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
+from bson import ObjectId, Decimal128, Timestamp
+from flask import Flask
+import json_provider
+from json_provider import MongoJSONProvider
+
+class SubObjectId(ObjectId):
+    pass
+
+class TestMongoJSONProvider(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.json = MongoJSONProvider(self.app)
+        self.oid = ObjectId('64b7f0c2a1b2c3d4e5f60718')
+        self.doc = {
+            '_id': self.oid,
+            'author': {'id': SubObjectId(str(self.oid)), 'tags': [self.oid]},
+            'createdAt': datetime(2024, 3, 1, 12, 30),
+            'day': date(2024, 3, 1),
+            'price': Decimal128(Decimal('1.50')),
+            'seen': Timestamp(datetime(2024, 3, 1, 12, 30), 0),
+            'text': 'héllo'
+        }
+        self.expected = {
+            '_id': '64b7f0c2a1b2c3d4e5f60718',
+            'author': {'id': '64b7f0c2a1b2c3d4e5f60718', 'tags': ['64b7f0c2a1b2c3d4e5f60718']},
+            'createdAt': 'Fri, 01 Mar 2024 12:30:00 GMT',
+            'day': 'Fri, 01 Mar 2024 00:00:00 GMT',
+            'price': '1.50',
+            'seen': 'Fri, 01 Mar 2024 12:30:00 GMT',
+            'text': 'héllo'
+        }
+
+    def test_dumps_encodes_bson_and_dates(self):
+        """Test that ObjectIds become hex strings and dates use the HTTP date format"""
+        self.assertEqual(json.loads(self.app.json.dumps(self.doc)), self.expected)
+
+    def test_response(self):
+        """Test that jsonify-style responses use the same encoding"""
+        with self.app.app_context():
+            response = self.app.json.response(self.doc)
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.get_json(), self.expected)
+
+    def test_matches_without_orjson(self):
+        """Test that the standard library fallback gives the same documents"""
+        with_orjson = json.loads(self.app.json.dumps(self.doc))
+        with mock.patch.object(json_provider, 'orjson', None):
+            fallback = json.loads(self.app.json.dumps(self.doc))
+            with self.app.app_context():
+                response = self.app.json.response(self.doc)
+        self.assertEqual(fallback, with_orjson)
+        self.assertEqual(response.get_json(), self.expected)
+
+    def test_unknown_types_still_fail(self):
+        """Test that objects with no encoding raise TypeError"""
+        with self.assertRaises(TypeError):
+            self.app.json.dumps({'x': object()})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime
+from bson import ObjectId
+import fakemongo
+from extensions import mongo
+
+class TestLikes(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.token, self.user_id = fakemongo.register(self.client, 'alice')
+        self.headers = {'x-access-token': self.token}
+        self.neighborhood_id = ObjectId()
+
+    def add_post(self, **fields):
+        with fakemongo.app.app_context():
+            return mongo.db.posts.insert_one(dict({
+                'content': 'hello',
+                'images': [],
+                'author': ObjectId(self.user_id),
+                'visibility': 'neighborhood',
+                'neighborhood_id': self.neighborhood_id,
+                'createdAt': datetime.utcnow()
+            }, **fields)).inserted_id
+
+    def like(self, post_id, headers=None):
+        response = self.client.post(f'/api/posts/{post_id}/like', headers=headers or self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['liked']
+
+    def shown(self, headers=None):
+        response = self.client.get(
+            f'/api/locations/neighborhoods/{self.neighborhood_id}/posts',
+            headers=headers or self.headers
+        )
+        post = response.get_json()['posts'][0]
+        self.assertNotIn('legacy_likes', post)
+        return post['like_count'], post['liked_by_me']
+
+    def test_toggle(self):
+        """Test that liking twice likes then unlikes, keeping the count in step"""
+        post_id = self.add_post(like_count=0)
+        self.assertTrue(self.like(post_id))
+        self.assertEqual(self.shown(), (1, True))
+        self.assertFalse(self.like(post_id))
+        self.assertEqual(self.shown(), (0, False))
+
+    def test_legacy_array_is_counted_and_seen_before_any_toggle(self):
+        """Test that a post still embedding likes shows its count and the viewer's like"""
+        self.add_post(likes=[ObjectId(self.user_id), ObjectId()])
+        self.assertEqual(self.shown(), (2, True))
+        other_token, _ = fakemongo.register(self.client, 'bob')
+        self.assertEqual(self.shown({'x-access-token': other_token}), (2, False))
+
+    def test_first_toggle_starts_from_the_legacy_array(self):
+        """Test that the first like on a legacy post adds to the array's count, not to zero"""
+        post_id = self.add_post(likes=[ObjectId(self.user_id), ObjectId()])
+        other_token, _ = fakemongo.register(self.client, 'bob')
+        other = {'x-access-token': other_token}
+
+        self.assertTrue(self.like(post_id, other))
+        self.assertEqual(self.shown(other), (3, True))
+
+        # Alice was in the array, so her toggle unlikes
+        self.assertFalse(self.like(post_id))
+        self.assertEqual(self.shown(), (2, False))
+        with fakemongo.app.app_context():
+            post = mongo.db.posts.find_one({'_id': post_id})
+            self.assertNotIn('likes', post)
+            self.assertEqual(mongo.db.likes.count_documents({'post_id': post_id}), 2)
+
+if __name__ == '__main__':
+    unittest.main()
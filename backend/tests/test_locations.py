@@ -0,0 +1,283 @@
+import unittest
+from unittest import mock
+from datetime import datetime
+from bson import ObjectId
+import fakemongo
+from extensions import mongo
+from counters import counter_buffer
+from geo import haversine
+
+class LocationTestCase(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.token, self.user_id = fakemongo.register(self.client, 'alice')
+        self.headers = {'x-access-token': self.token}
+
+    def add_city(self, name):
+        response = self.client.post('/api/locations/cities', json={'name': name})
+        return str(response.get_json()['city']['_id'])
+
+    def add_neighborhood(self, city_id, name):
+        response = self.client.post(f'/api/locations/cities/{city_id}/neighborhoods', json={'name': name})
+        return response.get_json()['neighborhood']['id']
+
+    def move(self, city_id, neighborhood_id):
+        return self.client.put(
+            f'/api/users/{self.user_id}/location',
+            json={'city_id': city_id, 'neighborhood_id': neighborhood_id},
+            headers=self.headers
+        )
+
+class TestDirectoryCache(LocationTestCase):
+    def test_etag_and_304(self):
+        """Test that a matching If-None-Match gets an empty 304 until the listing changes"""
+        city_id = self.add_city('Austin')
+        self.add_neighborhood(city_id, 'Zilker')
+        listing = f'/api/locations/cities/{city_id}/neighborhoods'
+        etags = {}
+        for path in ('/api/locations/cities', '/api/locations/directory', listing):
+            first = self.client.get(path)
+            self.assertEqual(first.status_code, 200)
+            etags[path] = first.headers['ETag']
+            self.assertFalse(etags[path].startswith('W/'))
+            self.assertEqual(first.headers['Cache-Control'], 'no-cache')
+
+            cached = self.client.get(path, headers={'If-None-Match': etags[path]})
+            self.assertEqual(cached.status_code, 304, path)
+            self.assertEqual(cached.get_data(), b'')
+            self.assertEqual(self.client.get(path, headers={'If-None-Match': '"stale"'}).status_code, 200)
+
+        # A new neighborhood changes its city's listing and the directory
+        self.add_neighborhood(city_id, 'Hyde Park')
+        for path in ('/api/locations/directory', listing):
+            response = self.client.get(path, headers={'If-None-Match': etags[path]})
+            self.assertEqual(response.status_code, 200, path)
+        names = [n['name'] for n in self.client.get(listing).get_json()['neighborhoods']]
+        self.assertEqual(names, ['Zilker', 'Hyde Park'])
+
+    def test_unknown_city_is_not_cached_as_a_listing(self):
+        """Test that a missing city is a 404 and a malformed id a 400"""
+        self.assertEqual(self.client.get(f'/api/locations/cities/{ObjectId()}/neighborhoods').status_code, 404)
+        self.assertEqual(self.client.get('/api/locations/cities/nope/neighborhoods').status_code, 400)
+
+    def test_member_count_flush_only_refreshes_its_city(self):
+        """Test that a member count write drops its city's listing and nothing else"""
+        austin, boston = self.add_city('Austin'), self.add_city('Boston')
+        zilker = self.add_neighborhood(austin, 'Zilker')
+        self.add_neighborhood(boston, 'Back Bay')
+        for path in ('/api/locations/cities', f'/api/locations/cities/{austin}/neighborhoods',
+                     f'/api/locations/cities/{boston}/neighborhoods'):
+            self.client.get(path)
+
+        # Write behind the caches' back, then report only Zilker's count
+        with fakemongo.app.app_context():
+            mongo.db.neighborhoods.update_one({'_id': ObjectId(zilker)}, {'$set': {'member_count': 7}})
+            mongo.db.cities.update_many({}, {'$set': {'country': 'Changed'}})
+        counter_buffer._notify({'neighborhoods': {ObjectId(zilker)}})
+
+        listing = self.client.get(f'/api/locations/cities/{austin}/neighborhoods').get_json()
+        self.assertEqual(listing['neighborhoods'][0]['member_count'], 7)
+        cities = self.client.get('/api/locations/cities').get_json()
+        self.assertEqual({city['country'] for city in cities}, {'USA'})
+
+class TestLocationFeeds(LocationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city_id = self.add_city('Austin')
+        self.neighborhood_id = self.add_neighborhood(self.city_id, 'Zilker')
+        self.move(self.city_id, self.neighborhood_id)
+
+    def post(self, content, visibility='neighborhood'):
+        response = self.client.post('/api/posts', json={'content': content, 'visibility': visibility}, headers=self.headers)
+        return response.get_json()['postId']
+
+    def page(self, path, **params):
+        response = self.client.get(path, query_string=params, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_neighborhood_feed_pages_with_cursors(self):
+        """Test that following next_cursor walks every post once, newest first"""
+        ids = [self.post(f'post {i}') for i in range(5)]
+        path = f'/api/locations/neighborhoods/{self.neighborhood_id}/posts'
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.page(path, **params)
+            self.assertLessEqual(len(data['posts']), 2)
+            seen.extend(post['_id'] for post in data['posts'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ids[::-1])
+
+    def test_new_post_lands_in_a_cached_feed(self):
+        """Test that a cached first page is dropped when a post lands in the scope"""
+        path = f'/api/locations/neighborhoods/{self.neighborhood_id}/posts'
+        self.post('first')
+        self.assertEqual(len(self.page(path)['posts']), 1)
+        self.post('second')
+        self.assertEqual(len(self.page(path)['posts']), 2)
+
+    def test_city_feed_only_shows_city_posts(self):
+        """Test that the city feed lists city-visible posts only"""
+        self.post('neighbors only')
+        city_post = self.post('everyone', visibility='city')
+        posts = self.page(f'/api/locations/cities/{self.city_id}/posts')['posts']
+        self.assertEqual([post['_id'] for post in posts], [city_post])
+
+    def test_bad_cursor_and_limit(self):
+        """Test that a garbled cursor is a 400 and limit below 1 is clamped"""
+        path = f'/api/locations/neighborhoods/{self.neighborhood_id}/posts'
+        self.post('only')
+        response = self.client.get(path, query_string={'cursor': 'garbage'}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.page(path, limit=0)['posts']), 1)
+
+class TestMembers(LocationTestCase):
+    def member_count(self, neighborhood_id):
+        with fakemongo.app.app_context():
+            return mongo.db.neighborhoods.find_one({'_id': ObjectId(neighborhood_id)})['member_count']
+
+    def members(self, neighborhood_id, **params):
+        response = self.client.get(
+            f'/api/locations/neighborhoods/{neighborhood_id}/members',
+            query_string=params, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        return [user['id'] for user in response.get_json()['users']]
+
+    def test_moving_shifts_the_member_count(self):
+        """Test that moving takes the member from the old neighborhood to the new one"""
+        city_id = self.add_city('Austin')
+        zilker, hyde_park = self.add_neighborhood(city_id, 'Zilker'), self.add_neighborhood(city_id, 'Hyde Park')
+
+        self.move(city_id, zilker)
+        self.assertEqual((self.member_count(zilker), self.member_count(hyde_park)), (1, 0))
+        self.assertEqual(self.members(zilker), [self.user_id])
+
+        self.move(city_id, hyde_park)
+        self.assertEqual((self.member_count(zilker), self.member_count(hyde_park)), (0, 1))
+        self.assertEqual(self.members(zilker), [])
+        self.assertEqual(self.members(hyde_park, limit=0), [self.user_id])
+
+    def test_moving_to_the_same_neighborhood_keeps_the_count(self):
+        """Test that repeating a move doesn't count the member twice"""
+        city_id = self.add_city('Austin')
+        zilker = self.add_neighborhood(city_id, 'Zilker')
+        self.move(city_id, zilker)
+        self.move(city_id, zilker)
+        self.assertEqual(self.member_count(zilker), 1)
+
+    def test_neighborhood_from_another_city_is_rejected(self):
+        """Test that a neighborhood outside the given city is a 404 and moves nothing"""
+        austin, boston = self.add_city('Austin'), self.add_city('Boston')
+        back_bay = self.add_neighborhood(boston, 'Back Bay')
+        self.assertEqual(self.move(austin, back_bay).status_code, 404)
+        self.assertEqual(self.member_count(back_bay), 0)
+
+class TestNearby(LocationTestCase):
+    """mongomock has no $geoNear, so it is answered here and the stages recorded"""
+
+    def setUp(self):
+        super().setUp()
+        self.pipelines = {}
+        with fakemongo.app.app_context():
+            for collection in (mongo.db.neighborhoods, mongo.db.posts):
+                aggregate = collection.aggregate
+                patcher = mock.patch.object(collection, 'aggregate', side_effect=self.geo_near(collection, aggregate))
+                patcher.start()
+                self.addCleanup(patcher.stop)
+
+    def geo_near(self, collection, aggregate):
+        def run(pipeline):
+            if '$geoNear' not in pipeline[0]:
+                return aggregate(pipeline)
+            self.pipelines[collection.name] = pipeline
+            lng, lat = pipeline[0]['$geoNear']['near']['coordinates']
+            docs = []
+            for doc in collection.find({'location': {'$exists': True}}):
+                plng, plat = doc['location']['coordinates']
+                doc['distance'] = haversine(lat, lng, plat, plng)
+                if doc['distance'] <= pipeline[0]['$geoNear']['maxDistance']:
+                    docs.append(doc)
+            docs.sort(key=lambda doc: doc['distance'])
+            return iter(docs[:pipeline[1]['$limit']])
+        return run
+
+    def nearby(self, **params):
+        return self.client.get('/api/locations/nearby', query_string=params, headers=self.headers)
+
+    def test_query_shape(self):
+        """Test that both lookups are $geoNear on a [lng, lat] point with clamped bounds"""
+        response = self.nearby(lat=30.2672, lng=-97.7431, radius=10 ** 9, limit=0)
+        self.assertEqual(response.status_code, 200)
+
+        for name in ('neighborhoods', 'posts'):
+            stage = self.pipelines[name][0]['$geoNear']
+            self.assertEqual(stage['near'], {'type': 'Point', 'coordinates': [-97.7431, 30.2672]})
+            self.assertEqual(stage['maxDistance'], 50000)
+            self.assertTrue(stage['spherical'])
+            self.assertEqual(self.pipelines[name][1], {'$limit': 1})
+        self.assertIn('$gte', self.pipelines['posts'][0]['$geoNear']['query']['createdAt'])
+
+    def test_posts_come_back_closest_first_with_coordinates(self):
+        """Test that nearby posts carry their distance and coordinates, closest first"""
+        for content, lat in (('far', 30.27), ('near', 30.2673), ('too far', 31.0)):
+            self.client.post('/api/posts', json={'content': content, 'lat': lat, 'lng': -97.7431}, headers=self.headers)
+
+        posts = self.nearby(lat=30.2672, lng=-97.7431, radius=1000).get_json()['posts']
+        self.assertEqual([post['content'] for post in posts], ['near', 'far'])
+        self.assertEqual((posts[0]['lat'], posts[0]['lng']), (30.2673, -97.7431))
+        self.assertEqual(posts[0]['distance'], 11)
+
+    def test_bad_coordinates(self):
+        """Test that missing or out of range coordinates are a 400"""
+        self.assertEqual(self.nearby(lat=30).status_code, 400)
+        self.assertEqual(self.nearby(lat=91, lng=0).status_code, 400)
+
+    def test_bad_radius(self):
+        """Test that a negative or NaN radius is a 400 and never reaches $geoNear"""
+        for radius in ('-1', 'nan', '-inf', 'far'):
+            self.assertEqual(self.nearby(lat=30.2672, lng=-97.7431, radius=radius).status_code, 400, radius)
+        self.assertEqual(self.pipelines, {})
+        self.assertEqual(self.nearby(lat=30.2672, lng=-97.7431, radius='inf').status_code, 200)
+        self.assertEqual(self.pipelines['posts'][0]['$geoNear']['maxDistance'], 50000)
+
+class TestMigrateNeighborhoods(LocationTestCase):
+    def test_embedded_neighborhoods_keep_their_ids(self):
+        """Test that migrated neighborhoods keep their ids and counts and a rerun adds nothing"""
+        zilker, hyde_park = ObjectId(), ObjectId()
+        with fakemongo.app.app_context():
+            city_id = mongo.db.cities.insert_one({
+                'name': 'Austin',
+                'name_lower': 'austin',
+                'neighborhoods': [
+                    {'id': str(zilker), 'name': 'Zilker', 'created_at': datetime(2024, 1, 1), 'member_count': 4},
+                    {'id': str(hyde_park), 'name': 'Hyde Park', 'created_at': datetime(2024, 1, 2)}
+                ]
+            }).inserted_id
+
+        runner = fakemongo.app.test_cli_runner()
+        for _ in range(2):
+            result = runner.invoke(args=['migrate-neighborhoods'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+        with fakemongo.app.app_context():
+            self.assertEqual(mongo.db.neighborhoods.count_documents({'city_id': city_id}), 2)
+            self.assertNotIn('neighborhoods', mongo.db.cities.find_one({'_id': city_id}))
+        listing = self.client.get(f'/api/locations/cities/{city_id}/neighborhoods').get_json()
+        self.assertEqual(
+            [(n['id'], n['name'], n['name_lower'], n['member_count']) for n in listing['neighborhoods']],
+            [(str(zilker), 'Zilker', 'zilker', 4), (str(hyde_park), 'Hyde Park', 'hyde park', 0)]
+        )
+
+        # Users pointing at the old embedded ids can still move in
+        self.assertEqual(self.move(str(city_id), str(hyde_park)).status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from types import SimpleNamespace
+from metrics import MetricsRegistry, Histogram
+from flask import Flask
+import mongo_monitoring
+import request_metrics
+from mongo_monitoring import CommandLatencyListener
+from request_metrics import RequestMetrics
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_buckets(self):
+        """Test that observations land in the first bucket at or above them"""
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        counts, total, count = histogram.snapshot()
+        self.assertEqual(counts, [2, 1, 1])
+        self.assertEqual(count, 4)
+        self.assertAlmostEqual(total, 5.65)
+
+    def test_render_prometheus_text(self):
+        """Test that histograms render cumulative buckets with escaped labels"""
+        registry = MetricsRegistry()
+        registry.histogram('op_seconds', 'Op latency', {'op': 'a"b'}, buckets=(1,)).observe(0.5)
+        registry.counter('op_total', 'Ops').inc(3)
+        text = registry.render()
+        self.assertIn('# TYPE op_seconds histogram', text)
+        self.assertIn('op_seconds_bucket{op="a\\"b",le="1"} 1', text)
+        self.assertIn('op_seconds_bucket{op="a\\"b",le="+Inf"} 1', text)
+        self.assertIn('op_seconds_count{op="a\\"b"} 1', text)
+        self.assertIn('op_total 3', text)
+
+    def test_command_listener(self):
+        """Test that command latency is recorded per collection and command"""
+        registry = MetricsRegistry()
+        original = mongo_monitoring.metrics
+        mongo_monitoring.metrics = registry
+        try:
+            listener = CommandLatencyListener(slow_ms=1000)
+            listener.started(SimpleNamespace(
+                command={'find': 'posts'}, command_name='find',
+                request_id=1, connection_id=('localhost', 27017), database_name='eyes'
+            ))
+            listener.succeeded(SimpleNamespace(
+                command_name='find', request_id=1, connection_id=('localhost', 27017),
+                duration_micros=2000, database_name='eyes'
+            ))
+        finally:
+            mongo_monitoring.metrics = original
+        self.assertIn(
+            'mongodb_command_duration_seconds_count{collection="posts",command="find"} 1',
+            registry.render()
+        )
+        self.assertEqual(listener._inflight, {})
+
+    def test_request_metrics(self):
+        """Test that requests are timed by endpoint and their Mongo commands counted"""
+        registry = MetricsRegistry()
+        originals = mongo_monitoring.metrics, request_metrics.metrics
+        mongo_monitoring.metrics = request_metrics.metrics = registry
+        try:
+            app = Flask(__name__)
+            RequestMetrics().init_app(app)
+            listener = CommandLatencyListener()
+
+            @app.route('/items/<item_id>')
+            def get_item(item_id):
+                for request_id in range(2):
+                    listener.started(SimpleNamespace(
+                        command={'find': 'items'}, command_name='find',
+                        request_id=request_id, connection_id=1, database_name='eyes'
+                    ))
+                return 'ok'
+
+            client = app.test_client()
+            client.get('/items/1')
+            client.get('/items/2')
+            client.get('/missing')
+        finally:
+            mongo_monitoring.metrics, request_metrics.metrics = originals
+        text = registry.render()
+        self.assertIn(
+            'http_request_duration_seconds_count{endpoint="get_item",method="GET",status="200"} 2', text
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{endpoint="unmatched",method="GET",status="404"} 1', text
+        )
+        self.assertIn('http_request_mongo_commands_sum{endpoint="get_item"} 4', text)
+        self.assertIsNone(mongo_monitoring.request_commands.get())
+
+if __name__ == '__main__':
+    unittest.main()
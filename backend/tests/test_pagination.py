@@ -0,0 +1,31 @@
+import unittest
+from datetime import datetime
+from bson import ObjectId
+from pagination import encode_cursor, decode_cursor, keyset_filter
+
+class TestCursorPagination(unittest.TestCase):
+    def test_cursor_round_trip(self):
+        """Test that a cursor decodes back to the same position"""
+        created_at = datetime(2024, 5, 1, 12, 30, 15, 123000)
+        post_id = ObjectId()
+        cursor = encode_cursor(created_at, post_id)
+        self.assertEqual(decode_cursor(cursor), (created_at, post_id))
+
+    def test_malformed_cursor(self):
+        """Test that garbage cursors raise ValueError"""
+        for cursor in ['', 'not-a-cursor', encode_cursor(datetime.utcnow(), ObjectId())[:-4]]:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_keyset_filter(self):
+        """Test that the filter breaks createdAt ties on the id field"""
+        created_at = datetime(2024, 5, 1)
+        post_id = ObjectId()
+        query = keyset_filter((created_at, post_id), id_field='post_id')
+        self.assertEqual(query, {'$or': [
+            {'createdAt': {'$lt': created_at}},
+            {'createdAt': created_at, 'post_id': {'$lt': post_id}}
+        ]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import threading
+import unittest
+from unittest import mock
+import bcrypt
+from bson import ObjectId
+import fakemongo
+from extensions import mongo
+from passwords import PasswordHasher, PasswordHasherBusy, password_hasher
+
+def hold(hasher, release):
+    """Occupy one of `hasher`'s slots until `release` is set; returns the thread"""
+    started = threading.Event()
+
+    def blocked():
+        started.set()
+        return release.wait(5)
+
+    thread = threading.Thread(target=hasher._run, args=(blocked,), daemon=True)
+    thread.start()
+    started.wait(5)
+    return thread
+
+def wait_for_slot(hasher):
+    """Wait until a held slot is back; futures release it just after their result is set"""
+    hasher._pending.acquire(timeout=5)
+    hasher._pending.release()
+
+class TestPasswordHasher(unittest.TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher()
+        self.hasher.rounds = 4
+        self.hasher.workers = 1
+        self.hasher._pending = threading.BoundedSemaphore(1)
+        self.addCleanup(self.hasher.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_busy_when_max_pending_reached(self):
+        """Test that an operation past max_pending is refused at once, and accepted again later"""
+        thread = hold(self.hasher, self.release)
+        with self.assertRaises(PasswordHasherBusy):
+            self.hasher.hash_password('Test@123')
+        self.release.set()
+        thread.join(5)
+        wait_for_slot(self.hasher)
+        self.assertTrue(self.hasher.check_password('Test@123', self.hasher.hash_password('Test@123')))
+
+    def test_timeout(self):
+        """Test that an operation running past BCRYPT_TIMEOUT raises busy and frees its slot when done"""
+        self.hasher.timeout = 0.05
+        with self.assertRaises(PasswordHasherBusy):
+            self.hasher._run(self.release.wait, 5)
+        self.release.set()
+        wait_for_slot(self.hasher)
+        self.hasher.timeout = 10
+        self.assertTrue(self.hasher.check_password('pw', self.hasher.hash_password('pw')))
+
+    def test_needs_rehash(self):
+        """Test that only hashes made at another cost need rehashing"""
+        self.assertFalse(self.hasher.needs_rehash(self.hasher.hash_password('pw')))
+        self.assertTrue(self.hasher.needs_rehash(bcrypt.hashpw(b'pw', bcrypt.gensalt(5)).decode()))
+        self.assertTrue(self.hasher.needs_rehash('not a bcrypt hash'))
+
+class TestLogin(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        _, self.user_id = fakemongo.register(self.client, 'alice')
+
+    def login(self):
+        return self.client.post('/api/auth/login', json={'email': 'alice@example.com', 'password': 'Test@123'})
+
+    def stored_hash(self):
+        with fakemongo.app.app_context():
+            return mongo.db.users.find_one({'_id': ObjectId(self.user_id)})['password']
+
+    def test_overloaded_login_is_503(self):
+        """Test that login answers 503 with Retry-After while the bcrypt pool is full"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch.object(password_hasher, '_pending', threading.BoundedSemaphore(1)):
+            thread = hold(password_hasher, release)
+            response = self.login()
+            release.set()
+            thread.join(5)
+            wait_for_slot(password_hasher)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_login_rehashes_at_the_configured_cost(self):
+        """Test that logging in with a hash of another cost stores one made with BCRYPT_ROUNDS"""
+        old = bcrypt.hashpw(b'Test@123', bcrypt.gensalt(5)).decode()
+        with fakemongo.app.app_context():
+            mongo.db.users.update_one({'_id': ObjectId(self.user_id)}, {'$set': {'password': old}})
+
+        self.assertEqual(self.login().status_code, 200)
+        rounds = fakemongo.app.config['BCRYPT_ROUNDS']
+        self.assertTrue(self.stored_hash().startswith(f'$2b${rounds:02d}$'))
+        self.assertNotEqual(self.stored_hash(), old)
+
+        # Already at the configured cost: left alone
+        current = self.stored_hash()
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.stored_hash(), current)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import mongomock
+from flask import Flask, jsonify
+from ratelimit import MemoryStore, MongoStore, RateLimiter, parse_rule
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = MemoryStore(maxsize=10, clock=self.clock)
+
+    def test_parse_rule(self):
+        """Test that rules become a burst size and a per-second refill rate"""
+        self.assertEqual(parse_rule('10/minute'), (10, 10 / 60))
+        self.assertEqual(parse_rule('2/second'), (2, 2))
+        with self.assertRaises(ValueError):
+            parse_rule('10/fortnight')
+
+    def test_burst_then_refill(self):
+        """Test that a full bucket allows a burst and then refills over time"""
+        capacity, rate = parse_rule('3/minute')
+        waits = [self.store.take('k', capacity, rate) for _ in range(4)]
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(waits[3], 20)
+
+        self.clock.now += 20
+        self.assertEqual(self.store.take('k', capacity, rate), 0)
+        self.assertGreater(self.store.take('k', capacity, rate), 0)
+
+    def test_keys_are_independent_and_bounded(self):
+        """Test that buckets don't share tokens and the store stays within maxsize"""
+        for i in range(20):
+            self.assertEqual(self.store.take(f'k{i}', 1, 1), 0)
+        self.assertGreater(self.store.take('k19', 1, 1), 0)
+        self.assertEqual(len(self.store._buckets), 10)
+
+class TestMongoStore(unittest.TestCase):
+    def test_bucket_in_one_atomic_update(self):
+        """Test that the Mongo store allows a burst, then reports the wait"""
+        db = mongomock.MongoClient().ratelimit_test
+        store = MongoStore(db)
+        capacity, rate = parse_rule('2/minute')
+        self.assertEqual(store.take('login:ip:1', capacity, rate), 0)
+        self.assertEqual(store.take('login:ip:1', capacity, rate), 0)
+        self.assertAlmostEqual(store.take('login:ip:1', capacity, rate), 30, delta=1)
+        self.assertEqual(store.take('login:ip:2', capacity, rate), 0)
+
+        bucket = db.rate_limits.find_one({'_id': 'login:ip:1'})
+        self.assertLess(bucket['tokens'], 1)
+        self.assertIn('expires_at', bucket)
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.make_app()
+
+    def make_app(self, **config):
+        self.app = Flask(__name__)
+        self.app.config['RATE_LIMITS'] = {'login': {'ip': '2/minute'}}
+        self.app.config.update(config)
+
+        @self.app.route('/login', methods=['POST'])
+        def login():
+            return jsonify({'ok': True})
+
+        @self.app.route('/open')
+        def open_route():
+            return jsonify({'ok': True})
+
+        self.limiter = RateLimiter()
+        self.limiter.init_app(self.app)
+        self.client = self.app.test_client()
+
+    def test_limited_endpoint_returns_429(self):
+        """Test that requests over the limit get a 429 with Retry-After"""
+        self.assertEqual(self.client.post('/login').status_code, 200)
+        self.assertEqual(self.client.post('/login').status_code, 200)
+        response = self.client.post('/login')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '30')
+
+        # Another client has its own bucket
+        other = self.client.post('/login', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        self.assertEqual(other.status_code, 200)
+
+    def test_unconfigured_endpoint_is_not_limited(self):
+        """Test that endpoints without rules are never throttled"""
+        for _ in range(5):
+            self.assertEqual(self.client.get('/open').status_code, 200)
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        """Test that clients can't pick their own bucket with X-Forwarded-For"""
+        for i in range(3):
+            response = self.client.post('/login', headers={'X-Forwarded-For': f'203.0.113.{i}'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_trusted_proxy_hops_give_each_client_a_bucket(self):
+        """Test that behind a trusted proxy clients are told apart by X-Forwarded-For"""
+        self.make_app(TRUSTED_PROXIES=1)
+        proxy = {'REMOTE_ADDR': '10.0.0.1'}
+        for _ in range(2):
+            response = self.client.post('/login', headers={'X-Forwarded-For': '203.0.113.1'}, environ_base=proxy)
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post('/login', headers={'X-Forwarded-For': '203.0.113.1'}, environ_base=proxy)
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post('/login', headers={'X-Forwarded-For': '203.0.113.2'}, environ_base=proxy)
+        self.assertEqual(response.status_code, 200)
+
+        # Only the last hop is trusted, so a spoofed left-most entry is ignored
+        response = self.client.post(
+            '/login', headers={'X-Forwarded-For': '198.51.100.9, 203.0.113.1'}, environ_base=proxy
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_store_failure_lets_requests_through(self):
+        """Test that an unreachable store does not turn into errors"""
+        class BrokenStore:
+            def take(self, key, capacity, rate):
+                raise ConnectionError('store down')
+
+        self.limiter.store = BrokenStore()
+        for _ in range(3):
+            self.assertEqual(self.client.post('/login').status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
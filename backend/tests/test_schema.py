@@ -0,0 +1,89 @@
+import unittest
+import mongomock
+from pymongo.errors import OperationFailure
+import fakemongo
+import schema
+from schema import apply_indexes, ensure_schema, normalize_emails, schema_version, SCHEMA_VERSION
+
+class FailingCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def create_indexes(self, indexes):
+        raise OperationFailure('E11000 duplicate key error')
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+class PartlyFailingDb:
+    """A mongomock database whose `fail` collections can't build indexes"""
+
+    def __init__(self, db, fail):
+        self.db = db
+        self.fail = fail
+
+    def __getitem__(self, name):
+        if name in self.fail:
+            return FailingCollection(self.db[name])
+        return self.db[name]
+
+    def __getattr__(self, name):
+        return self[name]
+
+class TestApplyIndexes(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().schema_test
+        self.addCleanup(schema._failed.clear)
+
+    def test_partial_failure_builds_the_rest(self):
+        """Test that one failing collection neither stops the others nor records the version"""
+        db = PartlyFailingDb(self.db, {'users'})
+        created, failures = apply_indexes(db)
+        self.assertEqual(set(failures), {'users'})
+        self.assertIn('likes', created)
+        self.assertIn('follows', created)
+        self.assertTrue(any(
+            index.get('unique') for index in self.db.likes.index_information().values()
+        ))
+        self.assertEqual(schema_version(self.db), 0)
+
+        # The next run retries and records the version once everything builds
+        self.assertTrue(ensure_schema(self.db))
+        self.assertEqual(schema_version(self.db), SCHEMA_VERSION)
+
+    def test_emails_are_lowercased_before_the_unique_index(self):
+        """Test that case-variant emails are lowercased unless that collides"""
+        self.db.users.insert_many([
+            {'email': 'Alice@Example.com'},
+            {'email': 'bob@example.com'},
+            {'email': 'BOB@example.com'}
+        ])
+        self.assertEqual(normalize_emails(self.db), ['BOB@example.com'])
+        self.assertEqual(
+            sorted(user['email'] for user in self.db.users.find()),
+            ['BOB@example.com', 'alice@example.com', 'bob@example.com']
+        )
+
+class TestRequiresIndexes(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.addCleanup(schema._failed.clear)
+
+    def test_toggle_routes_refuse_without_unique_indexes(self):
+        """Test that like and follow answer 503 while their unique indexes are missing"""
+        token, user_id = fakemongo.register(self.client, 'alice')
+        _, other_id = fakemongo.register(self.client, 'bob')
+        schema._failed.update({'likes', 'follows'})
+
+        response = self.client.post('/api/posts/000000000000000000000000/like', headers={'x-access-token': token})
+        self.assertEqual(response.status_code, 503)
+        response = self.client.post(f'/api/users/{other_id}/follow', headers={'x-access-token': token})
+        self.assertEqual(response.status_code, 503)
+
+        schema._failed.clear()
+        response = self.client.post(f'/api/users/{other_id}/follow', headers={'x-access-token': token})
+        self.assertEqual(response.status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import fakemongo
+
+class TestStreamTickets(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.token, _ = fakemongo.register(self.client, 'alice')
+
+    def open_stream(self, query='', headers=None):
+        response = self.client.get(f'/api/stream{query}', headers=headers)
+        response.close()
+        return response.status_code
+
+    def ticket(self):
+        response = self.client.post('/api/stream/ticket', headers={'x-access-token': self.token})
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['ticket']
+
+    def test_ticket_opens_one_stream(self):
+        """Test that a ticket opens the stream once and is refused after that"""
+        ticket = self.ticket()
+        self.assertEqual(self.open_stream(f'?ticket={ticket}'), 200)
+        self.assertEqual(self.open_stream(f'?ticket={ticket}'), 401)
+
+    def test_api_token_is_not_accepted_in_the_url(self):
+        """Test that ?token= no longer authenticates while the header still does"""
+        self.assertEqual(self.open_stream(f'?token={self.token}'), 401)
+        self.assertEqual(self.open_stream(headers={'x-access-token': self.token}), 200)
+
+    def test_ticket_is_not_an_api_token(self):
+        """Test that a ticket can't be used on the rest of the API"""
+        response = self.client.get('/api/posts', headers={'x-access-token': self.ticket()})
+        self.assertEqual(response.status_code, 401)
+
+if __name__ == '__main__':
+    unittest.main()
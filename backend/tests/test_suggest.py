@@ -0,0 +1,79 @@
+import threading
+import unittest
+from unittest import mock
+import fakemongo
+from suggest import PrefixIndex, SuggestIndex
+
+class TestPrefixIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex([
+            ('austin', {'name': 'Austin'}),
+            ('atlanta', {'name': 'Atlanta'}),
+            ('boston', {'name': 'Boston'}),
+            ('aus', {'name': 'Aus'})
+        ])
+
+    def test_prefix_matches_in_key_order(self):
+        """Test that every key with the prefix is returned, sorted"""
+        results = self.index.search('a')
+        self.assertEqual([r['name'] for r in results], ['Atlanta', 'Aus', 'Austin'])
+
+    def test_limit(self):
+        """Test that the result count is capped"""
+        self.assertEqual(len(self.index.search('a', limit=2)), 2)
+
+    def test_no_match(self):
+        """Test that an unmatched prefix returns nothing"""
+        self.assertEqual(self.index.search('z'), [])
+        self.assertEqual(self.index.search('austinx'), [])
+
+    def test_incremental_add(self):
+        """Test that added keys are found without a rebuild"""
+        self.index.add('bozeman', {'name': 'Bozeman'})
+        self.index.add('austin', {'name': 'Austin 2'})
+        self.assertEqual([r['name'] for r in self.index.search('bo')], ['Boston', 'Bozeman'])
+        self.assertEqual(len(self.index.search('austin')), 2)
+        self.assertEqual(len(self.index), 6)
+
+class TestSuggestIndex(unittest.TestCase):
+    def test_stale_index_is_served_while_rebuilding(self):
+        """Test that an expired index keeps answering while a thread rebuilds it"""
+        index = SuggestIndex(ttl=0)
+        index._indexes = {'city': PrefixIndex([('austin', {'name': 'Austin'})])}
+        release = threading.Event()
+        fresh = {'city': PrefixIndex([('austin', {'name': 'Austin'}), ('austell', {'name': 'Austell'})])}
+
+        def build():
+            release.wait(5)
+            index._indexes = fresh
+            return fresh
+
+        with mock.patch.object(index, 'build', side_effect=build) as built:
+            self.assertEqual(len(index.search('aus', kinds=['city'])), 1)
+            self.assertEqual(len(index.search('aus', kinds=['city'])), 1)
+            release.set()
+            for thread in threading.enumerate():
+                if thread.name == 'suggest-rebuild':
+                    thread.join(5)
+        self.assertEqual(built.call_count, 1)
+        index.ttl = 300
+        self.assertEqual(len(index.search('aus', kinds=['city'])), 2)
+
+class TestSuggestRoute(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.token, _ = fakemongo.register(self.client, 'austin')
+
+    def suggest(self, **params):
+        return self.client.get('/api/search/suggest', query_string=params, headers={'x-access-token': self.token})
+
+    def test_unknown_types_are_rejected(self):
+        """Test that a types filter naming no known kind is a 400 rather than a search of everything"""
+        self.assertEqual(self.suggest(q='aus', types='bogus').status_code, 400)
+        response = self.suggest(q='aus', types='bogus,user')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['type'] for s in response.get_json()['suggestions']], ['user'])
+
+if __name__ == '__main__':
+    unittest.main()
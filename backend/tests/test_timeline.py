@@ -0,0 +1,136 @@
+import unittest
+from unittest import mock
+from bson import ObjectId
+import fakemongo
+from extensions import mongo
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        fakemongo.reset()
+        self.client = fakemongo.app.test_client()
+        self.token, self.user_id = fakemongo.register(self.client, 'alice')
+
+    def headers(self, token=None):
+        return {'x-access-token': token or self.token}
+
+    def post(self, content, token=None, visibility='neighborhood'):
+        response = self.client.post(
+            '/api/posts', json={'content': content, 'visibility': visibility}, headers=self.headers(token)
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['postId']
+
+    def follow(self, user_id, token=None):
+        response = self.client.post(f'/api/users/{user_id}/follow', headers=self.headers(token))
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['following']
+
+    def ids(self, token=None, **params):
+        return [post['_id'] for post in self.timeline(token, **params)['posts']]
+
+    def timeline(self, token=None, **params):
+        response = self.client.get('/api/posts', query_string=params, headers=self.headers(token))
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()
+
+class TestTimelineParameters(TimelineTestCase):
+    def test_limit_is_clamped(self):
+        """Test that limit=0 or a negative limit returns one post, not the whole timeline"""
+        for i in range(3):
+            self.post(f'post {i}')
+        for limit in (0, -1):
+            self.assertEqual(len(self.timeline(limit=limit)['posts']), 1)
+            self.assertEqual(len(self.timeline(limit=limit, page=1)), 1)
+        self.assertEqual(len(self.timeline(limit=1000)['posts']), 3)
+
+    def test_bad_limit_or_page(self):
+        """Test that a non-integer limit or page, or a page below 1, is a 400"""
+        for params in ({'limit': 'ten'}, {'page': 'two'}, {'page': 0}, {'page': -3}):
+            response = self.client.get('/api/posts', query_string=params, headers=self.headers())
+            self.assertEqual(response.status_code, 400, params)
+
+class TestTimeline(TimelineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bob_token, self.bob_id = fakemongo.register(self.client, 'bob')
+
+    def test_posts_fan_out_to_followers(self):
+        """Test that a new post lands in the author's and every follower's timeline"""
+        carol_token, _ = fakemongo.register(self.client, 'carol')
+        self.follow(self.bob_id)
+        post_id = self.post('hello', self.bob_token)
+
+        self.assertEqual(self.ids(), [post_id])
+        self.assertEqual(self.ids(self.bob_token), [post_id])
+        self.assertEqual(self.ids(carol_token), [])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        """Test that following copies an author's recent posts in and unfollowing takes them out"""
+        old = [self.post(f'old {i}', self.bob_token) for i in range(3)]
+        own = self.post('mine')
+        self.assertEqual(self.ids(), [own])
+
+        self.assertTrue(self.follow(self.bob_id))
+        self.assertEqual(self.ids(), [own] + old[::-1])
+
+        self.assertFalse(self.follow(self.bob_id))
+        self.assertEqual(self.ids(), [own])
+
+    def test_fanout_on_read_authors_are_merged_once(self):
+        """Test that posts of a flagged author are merged on read, without doubling pushed ones"""
+        carol_token, _ = fakemongo.register(self.client, 'carol')
+        self.follow(self.bob_id)
+        with mock.patch.dict(fakemongo.app.config, TIMELINE_FANOUT_LIMIT=1):
+            pushed = self.post('pushed while bob had one follower', self.bob_token)
+            self.follow(self.bob_id, carol_token)
+            pulled = self.post('pulled after bob crossed the limit', self.bob_token)
+            own = self.post('mine')
+
+        with fakemongo.app.app_context():
+            self.assertTrue(mongo.db.users.find_one({'_id': ObjectId(self.bob_id)})['fanout_on_read'])
+            self.assertEqual(mongo.db.timeline.count_documents({'post_id': ObjectId(pulled)}), 1)
+
+        self.assertEqual(self.ids(), [own, pulled, pushed])
+        self.assertEqual(self.ids(carol_token), [pulled, pushed])
+
+        # Paging through the merged streams still yields each post once
+        first = self.timeline(limit=2)
+        self.assertEqual([post['_id'] for post in first['posts']], [own, pulled])
+        self.assertEqual(self.ids(limit=2, cursor=first['next_cursor']), [pushed])
+        self.assertEqual([post['_id'] for post in self.timeline(limit=2, page=2)], [pushed])
+
+    def test_cursor_and_page_paging(self):
+        """Test that cursors and ?page= walk the same posts, newest first"""
+        self.follow(self.bob_id)
+        posts = [self.post(f'post {i}', self.bob_token) for i in range(5)][::-1]
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.timeline(**params)
+            seen.extend(post['_id'] for post in page['posts'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, posts)
+
+        pages = [[post['_id'] for post in self.timeline(limit=2, page=n)] for n in (1, 2, 3, 4)]
+        self.assertEqual(pages, [posts[0:2], posts[2:4], posts[4:5], []])
+
+        response = self.client.get('/api/posts', query_string={'cursor': 'garbage'}, headers=self.headers())
+        self.assertEqual(response.status_code, 400)
+
+    def test_visibility_filter(self):
+        """Test that ?visibility= keeps only city or neighborhood posts and ignores other values"""
+        self.follow(self.bob_id)
+        city = self.post('to the city', self.bob_token, visibility='city')
+        neighborhood = self.post('to the neighbors', self.bob_token)
+
+        self.assertEqual(self.ids(visibility='city'), [city])
+        self.assertEqual(self.ids(visibility='neighborhood'), [neighborhood])
+        self.assertEqual(self.ids(visibility='everyone'), [neighborhood, city])
+
+if __name__ == '__main__':
+    unittest.main()